@@ -1,27 +1,65 @@
-from flask import Flask, g, request, session
+from flask import Flask, g, request, session, current_app
 from flask_bootstrap import Bootstrap
-from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, current_user
 from flask_moment import Moment
 from flask_pagedown import PageDown
 from flask_selfdoc import Autodoc
 from flask_babel import Babel
 from config import config
+from .drift import DriftDetector
+from .metrics import Metrics
+from .slowlog import SlowQueryLog
+from .ingest import IngestQueue
+from .admission import AdmissionControl
+from .productcache import ProductCache
+from .changefeed import ChangeFeed
+from .wip import WipTracker
+from .archive import Archive
+from .snapshot import SnapshotStore
+from .replica import RoutingSQLAlchemy, ReadReplica
+from .engineprofile import EngineProfiles
 
 __version__ = config['default'].VERSION
 
 cfg = config
 bootstrap = Bootstrap()
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
+engine_profiles = EngineProfiles()
 moment = Moment()
 pagedown = PageDown()
 auto = Autodoc()
 babel = Babel()
+drift = DriftDetector()
+metrics = Metrics()
+slowlog = SlowQueryLog()
+ingest = IngestQueue()
+admission = AdmissionControl()
+product_cache = ProductCache()
+change_feed = ChangeFeed()
+wip_tracker = WipTracker()
+archive = Archive()
+snapshots = SnapshotStore()
+replica = ReadReplica()
 
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
 
 
+@babel.localeselector
+def get_locale():
+    # if a user is logged in, use the locale from the user settings
+    if current_user.is_authenticated:
+        return current_user.locale
+
+    # otherwise try to guess locale from browser settings.
+    # langs handling
+    langs = zip(*current_app.config['LANGUAGES'])[0]
+    browser = request.accept_languages.best_match(langs)
+    lang = session.get('lang', browser)
+    setattr(g, 'lang', lang)
+    return lang
+
+
 def create_app(config_name):
     app = Flask(__name__)
     app.config.from_object(cfg[config_name])
@@ -37,31 +75,28 @@ def create_app(config_name):
 
     bootstrap.init_app(app)
     db.init_app(app)
+    engine_profiles.init_app(app)
     moment.init_app(app)
     pagedown.init_app(app)
     login_manager.init_app(app)
     auto.init_app(app)
     babel.init_app(app)
+    drift.init_app(app)
+    metrics.init_app(app)
+    slowlog.init_app(app)
+    ingest.init_app(app)
+    admission.init_app(app)
+    product_cache.init_app(app)
+    change_feed.init_app(app)
+    wip_tracker.init_app(app)
+    archive.init_app(app)
+    snapshots.init_app(app)
+    replica.init_app(app)
 
     # set model version
     from app.models import __version__ as dbmodel_version
     app.config.DBMODEL_VERSION = dbmodel_version
 
-    # langs handling
-    langs = zip(*app.config['LANGUAGES'])[0]
-
-    @babel.localeselector
-    def get_locale():
-        # if a user is logged in, use the locale from the user settings
-        if current_user.is_authenticated:
-            return current_user.locale
-
-        # otherwise try to guess locale from browser settings.
-        browser = request.accept_languages.best_match(langs)
-        lang = session.get('lang', browser)
-        setattr(g, 'lang', lang)
-        return lang
-    
     from .products import products as products_blueprint
     app.register_blueprint(products_blueprint, url_prefix='/app')
     app.register_blueprint(products_blueprint, url_prefix='/')
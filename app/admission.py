@@ -0,0 +1,142 @@
+import time
+import logging
+import threading
+from flask import request, g, jsonify
+
+logger = logging.getLogger(__name__)
+
+INGEST = 'ingest'
+INTERLOCK = 'interlock'
+UI = 'ui'
+EXPORT = 'export'
+
+
+class Gate(object):
+    """
+    Counting semaphore with acquire timeout and number of waiting requests (python 2 Semaphore has neither).
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.waiting = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, timeout=0):
+        deadline = time.time() + timeout
+        with self.condition:
+            if self.active < self.limit:
+                self.active += 1
+                return True
+            self.waiting += 1
+            try:
+                while self.active >= self.limit:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                    self.condition.wait(remaining)
+                self.active += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+
+
+class AdmissionControl(object):
+    """
+    Concurrency limits per endpoint class (ADMISSION_CONTROL).
+
+    Every request is classified by endpoint (ADMISSION_ENDPOINTS, pages of other blueprints are 'ui', remaining
+    api endpoints are not limited) and has to get one of ADMISSION_LIMITS[class] slots within
+    ADMISSION_TIMEOUTS[class] seconds. Otherwise it is answered with ADMISSION_REJECT_STATUS[class] (503 by default)
+    and Retry-After header, so workers do not pile up on stalled database.
+    Classes are ordered by ADMISSION_PRIORITY - request is rejected right away while any class with higher priority
+    has requests waiting for a slot, eg. exports give way to interlock reads of stations.
+    Limits are per process.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.gates = {}
+        self.endpoints = {}
+        self.timeouts = {}
+        self.reject_status = {}
+        self.priority = []
+        self.retry_after = 1
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('ADMISSION_CONTROL', self.enabled)
+        if not self.enabled:
+            return
+        self.gates = dict((name, Gate(limit)) for name, limit in app.config['ADMISSION_LIMITS'].items())
+        self.endpoints = dict(app.config.get('ADMISSION_ENDPOINTS', {}))
+        self.timeouts = dict(app.config.get('ADMISSION_TIMEOUTS', {}))
+        self.reject_status = dict(app.config.get('ADMISSION_REJECT_STATUS', {}))
+        self.priority = list(app.config.get('ADMISSION_PRIORITY', [INTERLOCK, INGEST, UI, EXPORT]))
+        self.retry_after = app.config.get('ADMISSION_RETRY_AFTER', self.retry_after)
+
+        from . import metrics
+        metrics.describe('admission_active', 'gauge', 'Number of requests being processed per endpoint class.')
+        metrics.describe('admission_waiting', 'gauge', 'Number of requests waiting for a slot per endpoint class.')
+        metrics.describe('admission_rejected_total', 'counter', 'Number of requests rejected by admission control per endpoint class.')
+        metrics.register_collector(self.collect)
+
+        app.before_request(self.before_request)
+        app.teardown_request(self.teardown_request)
+
+    def collect(self):
+        samples = []
+        for name, gate in sorted(self.gates.items()):
+            samples.append(('admission_active', {'class': name}, gate.active))
+            samples.append(('admission_waiting', {'class': name}, gate.waiting))
+        return samples
+
+    def classify(self, endpoint):
+        if endpoint is None:
+            return None
+        name = self.endpoints.get(endpoint)
+        if name is not None:
+            return name
+        blueprint = endpoint.split('.', 1)[0] if '.' in endpoint else None
+        if blueprint is None or blueprint in ('api', 'webapi'):
+            return None  # static files, metrics, remaining api endpoints
+        return UI
+
+    def higher_priority_waiting(self, name):
+        if name not in self.priority:
+            return False
+        for higher in self.priority[:self.priority.index(name)]:
+            gate = self.gates.get(higher)
+            if gate is not None and gate.waiting > 0:
+                return True
+        return False
+
+    def before_request(self):
+        if not self.enabled:
+            return
+        name = self.classify(request.endpoint)
+        gate = self.gates.get(name)
+        if gate is None:
+            return
+        if not self.higher_priority_waiting(name) and gate.acquire(self.timeouts.get(name, 0)):
+            g.admission_gate = gate
+            return
+        from . import metrics
+        metrics.inc('admission_rejected_total', **{'class': name})
+        logger.warning("admission control rejected {endpoint} ({name}: {active} active, {waiting} waiting)".format(
+            endpoint=request.endpoint, name=name, active=gate.active, waiting=gate.waiting))
+        response = jsonify({'error': 'Server busy', 'class': name})
+        response.status_code = self.reject_status.get(name, 503)
+        response.headers['Retry-After'] = str(self.retry_after)
+        return response
+
+    def teardown_request(self, exception=None):
+        gate = g.pop('admission_gate', None)
+        if gate is not None:
+            gate.release()
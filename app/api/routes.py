@@ -1,18 +1,28 @@
-from flask import Flask, jsonify, abort, request, make_response, url_for, render_template
+from flask import Flask, jsonify, abort, request, make_response, url_for, render_template, Response, stream_with_context
 import json
 from flask import render_template, flash, redirect, url_for, abort, request, current_app
 from flask_login import login_required, current_user
-from .. import db, auto, cfg
+from .. import db, auto, cfg, drift, metrics, ingest, product_cache, change_feed, wip_tracker, archive
+from ..ingest import IngestQueueFull, ACK_ENQUEUE
+from .. import outbox
+from ..changefeed import parse_event_id
+from ..keyset import KeysetPagination
+from ..bulkdelete import delete_products
+from ..operations.search import OperationSearch
+from ..validation import ValidationError, status_values, operation_values
 from ..models import *
 from . import api as rest
 from flask_selfdoc import Autodoc
 import logging
 import six
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# product type of the last product started at station 11 - plan checked by tests/test_query_plans.py
+CURRENT_REFERENCE_QUERY = "select type from Product where id = (select product_id from Status where station_id=11 order by id DESC limit 1);"
+
 
 @rest.errorhandler(400)
 def bad_request(error):
@@ -24,6 +34,33 @@ def not_found(error):
     return make_response(jsonify({'error': 'Not found'}), 404)
 
 
+def write_behind(record):
+    """
+    Store already validated record through write-behind queue (INGEST_QUEUE).
+    Returns 202 when INGEST_ACK is 'enqueue', 201 once the record is committed otherwise.
+    Commit not finished in INGEST_COMMIT_TIMEOUT gives 202 as well - the record is queued and will be committed,
+    so the client must not send it again. Full queue gives 503 with Retry-After.
+    """
+    try:
+        future = ingest.submit(record)
+    except IngestQueueFull, e:
+        logger.warning("{error} - rejecting {record}".format(error=e, record=repr(record)))
+        return jsonify({'error': 'Ingest queue full'}), 503, {'Retry-After': '1'}
+    if ingest.ack == ACK_ENQUEUE:
+        return jsonify(record.serialize), 202
+    try:
+        stored = future.result(ingest.commit_timeout)
+    except SQLAlchemyError, e:
+        error = "%s : %s " % (repr(e), e)
+        logger.error(error)
+        return error, 400
+    if stored is None:
+        logger.warning("commit of {record} not finished in {timeout}s - acknowledged as queued".format(record=repr(record), timeout=ingest.commit_timeout))
+        return jsonify(record.serialize), 202
+    logger.info("new record added to database %s" % repr(stored))
+    return jsonify(stored.serialize), 201
+
+
 @rest.route("/product", methods=['GET'])
 @auto.doc()
 def get_products():
@@ -51,9 +88,12 @@ def get_product(id):
     Gets the specific product identified by id (serial number) from database.
     In order to get product with id 1234 please run HTTP GET on: http://localhost:5000/api/product/1234
     """
-    product = Product.query.filter_by(id=str(id)).first_or_404()
+    product = Product.query.filter_by(id=str(id)).first()
     if product is None:
-        abort(404)
+        product, session = archive.find(id)
+        if product is None:
+            abort(404)
+        session.close()
     return jsonify(product.serialize)
 
 
@@ -104,6 +144,7 @@ def add_product():
     )
     db.session.add(new_prod)
     db.session.commit()
+    metrics.inc('ingest_rows_total', kind='product')
     logger.info("new product added to database %s" % repr(new_prod))
     return jsonify(new_prod.serialize), 201
 
@@ -116,11 +157,8 @@ def delete_product(id):
     Deletes product from database.
     To delete product with id 2666 please send http DELETE to: http://localhost:5000/api/product/2666
     """
-    product = Product.query.filter_by(id=str(id)).first()
-    if product is None:
+    if not delete_products([str(id)])['product']:
         abort(404)
-    db.session.delete(product)
-    db.session.commit()
     return jsonify({'result': True})
 
 
@@ -339,44 +377,27 @@ def add_status():
         logger.error("Incorrect data in request %s" % repr(request.json))
         abort(400)
 
-    for key in ['status', 'station_id']:
-        if key not in request.json:
-            logger.error("required key: %s missing in request %s" % (key, repr(request.json)))
-            abort(400)
-
-    for key in ['status', 'station_id']:  # check if keys are type of Int
-        if not isinstance(request.json[key], six.integer_types):
-            logger.error("key: %s is not type of Int in request %s" % (key, repr(request.json)))
-            abort(400)
-
-    if "product_id" in request.json:
-        if isinstance(request.json["product_id"], six.string_types):
-            product_id = request.json["product_id"]
-        else:
-            logger.error("key: %s is not type of String in request %s" % ("product_id", repr(request.json)))
-            abort(400)
+    try:
+        values = status_values(request.json)
+    except ValidationError, e:
+        logger.error("%s in request %s" % (e, repr(request.json)))
+        abort(400)
 
-    p = Product.query.filter_by(id=str(product_id)).first()
-    if p is None:
+    product_id = values['product_id']
+    if not product_cache.exists(product_id):
         logger.warning("product with id: {product_id} is not present in product database".format(product_id=product_id))
 
-    date_time = get_current_datetime()
-    if "date_time" in request.json:
-        if isinstance(request.json["date_time"], six.text_type):
-            date_time = request.json['date_time']
-
-    fail_step = ""
-    if "fail_step" in request.json:
-        if isinstance(request.json["fail_step"], six.text_type):
-            fail_step = request.json["fail_step"]
-
     new_status = Status(
-        status=request.json['status'],
+        status=values['status'],
         product=product_id,
-        station=request.json['station_id'],
-        date_time=date_time,
-        fail_step=fail_step
+        station=values['station_id'],
+        date_time=values['date_time'] or get_current_datetime(),
+        fail_step=values['fail_step'],
+        fail_step_id=Fail_Step.intern(values['fail_step'])
     )
+    if ingest.enabled:
+        return write_behind(new_status)
+
     db.session.add(new_status)
     try:
         db.session.commit()
@@ -385,10 +406,150 @@ def add_status():
         logger.error(error)
         return error, 400
 
+    metrics.inc('ingest_rows_total', kind='status')
+    change_feed.notify()
     logger.info("new status added to database %s" % repr(new_status))
     return jsonify(new_status.serialize), 201
 
 
+@rest.route("/operation", methods=['GET'])
+@auto.doc()
+def get_operations():
+    """
+    Search operations - newest first, at most limit (default OPERATIONS_PER_PAGE) operations per request.
+    Optional filters: station_id, operation_type_id, operation_status_id, out_of_tolerance=1 (any result outside
+    its min - max range), date_from, date_to (date without time means whole day).
+    Pass next_before of previous response as before parameter to get older operations, has_more tells if there are more.
+    URL: http://localhost:5000/api/operation?station_id=21&operation_type_id=3&out_of_tolerance=1&date_from=2018-01-01
+    """
+    try:
+        search = OperationSearch(request.args)
+    except (ValueError, OverflowError):
+        abort(400)
+    limit = min(request.args.get('limit', current_app.config['OPERATIONS_PER_PAGE'], type=int), current_app.config['OPERATION_SEARCH_MAX_LIMIT'])
+    if limit <= 0:
+        abort(400)
+    pagination = KeysetPagination(search.apply(Operation.query), Operation.id, limit, request.args.get('before', type=int))
+    return jsonify(json_list=[o.serialize for o in pagination.items], next_before=pagination.last_id, has_more=pagination.has_older)
+
+
+@rest.route("/operation", methods=['POST'])
+@auto.doc()
+def add_operation():
+    """
+    Writes operation information for given product_id and station_id.
+    The date_time field is optional. Tool will take current datetime if not specified.
+    Results are optional - each of result_1, result_2, result_3 may be send together with its _max, _min and _status_id.
+    In order to write operation please run HTTP POST on: http://localhost:5000/api/operation
+    Content Type: application/json
+    Content:
+    {
+        "product_id": "16666",
+        "station_id": 10,
+        "operation_status_id": 1,
+        "operation_type_id": 301,
+        "date_time": "2015-02-11 22:49:37.496000",
+        "result_1": 12.5,
+        "result_1_max": 14.0,
+        "result_1_min": 11.0,
+        "result_1_status_id": 1
+    }
+
+    """
+    if not request.json:
+        logger.error("Incorrect data in request %s" % repr(request.json))
+        abort(400)
+
+    try:
+        values = operation_values(request.json)
+    except ValidationError, e:
+        logger.error("%s in request %s" % (e, repr(request.json)))
+        abort(400)
+
+    if not product_cache.exists(values['product_id']):
+        logger.warning("product with id: {product_id} is not present in product database".format(product_id=values['product_id']))
+
+    new_operation = Operation(
+        values['product_id'],
+        values['station_id'],
+        values['operation_status_id'],
+        values['operation_type_id'],
+        values['date_time'] or get_current_datetime(),
+        values['result_1'], values['result_1_max'], values['result_1_min'], values['result_1_status_id'],
+        values['result_2'], values['result_2_max'], values['result_2_min'], values['result_2_status_id'],
+        values['result_3'], values['result_3_max'], values['result_3_min'], values['result_3_status_id'],
+    )
+    if ingest.enabled:
+        rv = write_behind(new_operation)
+        if rv[1] in (201, 202):
+            drift.observe_operation(new_operation)
+        return rv
+
+    db.session.add(new_operation)
+    try:
+        db.session.commit()
+    except IntegrityError, e:
+        error = "%s : %s " % (repr(e), e)
+        logger.error(error)
+        return error, 400
+
+    drift.observe_operation(new_operation)
+    metrics.inc('ingest_rows_total', kind='operation')
+    change_feed.notify()
+    logger.info("new operation added to database %s" % repr(new_operation))
+    return jsonify(new_operation.serialize), 201
+
+
+@rest.route("/drift", methods=['GET'])
+@auto.doc()
+def get_drift_alerts():
+    """
+    Get list of active drift alerts in JSON format.
+    Alert is raised when results of given station, operation type and result slot drift towards result_N_max/result_N_min.
+    Optional station_id parameter limits alerts to single station.
+    URL: http://localhost:5000/api/drift?station_id=21
+    """
+    station_id = request.args.get('station_id', type=int)
+    return jsonify(json_list=[a.serialize for a in drift.active_alerts(station_id)])
+
+
+@rest.route("/drift/series", methods=['GET'])
+@auto.doc()
+def get_drift_series():
+    """
+    Get rolling window statistics of all tracked measurement series in JSON format.
+    Optional station_id parameter limits series to single station.
+    URL: http://localhost:5000/api/drift/series?station_id=21
+    """
+    station_id = request.args.get('station_id', type=int)
+    return jsonify(json_list=[s.serialize for s in drift.get_series(station_id)])
+
+@rest.route("/drift/rebaseline", methods=['POST'])
+@auto.doc()
+def rebaseline_drift():
+    """
+    Restart CUSUM baseline of measurement series - next results form the new baseline.
+    Use after tool change, recalibration or any other intended change of process.
+    Optional station_id, operation_type_id and result_slot limit series, without them all series are re-baselined.
+    URL: http://localhost:5000/api/drift/rebaseline
+    Content Type: application/json
+    Content:
+    {
+        "station_id": 21,
+        "operation_type_id": 301
+    }
+    """
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        abort(400)
+    filters = [data.get(name) for name in ('station_id', 'operation_type_id', 'result_slot')]
+    if any(value is not None and (not isinstance(value, int) or isinstance(value, bool)) for value in filters):
+        logger.error("Incorrect data in request %s" % repr(data))
+        abort(400)
+    return jsonify({'rebaselined': drift.rebaseline(*filters)})
+
+
+
 @rest.route("/datetime", methods=['GET'])
 @auto.doc()
 def get_current_datetime():
@@ -408,8 +569,7 @@ def get_current_reference():
     URL: http://localhost:5000/api/current_reference
     """
 
-    sql_query = "select type from Product where id = (select product_id from Status where station_id=11 order by id DESC limit 1);"
-    results = db.engine.execute(sql_query)
+    results = db.engine.execute(CURRENT_REFERENCE_QUERY)
     # return first element
     for row in results:
         return str(row[0])
@@ -471,6 +631,145 @@ def get_serverstatus2():
 
     return jsonify(serverstatus)	
 
+@rest.route("/outbox/<kind>", methods=['GET'])
+@auto.doc()
+def get_outbox(kind):
+    """
+    Get batch of records (product, status or operation) not yet synchronized with Proda (prodasync 0) ordered by id.
+    Pass next_cursor of previous batch as after parameter to get next batch, has_more tells if there are more records.
+    Optional parameters:
+    - limit - batch size (default OUTBOX_BATCH_SIZE, at most OUTBOX_MAX_BATCH_SIZE),
+    - lease=1 - mark returned records as WAITING (9),
+    - include_waiting=1 - return also records already leased (eg. after agent restart).
+    URL: http://localhost:5000/api/outbox/status?after=123456&limit=1000&lease=1
+    """
+    model = outbox.MODELS.get(kind)
+    if model is None:
+        abort(404)
+    try:
+        after = outbox.parse_cursor(model, request.args.get('after'))
+    except ValueError:
+        abort(400)
+    limit = min(request.args.get('limit', current_app.config['OUTBOX_BATCH_SIZE'], type=int), current_app.config['OUTBOX_MAX_BATCH_SIZE'])
+    if limit <= 0:
+        abort(400)
+    records, next_cursor = outbox.pull(model, after, limit, request.args.get('lease', 0, type=int) == 1, request.args.get('include_waiting', 0, type=int) == 1)
+    return jsonify(json_list=[r.serialize for r in records], next_cursor=next_cursor, has_more=len(records) == limit)
+
+
+@rest.route("/outbox/<kind>/ack", methods=['POST'])
+@auto.doc()
+def ack_outbox(kind):
+    """
+    Mark records as synchronized with Proda in bulk.
+    prodasync is optional: 1 - OK (default), 2 - NOK.
+    In order to acknowledge statuses please run HTTP POST on: http://localhost:5000/api/outbox/status/ack
+    Content Type: application/json
+    Content:
+    {
+        "ids": [123457, 123458, 123459],
+        "prodasync": 1
+    }
+    """
+    model = outbox.MODELS.get(kind)
+    if model is None:
+        abort(404)
+    if not request.json or not isinstance(request.json.get('ids'), list):
+        logger.error("Incorrect data in request %s" % repr(request.json))
+        abort(400)
+    state = request.json.get('prodasync', outbox.SYNCED)
+    if state not in (outbox.SYNCED, outbox.FAILED):
+        logger.error("prodasync: %s is not allowed in request %s" % (state, repr(request.json)))
+        abort(400)
+    try:
+        ids = [outbox.parse_cursor(model, i) for i in request.json['ids']]
+    except (ValueError, TypeError):
+        abort(400)
+    updated = outbox.ack(model, ids, state)
+    logger.info("{count} {kind} records acknowledged with prodasync {state}".format(count=updated, kind=kind, state=state))
+    return jsonify({'updated': updated})
+
+
+@rest.route("/outbox/<kind>/release", methods=['POST'])
+@auto.doc()
+def release_outbox(kind):
+    """
+    Return leased (WAITING) records back to not synchronized state.
+    Without ids all leased records of given kind are released.
+    URL: http://localhost:5000/api/outbox/status/release
+    Content Type: application/json
+    Content:
+    {
+        "ids": [123457, 123458]
+    }
+    """
+    model = outbox.MODELS.get(kind)
+    if model is None:
+        abort(404)
+    ids = (request.get_json(silent=True) or {}).get('ids')
+    if ids is not None:
+        if not isinstance(ids, list):
+            abort(400)
+        try:
+            ids = [outbox.parse_cursor(model, i) for i in ids]
+        except (ValueError, TypeError):
+            abort(400)
+    return jsonify({'updated': outbox.release(model, ids)})
+
+
+@rest.route("/wip", methods=['GET'])
+@auto.doc()
+def get_wip():
+    """
+    Get products in work in progress - started at station 11 and without electronic stamp (station 55) yet.
+    Products are ordered from oldest started, wip_seconds is time since first station 11 status.
+    Optional parameters: limit, offset.
+    URL: http://localhost:5000/api/wip?limit=100
+    """
+    limit = request.args.get('limit', type=int)
+    offset = request.args.get('offset', 0, type=int)
+    if (limit is not None and limit <= 0) or offset < 0:
+        abort(400)
+    total, items = wip_tracker.listing(limit, offset)
+    return jsonify(json_list=[w.serialize for w in items], total=total)
+
+
+@rest.route("/changes", methods=['GET'])
+@auto.doc()
+def get_changes():
+    """
+    Stream newly inserted statuses and operations as Server-Sent Events (text/event-stream).
+    Events are named status and operation, data contains the same JSON as /api/status/<id> and operation.
+    Optional parameters:
+    - station_id, product_id - only rows of given station / product,
+    - types - comma separated list of event types (default status,operation),
+    - last_event_id - resume after given event id (same as Last-Event-ID header sent by EventSource on reconnect).
+    Without last event id stream starts with rows inserted after the connection.
+    URL: http://localhost:5000/api/changes?station_id=21
+    """
+    if not change_feed.enabled:
+        abort(404)
+    station_id = request.args.get('station_id', type=int)
+    product_id = request.args.get('product_id')
+    types = tuple(t for t in request.args.get('types', 'status,operation').split(',') if t in ('status', 'operation'))
+    if not types:
+        abort(400)
+    mark = parse_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    stream = change_feed.stream(mark, station_id, product_id, types)
+    return Response(stream_with_context(stream), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@rest.route("/metrics", methods=['GET'])
+@auto.doc()
+def get_metrics():
+    """
+    Get application metrics in Prometheus text format.
+    Contains per endpoint latency histograms, SQL query count and time per request and ingest counters.
+    URL: http://localhost:5000/api/metrics
+    """
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
 @rest.route('/')
 def index(name=None):
     """
@@ -1,26 +1,75 @@
-from flask import jsonify, g, flash
+import six
+from flask import jsonify, g, flash, request
 from flask_babel import gettext
 from .. import db
-from ..models import Product, Status, Operation, Comment
+from ..models import Product
+from ..bulkdelete import delete_products, delete_products_by, FILTER_KEYS
 
 from . import webapi
 from .errors import forbidden, bad_request
 
+
+def filter_criteria(criteria):
+    """
+    Return product filter without empty values or None when value has wrong type:
+    type - text or integer, variant_id - integer or text of digits, date_from and date_to - text.
+    """
+    if not isinstance(criteria, dict):
+        return None
+    values = dict((key, criteria[key]) for key in FILTER_KEYS if criteria.get(key) not in (None, ''))
+    if 'type' in values and (isinstance(values['type'], bool) or not isinstance(values['type'], six.string_types + six.integer_types)):
+        return None
+    variant_id = values.get('variant_id')
+    if variant_id is not None:
+        if isinstance(variant_id, six.string_types) and variant_id.strip().isdigit():
+            values['variant_id'] = int(variant_id)
+        elif isinstance(variant_id, bool) or not isinstance(variant_id, six.integer_types):
+            return None
+    for key in ('date_from', 'date_to'):
+        if key in values and not isinstance(values[key], six.string_types):
+            return None
+    return values
+
+
 @webapi.route('/products/<id>', methods=['DELETE'])
 def delete_product(id):
     product = Product.query.get_or_404(id)
     if not g.current_user.is_admin:
         return forbidden(gettext('You cannot modify this product.'))
-    comments = Comment.query.filter_by(product_id=product.id)
-    statuses = Status.query.filter_by(product_id=product.id)
-    operations = Operation.query.filter_by(product_id=product.id)
+    product_id = product.id
+    counts = delete_products([product_id])
+    flash(gettext(u'Product: {product} removed with {comments_count} comments, {status_count} statuses and {operations_count} operations.'.format(product=product_id, operations_count=counts['operation'], status_count=counts['status'], comments_count=counts['comments'])))
+    return jsonify({'status': 'ok'})
 
-    flash(gettext(u'Product: {product} removed with {comments_count} comments, {status_count} statuses and {operations_count} operations.'.format(product=product.id, operations_count=operations.count(), status_count=statuses.count(), comments_count=comments.count())))
-    for to_remove in comments, statuses, operations:
-        for item in to_remove:
-            db.session.delete(item)
-            # flash(gettext(u'Removing: {item}'.format(item=item)))
 
-    db.session.delete(product)
-    db.session.commit()
-    return jsonify({'status': 'ok'})
+@webapi.route('/products', methods=['DELETE'])
+def delete_products_bulk():
+    """
+    Delete products given by list of ids or by filter with all their statuses, operations and comments:
+    {"ids": ["...", "..."]} or {"filter": {"type": "...", "variant_id": 1, "date_from": "2018-01-01", "date_to": "2018-01-31"}}
+    Responds with numbers of deleted rows per table.
+    """
+    if not g.current_user.is_admin:
+        return forbidden(gettext('You cannot modify products.'))
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return bad_request('List of ids or non empty filter is required.')
+    ids = data.get('ids')
+    criteria = data.get('filter')
+    if ids is not None:
+        if not isinstance(ids, list):
+            return bad_request('ids has to be a list of product ids.')
+        counts = delete_products([str(i) for i in ids])
+    elif criteria is not None:
+        criteria = filter_criteria(criteria)
+        if criteria is None:
+            return bad_request('Invalid filter.')
+        if not criteria:
+            return bad_request('List of ids or non empty filter is required.')
+        try:
+            counts = delete_products_by(criteria)
+        except (ValueError, OverflowError):
+            return bad_request('Invalid filter.')
+    else:
+        return bad_request('List of ids or non empty filter is required.')
+    return jsonify({'status': 'ok', 'deleted': counts})
@@ -0,0 +1,41 @@
+from flask import jsonify, g, request, send_file
+from .. import snapshots
+
+from . import webapi
+from .errors import forbidden, bad_request, not_found
+from flask_babel import gettext
+
+
+@webapi.route('/snapshots', methods=['GET'])
+def get_snapshots():
+    """
+    List names of database snapshots - oldest first.
+    """
+    if not g.current_user.is_admin:
+        return forbidden(gettext('You cannot access database snapshots.'))
+    return jsonify({'snapshots': snapshots.names()})
+
+
+@webapi.route('/snapshots', methods=['POST'])
+def create_snapshot():
+    """
+    Take consistent snapshot of the database to gzipped SQLite file: {"incremental": true} appends new rows
+    to copy of the newest snapshot. Responds with name, size and numbers of copied rows per table.
+    """
+    if not g.current_user.is_admin:
+        return forbidden(gettext('You cannot access database snapshots.'))
+    incremental = request.json.get('incremental', False)
+    if not isinstance(incremental, bool):
+        return bad_request('incremental has to be true or false.')
+    return jsonify(snapshots.take(incremental=incremental)), 201
+
+
+@webapi.route('/snapshots/<name>', methods=['GET'])
+def download_snapshot(name):
+    if not g.current_user.is_admin:
+        return forbidden(gettext('You cannot access database snapshots.'))
+    try:
+        path = snapshots.path(name)
+    except ValueError:
+        return not_found('snapshot not found')
+    return send_file(path, mimetype='application/gzip', as_attachment=True, attachment_filename=name)
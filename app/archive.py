@@ -0,0 +1,200 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+logger = logging.getLogger(__name__)
+
+# users are copied without credentials - archive is read only
+USER_COLUMNS = ('id', 'login', 'name', 'is_admin', 'is_operator', 'location', 'locale', 'member_since', 'avatar_hash')
+
+
+class Archive(object):
+    """
+    Retention of production history (ARCHIVE).
+
+    run() moves products older than ARCHIVE_AFTER_DAYS with their statuses, operations and comments into archive
+    database ARCHIVE_DATABASE_URI. When the URI contains {month} placeholder there is one archive database per month
+    of Product.date_added (eg. one SQLite file per month). Archive databases have the same schema as the main one and
+    a copy of reference tables, so archived product is read with the same models in a session bound to the archive.
+    Products are moved in batches of ARCHIVE_BATCH_SIZE: rows are copied and committed in archive first, then
+    archived_product index is written and copied rows (ids up to the highest copied one) are deleted from hot tables.
+    Product which got new history meanwhile stays in hot tables and is moved by next run. Interrupted run can be
+    simply repeated.
+
+    find() looks product up in the archive - product pages and API fall back to it transparently.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.uri = None
+        self.after_days = 365
+        self.batch_size = 100
+        self.lock = threading.Lock()
+        self.engines = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('ARCHIVE', self.enabled)
+        self.uri = app.config.get('ARCHIVE_DATABASE_URI', self.uri)
+        self.after_days = app.config.get('ARCHIVE_AFTER_DAYS', self.after_days)
+        self.batch_size = app.config.get('ARCHIVE_BATCH_SIZE', self.batch_size)
+        self.dispose()
+
+    def dispose(self):
+        with self.lock:
+            for engine in self.engines.values():
+                engine.dispose()
+            self.engines = {}
+
+    @property
+    def per_month(self):
+        return self.uri is not None and '{month}' in self.uri
+
+    def archive_name(self, date_added):
+        if not self.per_month:
+            return ''
+        return (date_added or datetime.now()).strftime('%Y-%m')
+
+    def engine(self, name):
+        """
+        Return engine of archive with given name, archive schema is created on first use.
+        """
+        from . import db
+        with self.lock:
+            engine = self.engines.get(name)
+            if engine is not None:
+                return engine
+            uri = self.uri.format(month=name)
+            if uri.startswith('sqlite:///'):
+                directory = os.path.dirname(uri[len('sqlite:///'):])
+                if directory and not os.path.isdir(directory):
+                    os.makedirs(directory)
+            engine = create_engine(uri)
+            db.metadata.create_all(engine, tables=self.tables())
+            self.engines[name] = engine
+            return engine
+
+    @staticmethod
+    def history_tables():
+        from .models import Product, Status, Operation, Comment
+        return [Product.__table__, Status.__table__, Operation.__table__, Comment.__table__]
+
+    @staticmethod
+    def reference_tables():
+        from .models import User, Station, Operation_Status, Operation_Type, Unit, Variant, Fail_Step
+        return [User.__table__, Station.__table__, Operation_Status.__table__, Operation_Type.__table__, Unit.__table__, Variant.__table__, Fail_Step.__table__]
+
+    def tables(self):
+        return self.reference_tables() + self.history_tables()
+
+    def session(self, name):
+        return sessionmaker(bind=self.engine(name))()
+
+    # lookup
+
+    def find(self, product_id):
+        """
+        Return (product, session) of archived product or (None, None). Relationships of product (statuses, operations,
+        comments) are loaded from the archive by returned session - caller has to close it.
+        """
+        from .models import Product, Archived_Product
+        if not self.enabled or self.uri is None:
+            return None, None
+        entry = Archived_Product.query.get(str(product_id))
+        if entry is None:
+            return None, None
+        session = self.session(entry.archive)
+        product = session.query(Product).get(str(product_id))
+        if product is None:
+            session.close()
+            return None, None
+        return product, session
+
+    # moving
+
+    def candidates(self, before, limit):
+        from . import db
+        from .models import Product
+        return db.session.query(Product.id, Product.date_added).filter(Product.date_added < before).order_by(Product.date_added.asc(), Product.id.asc()).limit(limit).all()
+
+    def sync_references(self, engine):
+        """
+        Replace reference tables of archive by current content of main database.
+        """
+        from . import db
+        with engine.begin() as target:
+            for table in self.reference_tables():
+                columns = [c for c in table.c if table.name != 'users' or c.name in USER_COLUMNS]
+                rows = [dict(row) for row in db.session.execute(db.select(columns))]
+                target.execute(table.delete())
+                if rows:
+                    target.execute(table.insert(), rows)
+
+    def copy(self, engine, product_ids):
+        """
+        Copy products with their history to archive in one archive transaction. Copied rows replace rows with the same
+        ids left by interrupted run, rows archived by earlier runs are kept. Returns (counts, bounds) - dictionaries
+        table name -> number of copied rows and table name -> highest copied id (None when no row was copied).
+        """
+        from . import db
+        from .outbox import chunks
+        counts = {}
+        bounds = {}
+        with engine.begin() as target:
+            for table in self.history_tables():
+                key = table.c.id if table.name == 'product' else table.c.product_id
+                rows = [dict(row) for row in db.session.execute(table.select().where(key.in_(product_ids)))]
+                for chunk in chunks([row['id'] for row in rows], 900):
+                    target.execute(table.delete().where(table.c.id.in_(chunk)))
+                if rows:
+                    target.execute(table.insert(), rows)
+                counts[table.name] = len(rows)
+                if table.name != 'product':
+                    bounds[table.name] = max(row['id'] for row in rows) if rows else None
+        return counts, bounds
+
+    def run(self, after_days=None, limit=None, progress=None):
+        """
+        Move products older than after_days (default ARCHIVE_AFTER_DAYS) to archive, at most limit products.
+        Returns dictionary table name -> number of moved rows.
+        """
+        from . import db
+        from .models import Archived_Product
+        from .bulkdelete import delete_products
+        if self.uri is None:
+            raise ValueError('ARCHIVE_DATABASE_URI is not configured')
+        before = datetime.now() - timedelta(days=self.after_days if after_days is None else after_days)
+        totals = {}
+        synced = set()
+        start = time.time()
+        while limit is None or totals.get('product', 0) < limit:
+            batch_size = self.batch_size if limit is None else min(self.batch_size, limit - totals.get('product', 0))
+            candidates = self.candidates(before, batch_size)
+            db.session.rollback()
+            if not candidates:
+                break
+            archives = {}
+            for product_id, date_added in candidates:
+                archives.setdefault(self.archive_name(date_added), []).append(product_id)
+            for name, product_ids in sorted(archives.items()):
+                engine = self.engine(name)
+                if name not in synced:
+                    self.sync_references(engine)
+                    synced.add(name)
+                counts, bounds = self.copy(engine, product_ids)
+                db.session.query(Archived_Product).filter(Archived_Product.product_id.in_(product_ids)).delete(synchronize_session=False)
+                db.session.add_all([Archived_Product(product_id, name) for product_id in product_ids])
+                db.session.commit()
+                # rows written after the copy (newer ids) stay in hot tables with their product
+                delete_products(product_ids, bounds)
+                for key, value in counts.items():
+                    totals[key] = totals.get(key, 0) + value
+            if progress is not None:
+                progress(totals, time.time() - start)
+        logger.info("archived: {totals}".format(totals=totals))
+        return totals
@@ -0,0 +1,93 @@
+import logging
+import dateutil.parser
+from . import db
+from .models import Product, Status, Operation, Comment, Wip
+from .keyset import parse_jump_date
+from .outbox import chunks
+
+logger = logging.getLogger(__name__)
+
+# tables referencing product - deleted before product itself
+DEPENDENTS = (Wip, Comment, Operation, Status)
+FILTER_KEYS = ('type', 'variant_id', 'date_from', 'date_to')
+
+
+def chunk_size():
+    from flask import current_app
+    return current_app.config.get('PRODUCT_DELETE_CHUNK', 100)
+
+
+def delete_products(product_ids, bounds=None):
+    """
+    Delete products with their WIP entries, comments, operations and statuses by set based DELETE statements.
+    Products are deleted in chunks of PRODUCT_DELETE_CHUNK, every chunk in its own transaction, so lock time
+    and transaction size stay bounded. Returns dictionary table name -> number of deleted rows (from rowcount).
+
+    bounds (table name -> highest id or None) limit deleted comments, operations and statuses to rows with id up to
+    the bound (eg. rows copied to archive) - product which still has history afterwards is not deleted.
+    """
+    from . import product_cache
+    counts = dict((model.__tablename__, 0) for model in DEPENDENTS + (Product,))
+    for chunk in chunks(product_ids, chunk_size()):
+        delete_chunk(chunk, counts, bounds)
+        for product_id in chunk:
+            product_cache.invalidate(product_id)
+    logger.info("deleted products: {counts}".format(counts=counts))
+    return counts
+
+
+def delete_chunk(product_ids, counts, bounds=None):
+    connection = db.session.connection()
+    try:
+        history = [model for model in DEPENDENTS if model is not Wip]
+        for model in history:
+            table = model.__table__
+            query = table.delete().where(table.c.product_id.in_(product_ids))
+            if bounds is not None:
+                if bounds.get(table.name) is None:
+                    continue
+                query = query.where(table.c.id <= bounds[table.name])
+            counts[table.name] += connection.execute(query).rowcount
+        for table, key in ((Wip.__table__, Wip.__table__.c.product_id), (Product.__table__, Product.__table__.c.id)):
+            query = table.delete().where(key.in_(product_ids))
+            if bounds is not None:
+                # product with history written after bounds stays
+                for model in history:
+                    query = query.where(~db.exists().where(model.__table__.c.product_id == key))
+            counts[table.name] += connection.execute(query).rowcount
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def filter_products(query, criteria):
+    """
+    Apply product filter - type, variant_id, date_from, date_to (of Product.date_added). Raises ValueError.
+    """
+    if criteria.get('type'):
+        query = query.filter(Product.type == str(criteria['type']).zfill(10))
+    if criteria.get('variant_id') not in (None, ''):
+        query = query.filter(Product.variant_id == int(criteria['variant_id']))
+    if criteria.get('date_from'):
+        query = query.filter(Product.date_added >= dateutil.parser.parse(criteria['date_from']))
+    if criteria.get('date_to'):
+        query = query.filter(Product.date_added < dateutil.parser.parse(parse_jump_date(criteria['date_to'])))
+    return query
+
+
+def delete_products_by(criteria):
+    """
+    Delete products matching filter (see filter_products) in chunks. Returns counts like delete_products.
+    """
+    query = filter_products(db.session.query(Product.id), criteria)
+    counts = None
+    while True:
+        product_ids = [row.id for row in query.order_by(Product.id).limit(chunk_size()).all()]
+        if not product_ids:
+            break
+        chunk_counts = delete_products(product_ids)
+        if not chunk_counts['product']:
+            break  # nothing deleted (eg. removed concurrently) - do not loop over the same ids
+        counts = chunk_counts if counts is None else dict((k, counts[k] + v) for k, v in chunk_counts.items())
+    return counts or dict((model.__tablename__, 0) for model in DEPENDENTS + (Product,))
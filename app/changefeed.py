@@ -0,0 +1,172 @@
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+def parse_event_id(value):
+    """
+    Return (status_id, operation_id) high-water mark from event id "<status_id>:<operation_id>" or None.
+    """
+    if not value:
+        return None
+    try:
+        status_id, operation_id = value.split(':', 1)
+        return int(status_id), int(operation_id)
+    except ValueError:
+        return None
+
+
+def format_event(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append('id: {0}'.format(event_id))
+    lines.append('event: {0}'.format(event))
+    lines.append('data: {0}'.format(json.dumps(data, default=lambda o: str(o) if isinstance(o, datetime) else repr(o))))
+    return '\n'.join(lines) + '\n\n'
+
+
+class ChangeFeed(object):
+    """
+    Feed of newly inserted statuses and operations streamed as Server-Sent Events (CHANGE_FEED).
+
+    Streams tail status and operation tables by id high-water mark - every worker process serves its streams from
+    the shared database, so no broker is needed. Inserts done in the same process call notify() which wakes streams
+    right away, rows written by other processes are picked up within CHANGE_FEED_POLL_INTERVAL seconds.
+    Event id is "<status_id>:<operation_id>" of the highest sent ids, browser sends it back as Last-Event-ID
+    on reconnect and the stream resumes right after it.
+
+    Ids are assigned at insert, not at commit - with several worker processes or group commit a row may become
+    visible after rows with higher ids were already sent. Every poll re-scans the last CHANGE_FEED_OVERLAP ids below
+    the mark and sends rows not sent by the stream yet. Rows already in that window when stream (re)connects are
+    taken as sent, so a row committed late while the browser is reconnecting can still be missed.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.poll_interval = 1.0
+        self.heartbeat = 15.0
+        self.batch_size = 500
+        self.overlap = 1000
+        self.max_duration = 300.0
+        self.retry = 2000
+        self.condition = threading.Condition()
+        self.generation = 0
+        self.streams = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from . import metrics
+        self.enabled = app.config.get('CHANGE_FEED', self.enabled)
+        self.poll_interval = app.config.get('CHANGE_FEED_POLL_INTERVAL', self.poll_interval)
+        self.heartbeat = app.config.get('CHANGE_FEED_HEARTBEAT', self.heartbeat)
+        self.batch_size = app.config.get('CHANGE_FEED_BATCH_SIZE', self.batch_size)
+        self.overlap = app.config.get('CHANGE_FEED_OVERLAP', self.overlap)
+        self.max_duration = app.config.get('CHANGE_FEED_MAX_DURATION', self.max_duration)
+        self.retry = app.config.get('CHANGE_FEED_RETRY', self.retry)
+        metrics.describe('change_feed_streams', 'gauge', 'Number of open change feed streams.')
+        metrics.register_collector(self.collect)
+
+    def collect(self):
+        return [('change_feed_streams', {}, self.streams)]
+
+    def notify(self):
+        """
+        Wake streams of this process - new rows were committed.
+        """
+        with self.condition:
+            self.generation += 1
+            self.condition.notify_all()
+
+    def wait(self, generation, timeout):
+        with self.condition:
+            if self.generation == generation:
+                self.condition.wait(timeout)
+            return self.generation
+
+    def high_water_mark(self):
+        from . import db
+        from .models import Status, Operation
+        status_id = db.session.query(db.func.max(Status.id)).scalar() or 0
+        operation_id = db.session.query(db.func.max(Operation.id)).scalar() or 0
+        db.session.rollback()  # end transaction - next read has to see rows committed meanwhile
+        return status_id, operation_id
+
+    def fetch(self, mark, station_id=None, product_id=None, types=('status', 'operation'), seen=None):
+        """
+        Return (events, complete) - events is list of (event, serialized row, new mark) of rows inserted after mark,
+        complete is False when there are more rows than CHANGE_FEED_BATCH_SIZE.
+        Rows are in id order of each table (statuses first) so that mark of every event is safe to resume from.
+
+        seen (table name -> set of ids sent by the stream) enables re-scan of last CHANGE_FEED_OVERLAP ids below mark -
+        rows committed late are sent first (with unchanged mark). Table missing in seen starts with ids present
+        in the window. seen is updated.
+        """
+        from . import db
+        from .models import Status, Operation
+        marks = {'status': mark[0], 'operation': mark[1]}
+        events = []
+        complete = True
+        for name, model in (('status', Status), ('operation', Operation)):
+            if name not in types:
+                continue
+            query = model.query
+            if station_id is not None:
+                query = query.filter(model.station_id == station_id)
+            if product_id is not None:
+                query = query.filter(model.product_id == product_id)
+            rows = []
+            if seen is not None:
+                low = max(marks[name] - self.overlap, 0)
+                window = query.with_entities(model.id).filter(model.id > low).filter(model.id <= marks[name])
+                ids = set(row.id for row in window)
+                if name not in seen:
+                    seen[name] = ids
+                sent = seen[name] = set(i for i in seen[name] if i > low)
+                late = sorted(ids - sent)
+                if late:
+                    rows = query.filter(model.id.in_(late)).order_by(model.id.asc()).all()
+            new = query.filter(model.id > marks[name]).order_by(model.id.asc()).limit(self.batch_size).all()
+            if len(new) >= self.batch_size:
+                complete = False
+            for row in rows + new:
+                marks[name] = max(marks[name], row.id)
+                if seen is not None:
+                    seen[name].add(row.id)
+                events.append((name, row.serialize, (marks['status'], marks['operation'])))
+        db.session.rollback()  # end transaction - next read has to see rows committed meanwhile
+        return events, complete
+
+    def stream(self, mark=None, station_id=None, product_id=None, types=('status', 'operation')):
+        """
+        Generate Server-Sent Events text. Stream ends after CHANGE_FEED_MAX_DURATION seconds - EventSource reconnects
+        with Last-Event-ID, so long living requests do not block worker recycling.
+        """
+        with self.condition:
+            self.streams += 1
+        try:
+            if mark is None:
+                mark = self.high_water_mark()
+            yield 'retry: {0}\n\n'.format(self.retry)
+            started = last_sent = time.time()
+            generation = self.generation
+            seen = {}
+            while time.time() - started < self.max_duration:
+                events, complete = self.fetch(mark, station_id, product_id, types, seen)
+                for event, data, mark in events:
+                    yield format_event(event, data, '{0}:{1}'.format(*mark))
+                if events:
+                    last_sent = time.time()
+                    if not complete:
+                        continue  # catching up
+                elif time.time() - last_sent >= self.heartbeat:
+                    yield ': keepalive\n\n'
+                    last_sent = time.time()
+                generation = self.wait(generation, min(self.poll_interval, max(self.max_duration - (time.time() - started), 0)))
+        finally:
+            with self.condition:
+                self.streams -= 1
@@ -0,0 +1,287 @@
+import math
+import logging
+import threading
+from array import array
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+RESULT_SLOTS = (1, 2, 3)
+
+
+class RingBuffer(object):
+    """
+    Fixed size ring buffer of floats backed by array('d').
+    Keeps running sum and sum of squares so mean and standard deviation are O(1).
+    """
+    __slots__ = ('capacity', 'values', 'size', 'position', 'total', 'total_sq')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.values = array('d', [0.0] * capacity)
+        self.size = 0
+        self.position = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def append(self, value):
+        if self.size == self.capacity:
+            old = self.values[self.position]
+            self.total -= old
+            self.total_sq -= old * old
+        else:
+            self.size += 1
+        self.values[self.position] = value
+        self.total += value
+        self.total_sq += value * value
+        self.position = (self.position + 1) % self.capacity
+
+    @property
+    def mean(self):
+        if self.size == 0:
+            return 0.0
+        return self.total / self.size
+
+    @property
+    def std(self):
+        if self.size < 2:
+            return 0.0
+        variance = (self.total_sq - self.total * self.total / self.size) / (self.size - 1)
+        return math.sqrt(variance) if variance > 0 else 0.0
+
+    @property
+    def last(self):
+        if self.size == 0:
+            return None
+        return self.values[(self.position - 1) % self.capacity]
+
+
+class DriftSeries(object):
+    """
+    Rolling statistics, EWMA and CUSUM state of single measurement series.
+    Measurements are normalized to position within tolerance band:
+    -1.0 is result_N_min, 0.0 is middle of the band and 1.0 is result_N_max.
+    """
+    __slots__ = ('key', 'window', 'ewma', 'cusum_pos', 'cusum_neg', 'baseline', 'baseline_std', 'baseline_count', 'count',
+                 'last_value', 'last_min', 'last_max', 'last_product_id', 'last_update', 'reasons')
+
+    def __init__(self, key, window_size):
+        self.key = key
+        self.window = RingBuffer(window_size)
+        self.ewma = None
+        self.cusum_pos = 0.0
+        self.cusum_neg = 0.0
+        self.baseline = None
+        self.baseline_std = None
+        self.baseline_count = 0
+        self.count = 0
+        self.last_value = None
+        self.last_min = None
+        self.last_max = None
+        self.last_product_id = None
+        self.last_update = None
+        self.reasons = ()
+
+    def rebaseline(self):
+        """
+        Forget CUSUM baseline and sums - the next window of results becomes the new baseline.
+        """
+        self.window = RingBuffer(self.window.capacity)
+        self.cusum_pos = 0.0
+        self.cusum_neg = 0.0
+        self.baseline = None
+        self.baseline_std = None
+        self.baseline_count = 0
+
+    @property
+    def station_id(self):
+        return self.key[0]
+
+    @property
+    def operation_type_id(self):
+        return self.key[1]
+
+    @property
+    def result_slot(self):
+        return self.key[2]
+
+    @property
+    def serialize(self):
+        """Return object data in easily serializeable format"""
+        return {
+            'station_id': self.station_id,
+            'operation_type_id': self.operation_type_id,
+            'result_slot': self.result_slot,
+            'reasons': list(self.reasons),
+            'count': self.count,
+            'last_value': self.last_value,
+            'last_min': self.last_min,
+            'last_max': self.last_max,
+            'last_product_id': self.last_product_id,
+            'last_update': str(self.last_update),
+            'window_mean': self.window.mean,
+            'window_std': self.window.std,
+            'ewma': self.ewma,
+            'cusum_pos': self.cusum_pos,
+            'cusum_neg': self.cusum_neg,
+            'baseline': self.baseline,
+            'baseline_std': self.baseline_std,
+        }
+
+
+class DriftDetector(object):
+    """
+    Online drift detector of operation results.
+    Statistics are kept in memory per (station_id, operation_type_id, result slot) and updated in O(1) per result.
+    Drift is flagged when:
+    - EWMA of normalized result is closer to result_N_max/result_N_min than DRIFT_EWMA_LIMIT, or
+    - CUSUM of deviations from baseline (mean of first DRIFT_WINDOW results) exceeds DRIFT_CUSUM_H sigmas.
+    Baseline is taken again from the rolling window every DRIFT_REBASELINE results of series without alert
+    (0 keeps the first one) and on demand by rebaseline() - e.g. after tool change or recalibration of station.
+    The state is local to process - every worker keeps its own view of the results it has ingested.
+    """
+
+    def __init__(self, app=None):
+        self.series = {}
+        self.alerts = {}
+        self.lock = threading.Lock()
+        self.window_size = 50
+        self.alpha = 0.2
+        self.ewma_limit = 0.8
+        self.cusum_k = 0.5
+        self.cusum_h = 5.0
+        self.rebaseline_every = 1000
+        self.enabled = True
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.window_size = app.config.get('DRIFT_WINDOW', self.window_size)
+        self.alpha = app.config.get('DRIFT_EWMA_ALPHA', self.alpha)
+        self.ewma_limit = app.config.get('DRIFT_EWMA_LIMIT', self.ewma_limit)
+        self.cusum_k = app.config.get('DRIFT_CUSUM_K', self.cusum_k)
+        self.cusum_h = app.config.get('DRIFT_CUSUM_H', self.cusum_h)
+        self.rebaseline_every = app.config.get('DRIFT_REBASELINE', self.rebaseline_every)
+        self.enabled = app.config.get('DRIFT_DETECTION', self.enabled)
+        self.reset()
+
+        @app.context_processor
+        def inject_drift_alerts():
+            return {'drift_alerts': self.active_alerts()}
+
+    def reset(self):
+        with self.lock:
+            self.series = {}
+            self.alerts = {}
+
+    def rebaseline(self, station_id=None, operation_type_id=None, slot=None):
+        """
+        Restart baseline of matching series (None matches any) and clear their CUSUM alerts.
+        Returns number of series re-baselined.
+        """
+        count = 0
+        with self.lock:
+            for key, series in self.series.items():
+                if any(value is not None and value != part for value, part in zip((station_id, operation_type_id, slot), key)):
+                    continue
+                series.rebaseline()
+                series.reasons = tuple(r for r in series.reasons if not r.startswith('CUSUM'))
+                if not series.reasons:
+                    self.alerts.pop(key, None)
+                count += 1
+        logger.info("drift baseline restarted for {count} series of station: {0} operation_type: {1} result: {2}".format(station_id, operation_type_id, slot, count=count))
+        return count
+
+    def observe_operation(self, operation):
+        """
+        Feed all result slots of given operation into the detector.
+        """
+        if not self.enabled:
+            return
+        for slot in RESULT_SLOTS:
+            self.observe(
+                operation.station_id,
+                operation.operation_type_id,
+                slot,
+                getattr(operation, 'result_{slot}'.format(slot=slot)),
+                getattr(operation, 'result_{slot}_min'.format(slot=slot)),
+                getattr(operation, 'result_{slot}_max'.format(slot=slot)),
+                product_id=operation.product_id,
+            )
+
+    def observe(self, station_id, operation_type_id, slot, value, value_min, value_max, product_id=None):
+        """
+        Update statistics of single measurement. Returns DriftSeries or None in case measurement is not checked.
+        Measurements without tolerance band (min == max) are ignored.
+        """
+        if value is None or value_min is None or value_max is None or value_max <= value_min:
+            return None
+        half_width = (value_max - value_min) / 2.0
+        position = (value - (value_max + value_min) / 2.0) / half_width
+        key = (station_id, operation_type_id, slot)
+
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = DriftSeries(key, self.window_size)
+            series.window.append(position)
+            series.count += 1
+            series.last_value = value
+            series.last_min = value_min
+            series.last_max = value_max
+            series.last_product_id = product_id
+            series.last_update = datetime.now()
+
+            if series.ewma is None:
+                series.ewma = position
+            else:
+                series.ewma = self.alpha * position + (1.0 - self.alpha) * series.ewma
+
+            if series.baseline is None:
+                if series.window.size >= self.window_size:
+                    series.baseline = series.window.mean
+                    # avoid division by zero for perfectly stable series
+                    series.baseline_std = max(series.window.std, 0.01)
+                    series.baseline_count = series.count
+            else:
+                deviation = (position - series.baseline) / series.baseline_std
+                series.cusum_pos = max(0.0, series.cusum_pos + deviation - self.cusum_k)
+                series.cusum_neg = max(0.0, series.cusum_neg - deviation - self.cusum_k)
+
+            reasons = []
+            if abs(series.ewma) >= self.ewma_limit:
+                reasons.append('EWMA_MAX' if series.ewma > 0 else 'EWMA_MIN')
+            if series.cusum_pos > self.cusum_h:
+                reasons.append('CUSUM_UP')
+            if series.cusum_neg > self.cusum_h:
+                reasons.append('CUSUM_DOWN')
+            series.reasons = tuple(reasons)
+
+            if not reasons and self.rebaseline_every and series.baseline is not None and series.count - series.baseline_count >= self.rebaseline_every:
+                # follow slow legitimate changes (tool wear compensated by operator, new material batch)
+                series.baseline = series.window.mean
+                series.baseline_std = max(series.window.std, 0.01)
+                series.baseline_count = series.count
+                series.cusum_pos = series.cusum_neg = 0.0
+
+            if reasons:
+                if key not in self.alerts:
+                    logger.warning("drift detected for station: {0} operation_type: {1} result: {2} reasons: {3}".format(station_id, operation_type_id, slot, ", ".join(reasons)))
+                self.alerts[key] = series
+            else:
+                self.alerts.pop(key, None)
+        return series
+
+    def active_alerts(self, station_id=None):
+        with self.lock:
+            alerts = list(self.alerts.values())
+        if station_id is not None:
+            alerts = [a for a in alerts if a.station_id == station_id]
+        return sorted(alerts, key=lambda a: a.key)
+
+    def get_series(self, station_id=None):
+        with self.lock:
+            series = list(self.series.values())
+        if station_id is not None:
+            series = [s for s in series if s.station_id == station_id]
+        return sorted(series, key=lambda s: s.key)
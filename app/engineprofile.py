@@ -0,0 +1,187 @@
+import os
+import time
+import logging
+import threading
+import weakref
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# dialect: profile is meant for this database only
+# engine: create_engine options, pool_size makes SQLite use connection pool instead of NullPool
+# connect_args: DBAPI connect() arguments
+# pragmas (SQLite) and statements (other databases) are executed on every new connection
+PROFILES = {
+    # file SQLite written by PLC ingest - WAL lets pages read during commits, busy timeout instead of immediate
+    # 'database is locked', NORMAL synchronous is durable in WAL mode up to power loss
+    'sqlite-ingest': {
+        'dialect': 'sqlite',
+        'engine': {'pool_size': 5, 'max_overflow': 10, 'pool_timeout': 10},
+        'connect_args': {'timeout': 15, 'check_same_thread': False},
+        'pragmas': [('journal_mode', 'WAL'), ('synchronous', 'NORMAL'), ('mmap_size', 268435456), ('cache_size', -32000), ('temp_store', 'MEMORY')],
+    },
+    # MySQL primary - connections recycled before proxies/server drop them, checked before use after idle time.
+    # READ COMMITTED shortens lock waits of ingest; snapshots switch their connection to REPEATABLE READ
+    # (app/snapshot.py), which MySQL needs for START TRANSACTION WITH CONSISTENT SNAPSHOT
+    'mysql-prod': {
+        'dialect': 'mysql',
+        'engine': {'pool_size': 10, 'max_overflow': 20, 'pool_timeout': 10, 'pool_recycle': 280, 'pool_pre_ping': True, 'isolation_level': 'READ COMMITTED'},
+        'statements': ['SET SESSION innodb_lock_wait_timeout = 10'],
+    },
+    # test databases are thrown away - no fsync
+    'test': {
+        'pragmas': [('synchronous', 'OFF')],
+    },
+    # SQLAlchemy and Flask-SQLAlchemy defaults - baseline of benchmarks/profiles.py
+    'defaults': {},
+}
+DEFAULT_PROFILES = {'sqlite': 'sqlite-ingest', 'mysql': 'mysql-prod'}
+POOL_OPTIONS = ('poolclass', 'pool_size', 'max_overflow', 'pool_timeout')
+
+
+def pool_name(url):
+    """ Return label of connection pool - database file name for SQLite, host/database otherwise """
+    if url.drivername.startswith('sqlite'):
+        return os.path.basename(url.database or '') or 'memory'
+    return '{host}/{database}'.format(host=url.host, database=url.database)
+
+
+@contextmanager
+def synchronous_off(connection):
+    """
+    Turn off fsync of SQLite connection for bulk load of rows which can be generated or imported again.
+    Previous setting is restored afterwards as pooled connection is reused by other requests. Other databases
+    are not changed.
+    """
+    if connection.dialect.name != 'sqlite':
+        yield connection
+        return
+    previous = connection.execute('PRAGMA synchronous').scalar()
+    connection.execute('PRAGMA synchronous = OFF')
+    try:
+        yield connection
+    finally:
+        connection.execute('PRAGMA synchronous = {0}'.format(int(previous)))
+
+
+class MeteredQueuePool(QueuePool):
+    """
+    QueuePool measuring time spent waiting for connection (including opening new one) and checkout timeouts.
+    """
+
+    def __init__(self, *args, **kwargs):
+        QueuePool.__init__(self, *args, **kwargs)
+        pools[self._orig_logging_name] = self  # pool recreated by engine.dispose() replaces the old one
+
+    def _do_get(self):
+        from . import metrics
+        start = time.time()
+        try:
+            return QueuePool._do_get(self)
+        except TimeoutError:
+            metrics.inc('db_pool_timeouts_total', pool=self._orig_logging_name)
+            raise
+        finally:
+            metrics.observe('db_pool_checkout_wait_seconds', time.time() - start, pool=self._orig_logging_name)
+
+
+pools = weakref.WeakValueDictionary()  # label -> the newest pool
+
+
+class EngineProfiles(object):
+    """
+    Named engine profiles (PROFILES) - pool sizing, recycling, pre-ping and per connection setup.
+
+    DATABASE_ENGINE_PROFILE selects profile, None selects it by database (DEFAULT_PROFILES). Profile is applied to
+    all engines of db (primary and binds) when they are created. Pooled engines use MeteredQueuePool: checkout wait
+    times, timeouts and pool saturation (checked out connections / (pool_size + max_overflow)) are exposed by metrics.
+    """
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.engines = weakref.WeakKeyDictionary()  # engine -> profile name
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from . import metrics
+        name = app.config.get('DATABASE_ENGINE_PROFILE')
+        if name is not None and name not in PROFILES:
+            raise ValueError("unknown DATABASE_ENGINE_PROFILE {name} - one of {names} expected".format(name=name, names=', '.join(sorted(PROFILES))))
+        metrics.describe('db_pool_checkout_wait_seconds', 'histogram', 'Time waiting for database connection from pool.', WAIT_BUCKETS)
+        metrics.describe('db_pool_timeouts_total', 'counter', 'Number of connection checkouts failed on pool timeout.')
+        metrics.describe('db_pool_checked_out', 'gauge', 'Number of connections checked out from pool.')
+        metrics.describe('db_pool_saturation', 'gauge', 'Checked out connections / maximal number of pool connections.')
+        metrics.register_collector(self.collect)
+
+    def profile_name(self, app, url):
+        name = app.config.get('DATABASE_ENGINE_PROFILE')
+        if name is None:
+            name = DEFAULT_PROFILES.get(url.get_backend_name())
+        return name
+
+    def apply(self, app, url, options):
+        """
+        Update create_engine options by profile - called by db before engine is created.
+        """
+        name = self.profile_name(app, url)
+        if name is None:
+            return
+        profile = PROFILES[name]
+        if profile.get('dialect', url.get_backend_name()) != url.get_backend_name():
+            raise ValueError("engine profile {name} is meant for {dialect} database".format(name=name, dialect=profile['dialect']))
+        engine_options = dict(profile.get('engine', {}))
+        if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+            # every pooled connection would open its own empty in-memory database - keep single StaticPool one
+            for key in POOL_OPTIONS:
+                engine_options.pop(key, None)
+        options.update(engine_options)
+        if profile.get('connect_args'):
+            options['connect_args'] = dict(options.get('connect_args', {}), **profile['connect_args'])
+        if 'pool_size' in options:
+            options['poolclass'] = MeteredQueuePool
+            options['pool_logging_name'] = pool_name(url)
+
+    def setup(self, app, engine):
+        """
+        Register connection setup of profile on engine - called by db for every engine it returns.
+        """
+        if engine in self.engines:
+            return
+        with self.lock:
+            if engine in self.engines:
+                return
+            name = self.profile_name(app, engine.url)
+            self.engines[engine] = name
+            if name is None:
+                return
+            profile = PROFILES[name]
+            if engine.dialect.name == 'sqlite':
+                statements = ['PRAGMA {0} = {1}'.format(pragma, value) for pragma, value in profile.get('pragmas', [])]
+            else:
+                statements = list(profile.get('statements', []))
+            if statements:
+                event.listen(engine, 'connect', lambda dbapi_connection, connection_record: self.on_connect(dbapi_connection, statements))
+            logger.info("engine {url} uses profile {name}".format(url=repr(engine.url), name=name))
+
+    def on_connect(self, dbapi_connection, statements):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+    def collect(self):
+        samples = []
+        for label, pool in list(pools.items()):
+            capacity = pool.size() + max(pool._max_overflow, 0)
+            labels = {'pool': label}
+            samples.append(('db_pool_checked_out', labels, pool.checkedout()))
+            samples.append(('db_pool_saturation', labels, float(pool.checkedout()) / capacity if capacity else 0.0))
+        return samples
@@ -0,0 +1,173 @@
+import os
+import csv
+import json
+import time
+import logging
+from datetime import datetime
+from . import db
+from .engineprofile import synchronous_off
+from .models import Status, Operation, Fail_Step, Import_Checkpoint
+from .validation import ValidationError, RESULT_KEYS, status_values, operation_values
+
+logger = logging.getLogger(__name__)
+
+KINDS = {'status': Status, 'operation': Operation}
+FORMATS = ('csv', 'ndjson')
+# CSV cells are text - numeric columns are converted to numbers as they come in JSON requests
+INTEGER_KEYS = ('status', 'station_id', 'operation_status_id', 'operation_type_id') + tuple(key for key, _ in RESULT_KEYS if key.endswith('_status_id'))
+FLOAT_KEYS = tuple(key for key, _ in RESULT_KEYS if not key.endswith('_status_id'))
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.ndjson', '.jsonl', '.json'):
+        return 'ndjson'
+    raise ValueError("unknown format of {path} - csv or ndjson expected".format(path=path))
+
+
+def convert(key, value):
+    try:
+        if key in INTEGER_KEYS:
+            return int(value)
+        if key in FLOAT_KEYS:
+            return float(value)
+    except ValueError:
+        pass  # left as text - rejected by validation
+    return value
+
+
+def csv_records(stream):
+    """
+    Yield (record, error) of every CSV row - header gives keys, empty cells are left out.
+    """
+    for row in csv.DictReader(stream):
+        record = {}
+        for key, value in row.items():
+            if key is None or value is None or value == '':
+                continue
+            key = key.strip()
+            record[key] = convert(key, value.decode('utf-8'))
+        yield record, None
+
+
+def ndjson_records(stream):
+    """
+    Yield (record, error) of every non empty line with JSON object.
+    """
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line), None
+        except ValueError, e:
+            yield None, ValidationError("invalid JSON: {error}".format(error=e))
+
+
+class Importer(object):
+    """
+    Bulk import of historical statuses or operations from CSV or NDJSON file (manage.py import).
+
+    File is streamed and every record is validated by the rules of POST /api/status or /api/operation (see
+    app/validation.py) - invalid records are logged and counted as rejected. Valid rows are inserted with Core
+    executemany in batches of batch_size (IMPORT_BATCH_SIZE) rows, ORM objects are not created.
+    Per row work of the API is deferred: WIP tracker is rebuilt once at the end (Core inserts bypass its events),
+    ingest metrics and change feed are updated once per batch, product cache is not consulted.
+
+    Import is resumable: position in file is stored in import_checkpoint in the same transaction as every batch,
+    so repeated import of the same file continues after the last committed batch. restart=True starts over.
+    """
+
+    def __init__(self, path, kind, format=None, batch_size=None):
+        from flask import current_app
+        if kind not in KINDS:
+            raise ValueError("unknown kind {kind} - status or operation expected".format(kind=kind))
+        if format is not None and format not in FORMATS:
+            raise ValueError("unknown format {format} - csv or ndjson expected".format(format=format))
+        self.path = path
+        self.source = os.path.abspath(path)
+        self.kind = kind
+        self.format = format or detect_format(path)
+        self.batch_size = batch_size or current_app.config.get('IMPORT_BATCH_SIZE', 5000)
+        self.table = KINDS[kind].__table__
+        self.counts = {'imported': 0, 'rejected': 0, 'skipped': 0}
+
+    def records(self, stream):
+        return csv_records(stream) if self.format == 'csv' else ndjson_records(stream)
+
+    def row(self, record):
+        """
+        Return table row of record. Raises ValidationError.
+        """
+        if self.kind == 'status':
+            values = status_values(record)
+            values['fail_step_id'] = Fail_Step.intern(values['fail_step'])
+        else:
+            values = operation_values(record)
+        values['date_time'] = values['date_time'] or str(datetime.now())
+        return values
+
+    def checkpoint(self):
+        checkpoint = Import_Checkpoint.query.get(self.source)
+        db.session.rollback()
+        return checkpoint
+
+    def save(self, connection, position):
+        table = Import_Checkpoint.__table__
+        values = dict(kind=self.kind, position=position, imported=self.counts['imported'], rejected=self.counts['rejected'], updated_at=datetime.now())
+        if not connection.execute(table.update().where(table.c.source == self.source).values(**values)).rowcount:
+            connection.execute(table.insert().values(source=self.source, **values))
+
+    def run(self, progress=None, restart=False):
+        """
+        Import the file. Returns dictionary with numbers of imported, rejected and skipped (imported by previous
+        interrupted run) records, and number of products in WIP for statuses.
+        progress is called with counts dictionary and elapsed seconds after every committed batch.
+        """
+        from . import metrics, change_feed, wip_tracker
+        position = 0
+        checkpoint = self.checkpoint()
+        if checkpoint is not None and not restart:
+            if checkpoint.kind != self.kind:
+                raise ValueError("{source} was imported as {kind}".format(source=self.source, kind=checkpoint.kind))
+            position = checkpoint.position
+            self.counts.update(imported=checkpoint.imported, rejected=checkpoint.rejected)
+            logger.info("import of {source} resumed after record {position}".format(source=self.source, position=position))
+        rows = []
+        started = time.time()
+
+        def flush(position):
+            with db.engine.connect() as connection, synchronous_off(connection), connection.begin():
+                if rows:
+                    connection.execute(self.table.insert(), rows)
+                self.counts['imported'] += len(rows)
+                self.save(connection, position)
+            if rows:
+                metrics.inc('ingest_rows_total', len(rows), kind=self.kind)
+                change_feed.notify()
+            del rows[:]
+            if progress is not None:
+                progress(self.counts, time.time() - started)
+
+        number = 0
+        with open(self.path, 'rb') as stream:
+            for number, (record, error) in enumerate(self.records(stream), 1):
+                if number <= position:
+                    self.counts['skipped'] += 1
+                    continue
+                try:
+                    if error is not None:
+                        raise error
+                    rows.append(self.row(record))
+                except ValidationError, e:
+                    logger.warning("{source} record {number}: {error} - rejected".format(source=self.source, number=number, error=e))
+                    self.counts['rejected'] += 1
+                if len(rows) >= self.batch_size:
+                    flush(number)
+        if number > position:
+            flush(number)
+        if self.kind == 'status' and wip_tracker.enabled:
+            self.counts['wip'] = wip_tracker.rebuild()
+        logger.info("imported {source}: {counts} in {time:.1f}s".format(source=self.source, counts=self.counts, time=time.time() - started))
+        return self.counts
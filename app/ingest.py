@@ -0,0 +1,206 @@
+import time
+import atexit
+import logging
+import threading
+from six.moves import queue
+from sqlalchemy.exc import SQLAlchemyError
+
+logger = logging.getLogger(__name__)
+
+ACK_ENQUEUE = 'enqueue'
+ACK_COMMIT = 'commit'
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+
+class IngestQueueFull(Exception):
+    pass
+
+
+class IngestFuture(object):
+    """
+    Result of queued record - set by writer thread once record is committed or failed.
+    """
+
+    def __init__(self, record):
+        self.record = record
+        self.event = threading.Event()
+        self.error = None
+
+    def set_result(self):
+        self.event.set()
+
+    def set_error(self, error):
+        self.error = error
+        self.event.set()
+
+    def done(self):
+        return self.event.is_set()
+
+    def result(self, timeout=None):
+        """
+        Wait until record is committed and return it (with id set). Raises error of failed commit.
+        Returns None when timeout elapsed.
+        """
+        if not self.event.wait(timeout):
+            return None
+        if self.error is not None:
+            raise self.error
+        return self.record
+
+
+class IngestQueue(object):
+    """
+    Write-behind ingestion of statuses and operations (INGEST_QUEUE).
+
+    Requests validate incoming record and put it into bounded queue. Dedicated writer thread takes records from
+    queue and commits them in groups - every INGEST_FLUSH_INTERVAL seconds or INGEST_BATCH_SIZE records, whichever
+    comes first - so many records share one transaction (and one fsync) instead of one commit per request.
+
+    INGEST_ACK decides when request is acknowledged: 'enqueue' - right after record is queued (202),
+    'commit' - after record is durably committed (201), or as queued (202) when commit does not finish in
+    INGEST_COMMIT_TIMEOUT seconds - the record stays queued and retry would duplicate it. When queue stays full
+    for INGEST_ENQUEUE_TIMEOUT seconds IngestQueueFull is raised so the client can back off. Queue is drained
+    on shutdown.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.ack = ACK_COMMIT
+        self.batch_size = 500
+        self.flush_interval = 0.05
+        self.enqueue_timeout = 1.0
+        self.commit_timeout = 10.0
+        self.queue = queue.Queue(maxsize=10000)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopping = threading.Event()
+        self.exit_registered = False
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('INGEST_QUEUE', self.enabled)
+        self.ack = app.config.get('INGEST_ACK', self.ack)
+        self.batch_size = app.config.get('INGEST_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.get('INGEST_FLUSH_INTERVAL', self.flush_interval)
+        self.enqueue_timeout = app.config.get('INGEST_ENQUEUE_TIMEOUT', self.enqueue_timeout)
+        self.commit_timeout = app.config.get('INGEST_COMMIT_TIMEOUT', self.commit_timeout)
+        if not self.enabled:
+            return
+        self.app = app
+        self.queue = queue.Queue(maxsize=app.config.get('INGEST_QUEUE_SIZE', self.queue.maxsize))
+
+        from . import metrics
+        metrics.describe('ingest_queue_depth', 'gauge', 'Number of records waiting in write-behind queue.')
+        metrics.describe('ingest_queue_capacity', 'gauge', 'Capacity of write-behind queue.')
+        metrics.describe('ingest_queue_rejected_total', 'counter', 'Number of records rejected because write-behind queue was full.')
+        metrics.describe('ingest_batch_size', 'histogram', 'Number of records committed in one write-behind transaction.', BATCH_SIZE_BUCKETS)
+        metrics.describe('ingest_commit_duration_seconds', 'histogram', 'Duration of write-behind group commit.')
+        metrics.register_collector(self.collect)
+
+    def collect(self):
+        return [('ingest_queue_depth', {}, self.queue.qsize()), ('ingest_queue_capacity', {}, self.queue.maxsize)]
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self.run, name='ingest-writer')
+            self.thread.daemon = True
+            self.thread.start()
+            if not self.exit_registered:
+                atexit.register(self.stop)
+                self.exit_registered = True
+
+    def stop(self, timeout=None):
+        """
+        Stop writer thread after all queued records are committed.
+        """
+        thread = self.thread
+        if thread is None:
+            return
+        self.stopping.set()
+        thread.join(timeout)
+        self.thread = None
+
+    def submit(self, record):
+        """
+        Queue model object (Status or Operation) for writing. Returns IngestFuture.
+        """
+        from . import metrics
+        if self.thread is None or not self.thread.is_alive():
+            self.start()
+        future = IngestFuture(record)
+        try:
+            self.queue.put(future, True, self.enqueue_timeout)
+        except queue.Full:
+            metrics.inc('ingest_queue_rejected_total')
+            raise IngestQueueFull("ingest queue is full ({size} records)".format(size=self.queue.maxsize))
+        return future
+
+    def run(self):
+        while True:
+            try:
+                first = self.queue.get(True, self.flush_interval)
+            except queue.Empty:
+                if self.stopping.is_set():
+                    return
+                continue
+            batch = [first]
+            deadline = time.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.time()
+                try:
+                    batch.append(self.queue.get(remaining > 0, max(remaining, 0)))
+                except queue.Empty:
+                    break
+            try:
+                self.write(batch)
+            except Exception as e:
+                # never leave request waiting for record which will not be written
+                logger.exception("ingest writer failed: {error}".format(error=e))
+                for future in batch:
+                    if not future.done():
+                        future.set_error(e)
+
+    def write(self, batch):
+        from . import db, metrics, change_feed, slowlog
+        engine = db.get_engine(self.app)
+        start = time.time()
+        try:
+            with engine.begin() as connection:
+                for future in batch:
+                    self.insert(connection, future.record)
+        except SQLAlchemyError as e:
+            # find failed record(s) - commit one by one
+            logger.warning("group commit of {count} records failed, retrying one by one: {error}".format(count=len(batch), error=e))
+            for future in batch:
+                try:
+                    with engine.begin() as connection:
+                        self.insert(connection, future.record)
+                except SQLAlchemyError as e:
+                    logger.error("unable to store {record}: {error}".format(record=repr(future.record), error=e))
+                    future.set_error(e)
+        metrics.observe('ingest_commit_duration_seconds', time.time() - start)
+        metrics.observe('ingest_batch_size', len(batch))
+        for future in batch:
+            if future.error is not None:
+                continue
+            metrics.inc('ingest_rows_total', kind=future.record.__tablename__)
+            future.set_result()
+        change_feed.notify()
+        slowlog.flush()  # writer thread has no request teardown
+
+    @staticmethod
+    def insert(connection, record):
+        from . import wip_tracker
+        table = record.__table__
+        values = dict((c.name, getattr(record, c.name)) for c in table.columns if getattr(record, c.name) is not None)
+        values.pop('id', None)
+        result = connection.execute(table.insert(), values)
+        record.id = result.inserted_primary_key[0]
+        if table.name == 'status':
+            # Core insert fires no ORM events - WIP is updated here, in the same transaction
+            wip_tracker.track(connection, record)
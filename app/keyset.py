@@ -0,0 +1,68 @@
+from datetime import timedelta
+import dateutil.parser
+
+
+class KeysetPagination(object):
+    """
+    Older/Newer pagination by id of append-only tables (statuses, operations).
+
+    Pages are selected with id < before (older) or id > after (newer) and LIMIT, so every page costs
+    one index range scan regardless of its depth, and no count of the whole table is needed.
+    args (eg. filters) are added to links of older and newer page.
+    """
+
+    def __init__(self, query, column, per_page, before=None, after=None, args=None):
+        self.per_page = per_page
+        self.args = args or {}
+        if after is not None:
+            items = query.filter(column > after).order_by(column.asc()).limit(per_page + 1).all()
+            self.has_newer = len(items) > per_page
+            self.items = list(reversed(items[:per_page]))
+            self.has_older = True
+        else:
+            if before is not None:
+                query = query.filter(column < before)
+            items = query.order_by(column.desc()).limit(per_page + 1).all()
+            self.has_older = len(items) > per_page
+            self.items = items[:per_page]
+            self.has_newer = before is not None
+        if not self.items:
+            # empty page (eg. jump past the end) - allow to go back to the newest rows
+            self.has_older = False
+            self.has_newer = before is not None or after is not None
+        self.first_id = self.items[0].id if self.items else None
+        self.last_id = self.items[-1].id if self.items else None
+
+    @property
+    def older(self):
+        """ Return arguments of link to older page """
+        return dict(self.args, before=self.last_id) if self.has_older else None
+
+    @property
+    def newer(self):
+        """ Return arguments of link to newer page, None on the newest page """
+        if not self.has_newer:
+            return None
+        if self.first_id is None:
+            return dict(self.args)
+        return dict(self.args, after=self.first_id)
+
+
+def parse_jump_date(value):
+    """
+    Return date_time string - rows older than it are shown after jump to given date.
+    Date without time means end of that day.
+    """
+    date_time = dateutil.parser.parse(value)
+    if len(value.strip()) <= 10:
+        date_time += timedelta(days=1)
+    return str(date_time)
+
+
+def jump_before(model, value):
+    """
+    Return before id of page with newest rows older than given date (uses date_time index).
+    """
+    from . import db
+    row = db.session.query(model.id).filter(model.date_time < parse_jump_date(value)).order_by(model.date_time.desc()).first()
+    return row.id + 1 if row is not None else 0
@@ -0,0 +1,286 @@
+import os
+import re
+import json
+import errno
+import time
+import glob
+import logging
+import threading
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+LOCK_ERRORS = ('database is locked', 'database table is locked', 'lock wait timeout', 'deadlock')
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+PID_FILE = re.compile(r'metrics_(\d+)\.json$')
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels)
+    if extra is not None:
+        items.append(extra)
+    if not items:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in items) + '}'
+
+
+def _pid_alive(pid):
+    """ Return False when there is no process of given pid - processes are not checked on Windows """
+    if os.name == 'nt':
+        return True
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metrics(object):
+    """
+    Application wide instrumentation with Prometheus text format output.
+    Records per endpoint latency histograms, SQL query count and SQL time per request (SQLAlchemy engine events)
+    and any counter, gauge or histogram registered by other modules (eg. ingest throughput).
+
+    In multiprocess mode (METRICS_MULTIPROC_DIR set) every process dumps its values to own file in given
+    directory at most every METRICS_FLUSH_INTERVAL seconds and /api/metrics sums counters and histograms of all
+    files. Gauges are state of single process - files of exited processes are skipped and the maximum of live
+    processes is reported.
+    """
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.descriptions = {}
+        self.collectors = []
+        self.enabled = True
+        self.multiproc_dir = None
+        self.flush_interval = 5
+        self.last_flush = 0
+        self.reset()
+        self.describe('http_requests_total', 'counter', 'Number of HTTP requests per endpoint and status code.')
+        self.describe('http_request_duration_seconds', 'histogram', 'HTTP request latency per endpoint.', LATENCY_BUCKETS)
+        self.describe('sql_queries_total', 'counter', 'Number of SQL statements executed.')
+        self.describe('sql_duration_seconds_total', 'counter', 'Time spent executing SQL statements.')
+        self.describe('sql_queries_per_request', 'histogram', 'Number of SQL statements executed per request and endpoint.', QUERY_COUNT_BUCKETS)
+        self.describe('sql_duration_per_request_seconds', 'histogram', 'Time spent executing SQL statements per request and endpoint.', LATENCY_BUCKETS)
+        self.describe('sql_errors_total', 'counter', 'Number of failed SQL statements.')
+        self.describe('db_lock_errors_total', 'counter', 'Number of SQL statements failed on database lock (lock wait timeout, deadlock, locked SQLite file).')
+        self.describe('ingest_rows_total', 'counter', 'Number of rows ingested per kind (status, operation, product).')
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('METRICS', self.enabled)
+        self.multiproc_dir = app.config.get('METRICS_MULTIPROC_DIR')
+        self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', self.flush_interval)
+        if not self.enabled:
+            return
+        if self.multiproc_dir and not os.path.isdir(self.multiproc_dir):
+            os.makedirs(self.multiproc_dir)
+
+        if not event.contains(Engine, 'before_cursor_execute', self.before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+            event.listen(Engine, 'handle_error', self.handle_error)
+
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.gauges = {}
+            self.histograms = {}
+
+    def describe(self, name, metric_type, description, buckets=None):
+        self.descriptions[name] = (metric_type, description, buckets)
+
+    def register_collector(self, collector):
+        """
+        Register function called on every scrape. It returns list of (name, labels dict, value) gauge samples.
+        """
+        if collector not in self.collectors:
+            self.collectors.append(collector)
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, _labels_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.gauges[(name, _labels_key(labels))] = value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        buckets = self.descriptions.get(name, (None, None, None))[2] or LATENCY_BUCKETS
+        key = (name, _labels_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [list(buckets), [0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(histogram[0]):
+                if value <= bound:
+                    histogram[1][i] += 1
+                    break
+            histogram[2] += value
+            histogram[3] += 1
+
+    # SQLAlchemy engine events
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start_time', []).append(time.time())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.time() - conn.info['query_start_time'].pop()
+        self.inc('sql_queries_total')
+        self.inc('sql_duration_seconds_total', elapsed)
+        if has_request_context() and hasattr(g, 'metrics_sql_count'):
+            g.metrics_sql_count += 1
+            g.metrics_sql_time += elapsed
+
+    def handle_error(self, context):
+        conn = context.connection
+        if conn is not None and conn.info.get('query_start_time'):
+            conn.info['query_start_time'].pop()
+        self.inc('sql_errors_total')
+        message = str(context.original_exception).lower()
+        if any(text in message for text in LOCK_ERRORS):
+            self.inc('db_lock_errors_total')
+
+    # Flask request hooks
+
+    def before_request(self):
+        g.metrics_start_time = time.time()
+        g.metrics_sql_count = 0
+        g.metrics_sql_time = 0.0
+
+    def after_request(self, response):
+        start = getattr(g, 'metrics_start_time', None)
+        if start is None:
+            return response
+        endpoint = request.url_rule.endpoint if request.url_rule is not None else 'unknown'
+        self.observe('http_request_duration_seconds', time.time() - start, endpoint=endpoint)
+        self.inc('http_requests_total', endpoint=endpoint, method=request.method, status=response.status_code)
+        self.observe('sql_queries_per_request', g.metrics_sql_count, endpoint=endpoint)
+        self.observe('sql_duration_per_request_seconds', g.metrics_sql_time, endpoint=endpoint)
+        if self.multiproc_dir and time.time() - self.last_flush > self.flush_interval:
+            self.flush()
+        return response
+
+    # multiprocess storage
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'gauges': [[name, list(labels), value] for (name, labels), value in self.gauges.items()],
+                'histograms': [[name, list(labels), h[0], h[1], h[2], h[3]] for (name, labels), h in self.histograms.items()],
+            }
+
+    def flush(self):
+        """
+        Write values of current process to its file in METRICS_MULTIPROC_DIR.
+        """
+        if not self.flush_lock.acquire(False):
+            return  # other thread is flushing right now
+        try:
+            self.last_flush = time.time()
+            path = os.path.join(self.multiproc_dir, 'metrics_{pid}.json'.format(pid=os.getpid()))
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.snapshot(), f)
+            if os.name == 'nt' and os.path.exists(path):
+                os.remove(path)
+            os.rename(tmp_path, path)
+        except (IOError, OSError) as e:
+            logger.error("unable to write metrics file {path}: {error}".format(path=path, error=e))
+        finally:
+            self.flush_lock.release()
+
+    def aggregate(self):
+        """
+        Return values of all processes (multiprocess mode) or current process only.
+        """
+        if not self.multiproc_dir:
+            return self.snapshot()
+        self.flush()
+        counters, gauges, histograms = {}, {}, {}
+        for path in glob.glob(os.path.join(self.multiproc_dir, 'metrics_*.json')):
+            match = PID_FILE.search(path)
+            alive = match is not None and _pid_alive(int(match.group(1)))
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (IOError, OSError, ValueError) as e:
+                logger.warning("unable to read metrics file {path}: {error}".format(path=path, error=e))
+                continue
+            for name, labels, value in data['counters']:
+                key = (name, tuple(tuple(l) for l in labels))
+                counters[key] = counters.get(key, 0) + value
+            # counters and histograms of exited workers stay in totals so they never go down
+            for name, labels, value in data['gauges'] if alive else []:
+                key = (name, tuple(tuple(l) for l in labels))
+                gauges[key] = max(gauges.get(key, value), value)
+            for name, labels, buckets, counts, total, count in sorted(data['histograms']):
+                key = (name, tuple(tuple(l) for l in labels))
+                h = histograms.get(key)
+                if h is None:
+                    histograms[key] = [buckets, list(counts), total, count]
+                else:
+                    h[1] = [a + b for a, b in zip(h[1], counts)]
+                    h[2] += total
+                    h[3] += count
+        return {
+            'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+            'gauges': [[name, list(labels), value] for (name, labels), value in gauges.items()],
+            'histograms': [[name, list(labels), h[0], h[1], h[2], h[3]] for (name, labels), h in histograms.items()],
+        }
+
+    def render(self):
+        """
+        Return all metrics in Prometheus text exposition format.
+        """
+        data = self.aggregate()
+        for collector in self.collectors:
+            for name, labels, value in collector():
+                data['gauges'].append([name, sorted(labels.items()), value])
+
+        samples = {}
+        for name, labels, value in sorted(data['counters'] + data['gauges']):
+            samples.setdefault(name, []).append('{name}{labels} {value}'.format(name=name, labels=_format_labels(labels), value=_format_value(value)))
+        for name, labels, buckets, counts, total, count in sorted(data['histograms']):
+            lines = samples.setdefault(name, [])
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append('{name}_bucket{labels} {value}'.format(name=name, labels=_format_labels(labels, ('le', _format_value(bound))), value=cumulative))
+            lines.append('{name}_bucket{labels} {value}'.format(name=name, labels=_format_labels(labels, ('le', '+Inf')), value=count))
+            lines.append('{name}_sum{labels} {value}'.format(name=name, labels=_format_labels(labels), value=_format_value(total)))
+            lines.append('{name}_count{labels} {value}'.format(name=name, labels=_format_labels(labels), value=count))
+
+        output = []
+        for name in sorted(samples):
+            metric_type, description, buckets = self.descriptions.get(name, ('untyped', name, None))
+            output.append('# HELP {name} {help}'.format(name=name, help=description))
+            output.append('# TYPE {name} {type}'.format(name=name, type=metric_type))
+            output.extend(samples[name])
+        return '\n'.join(output) + '\n'
@@ -1,21 +1,25 @@
 import hashlib
 import bleach
 import logging
+import threading
 import dateutil.parser
 from datetime import datetime
+from collections import OrderedDict
 from markdown import markdown
 from werkzeug.security import generate_password_hash, check_password_hash
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
 from flask import request, current_app
 from flask_login import UserMixin
+from sqlalchemy.exc import IntegrityError
 from . import db, login_manager
+from .keyset import parse_jump_date
 logger = logging.getLogger(__name__)
 
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
 
-__version__ = '0.7.7'
+__version__ = '0.7.13'
 
 
 class User(UserMixin, db.Model):
@@ -219,6 +223,40 @@ class Product(db.Model):
         """ Return number of bad operations """
         return self.operations.filter(Operation.operation_status_id==2).count()
 
+    @staticmethod
+    def get_counts(product_ids):
+        """
+        Return dictionary product_id -> {status_count_good, status_count_bad, comment_count} for given products.
+        Counts of all products are calculated with two grouped queries instead of queries per product.
+        """
+        counts = dict((product_id, {'status_count_good': 0, 'status_count_bad': 0, 'comment_count': 0}) for product_id in product_ids)
+        if not counts:
+            return counts
+        query = db.session.query(Status.product_id, Status.status, db.func.count(Status.id)).filter(Status.product_id.in_(product_ids)).filter(Status.status.in_([1, 2])).group_by(Status.product_id, Status.status)
+        for product_id, status, count in query:
+            counts[product_id]['status_count_good' if status == 1 else 'status_count_bad'] = count
+        query = db.session.query(Comment.product_id, db.func.count(Comment.id)).filter(Comment.product_id.in_(product_ids)).group_by(Comment.product_id)
+        for product_id, count in query:
+            counts[product_id]['comment_count'] = count
+        return counts
+
+    @staticmethod
+    def find_electronic_stamp(statuses):
+        """ Return Electronic Stamp from already loaded list of product statuses """
+        st55 = [s for s in statuses if s.station_id == 55]
+        return max(st55, key=lambda s: s.id) if st55 else None
+
+    @staticmethod
+    def calculate_processing_time(statuses):
+        """ Return processing time from already loaded list of product statuses """
+        st11 = [s for s in statuses if s.station_id == 11]
+        st55 = [s for s in statuses if s.station_id == 55]
+        if not st11 or not st55:
+            return None
+        end_time = dateutil.parser.parse(max(st55, key=lambda s: s.id).date_time)
+        start_time = dateutil.parser.parse(max(st11, key=lambda s: s.id).date_time)
+        return end_time - start_time
+
     @property
     def electronic_stamp(self):
         """ Return Electronic Stamp"""
@@ -274,16 +312,21 @@ class Station(db.Model):
 
 class Status(db.Model):
     __tablename__ = 'status'
-    id = db.Column(db.BigInteger, nullable=False, unique=True, index=True, primary_key=True, autoincrement=True)
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), nullable=False, unique=True, index=True, primary_key=True, autoincrement=True)
     status = db.Column(db.Integer, db.ForeignKey('operation_status.id'), index=True)
-    date_time = db.Column(db.String(40))
+    date_time = db.Column(db.String(40), index=True)
     product_id = db.Column(db.String(20), db.ForeignKey('product.id'), index=True)
     station_id = db.Column(db.Integer, db.ForeignKey('station.id'), index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
     fail_step = db.Column(db.String(255))
+    fail_step_id = db.Column(db.Integer, db.ForeignKey('fail_step.id'), index=True)
     prodasync = db.Column(db.Integer, index=True, default=0)
+    __table_args__ = (
+        db.Index('ix_status_fail_step_id_date_time', 'fail_step_id', 'date_time'),
+        db.Index('ix_status_station_id_fail_step_id_date_time', 'station_id', 'fail_step_id', 'date_time'),
+    )
 
-    def __init__(self, status, product, station, user=None, date_time=None, fail_step=''):
+    def __init__(self, status, product, station, user=None, date_time=None, fail_step='', fail_step_id=None):
         self.status = status
         self.product_id = product
         self.station_id = station
@@ -292,6 +335,7 @@ class Status(db.Model):
             date_time = datetime.now()
         self.date_time = str(date_time)
         self.fail_step = fail_step
+        self.fail_step_id = fail_step_id
 
     def __repr__(self):
         return '<Status Id: {id} for Product: {product} Station: {station} Status: {status}>'.format(id=self.id, product=self.product_id, station=self.station_id, status=self.status)
@@ -308,6 +352,7 @@ class Status(db.Model):
             'date_time': self.date_time,
             'datetime': self.datetime,
             'fail_step': self.fail_step,
+            'fail_step_id': self.fail_step_id,
         }
 
     @property
@@ -319,10 +364,16 @@ class Status(db.Model):
         """
             get list of operations matching given status (360 seconds diff from operation and status is the limit). 
         """
+        return self.get_operations(self.product.operations.all())
+
+    def get_operations(self, product_operations):
+        """
+            get list of operations matching given status from already loaded list of product operations.
+        """
         time_diff_limit = 360  # time diff limit in seconds
         
         # filter operations with matching station_id
-        operations = filter(lambda x: x.station_id == self.station_id, self.product.operations.all())  
+        operations = filter(lambda x: x.station_id == self.station_id, product_operations)  
         # filter out operations with with time difference bigger than 360 seconds.
         operations = filter(lambda x: (self.datetime - dateutil.parser.parse(x.date_time)).seconds < time_diff_limit, operations)
         
@@ -341,14 +392,111 @@ class Status(db.Model):
         return operations
 
 
+class Fail_Step(db.Model):
+    """
+    Dictionary of fail step descriptions reported with statuses.
+    Every distinct Status.fail_step text is stored once and statuses refer to it by fail_step_id.
+    """
+    __tablename__ = 'fail_step'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), nullable=False, unique=True, index=True)
+    statuses = db.relationship('Status', lazy='dynamic', backref='fail_step_name')
+
+    # process wide LRU cache of interned fail steps: name -> id, bounded by FAIL_STEP_CACHE_SIZE
+    _ids = OrderedDict()
+    _ids_lock = threading.Lock()
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return '<Fail_Step Id: {id} Name: {name}>'.format(id=self.id, name=self.name)
+
+    @property
+    def serialize(self):
+        """Return object data in easily serializeable format"""
+        return {
+            'id': self.id,
+            'name': self.name,
+        }
+
+    @staticmethod
+    def intern(name):
+        """
+        Return id of given fail step description. Description is added to dictionary if not yet present.
+        Empty description returns None.
+        """
+        if not name:
+            return None
+        name = name[:255]
+        with Fail_Step._ids_lock:
+            _id = Fail_Step._ids.pop(name, None)
+            if _id is not None:
+                Fail_Step._ids[name] = _id
+                return _id
+        fail_step = Fail_Step.query.filter_by(name=name).first()
+        if fail_step is None:
+            # dictionary entry is committed in its own transaction so it is visible to other workers at once
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(Fail_Step.__table__.insert().values(name=name))
+            except IntegrityError:
+                logger.debug("fail step: {name} added in the meantime by other worker".format(name=name))
+            fail_step = Fail_Step.query.filter_by(name=name).first()
+        size = current_app.config.get('FAIL_STEP_CACHE_SIZE', 1000)
+        with Fail_Step._ids_lock:
+            Fail_Step._ids[name] = fail_step.id
+            while len(Fail_Step._ids) > size:
+                Fail_Step._ids.popitem(last=False)
+        return fail_step.id
+
+    @staticmethod
+    def on_delete(mapper, connection, target):
+        with Fail_Step._ids_lock:
+            Fail_Step._ids.pop(target.name, None)
+
+    @staticmethod
+    def on_drop(target, connection, **kw):
+        with Fail_Step._ids_lock:
+            Fail_Step._ids.clear()
+
+    @staticmethod
+    def pareto(station_id=None, start_date=None, end_date=None):
+        """
+        Return list of (fail_step_id, name, count, cumulative_percent) ordered by count descending.
+        Aggregation runs on ix_status_(station_id_)fail_step_id_date_time indexes - fail_step text is not scanned.
+        end_date without time includes whole day. Raises ValueError for invalid dates.
+        """
+        query = db.session.query(Status.fail_step_id, db.func.count(Status.id).label('count')).filter(Status.fail_step_id.isnot(None))
+        if station_id:
+            query = query.filter(Status.station_id == station_id)
+        if start_date:
+            query = query.filter(Status.date_time >= str(dateutil.parser.parse(start_date)))
+        if end_date:
+            query = query.filter(Status.date_time < parse_jump_date(end_date))
+        counts = query.group_by(Status.fail_step_id).order_by(db.desc('count')).all()
+        names = dict(db.session.query(Fail_Step.id, Fail_Step.name).filter(Fail_Step.id.in_([c[0] for c in counts])).all()) if counts else {}
+        total = sum(c[1] for c in counts)
+        result = []
+        cumulative = 0
+        for fail_step_id, count in counts:
+            cumulative += count
+            result.append((fail_step_id, names.get(fail_step_id), count, 100.0 * cumulative / total))
+        return result
+
+
+db.event.listen(Fail_Step, 'after_delete', Fail_Step.on_delete)
+db.event.listen(Fail_Step.__table__, 'after_drop', Fail_Step.on_drop)
+
+
 class Operation(db.Model):
     __tablename__ = 'operation'
-    id = db.Column(db.BigInteger, nullable=False, unique=True, index=True, primary_key=True, autoincrement=True)
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), nullable=False, unique=True, index=True, primary_key=True, autoincrement=True)
     product_id = db.Column(db.String(20), db.ForeignKey('product.id'), index=True)
     station_id = db.Column(db.Integer, db.ForeignKey('station.id'), index=True)
     operation_status_id = db.Column(db.Integer, db.ForeignKey('operation_status.id'), index=True)
     operation_type_id = db.Column(db.Integer, db.ForeignKey('operation_type.id'), index=True)
-    date_time = db.Column(db.String(40))
+    date_time = db.Column(db.String(40), index=True)
     prodasync = db.Column(db.Integer, index=True, default=0)
     result_1 = db.Column(db.Float)
     result_1_max = db.Column(db.Float)
@@ -362,6 +510,10 @@ class Operation(db.Model):
     result_3_max = db.Column(db.Float)
     result_3_min = db.Column(db.Float)
     result_3_status_id = db.Column(db.Integer, db.ForeignKey('operation_status.id'), index=True)
+    __table_args__ = (
+        db.Index('ix_operation_station_id_operation_type_id_id', 'station_id', 'operation_type_id', 'id'),
+        db.Index('ix_operation_station_id_operation_status_id_id', 'station_id', 'operation_status_id', 'id'),
+    )
 
     def __init__(self, product, station, operation_status_id, operation_type_id, date_time, r1=None, r1_max=None, r1_min=None, r1_stat=None, r2=None, r2_max=None, r2_min=None, r2_stat=None, r3=None, r3_max=None, r3_min=None, r3_stat=None):
         self.product_id = product
@@ -534,3 +686,105 @@ class Variant(db.Model):
             'name': self.name,
             'description': self.description,
         }
+
+
+class Slow_Query(db.Model):
+    """
+    SQL statements slower than SLOW_QUERY_THRESHOLD stored by slow query log (see app/slowlog.py).
+    """
+    __tablename__ = 'slow_query'
+    id = db.Column(db.Integer, primary_key=True)
+    timestamp = db.Column(db.DateTime, index=True, default=datetime.now)
+    duration = db.Column(db.Float)
+    endpoint = db.Column(db.String(128), index=True)
+    url = db.Column(db.String(255))
+    statement = db.Column(db.Text)
+    parameters = db.Column(db.Text)
+    stack = db.Column(db.Text)
+
+    def __repr__(self):
+        return '<Slow_Query Id: {id} Endpoint: {endpoint} Duration: {duration}>'.format(id=self.id, endpoint=self.endpoint, duration=self.duration)
+
+    @property
+    def serialize(self):
+        """Return object data in easily serializeable format"""
+        return {
+            'id': self.id,
+            'timestamp': str(self.timestamp),
+            'duration': self.duration,
+            'endpoint': self.endpoint,
+            'url': self.url,
+            'statement': self.statement,
+            'parameters': self.parameters,
+            'stack': self.stack.split('\n') if self.stack else [],
+        }
+
+
+class Wip(db.Model):
+    """
+    Work in progress - products with station 11 status and without electronic stamp (station 55 status) yet.
+    Maintained at ingest by WIP tracker (see app/wip.py).
+    """
+    __tablename__ = 'wip'
+    product_id = db.Column(db.String(20), db.ForeignKey('product.id'), primary_key=True)
+    status_id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), db.ForeignKey('status.id'))  # first station 11 status
+    started = db.Column(db.String(40), index=True)  # date_time of first station 11 status
+    product = db.relationship('Product')
+
+    def __init__(self, product, status_id, started):
+        self.product_id = product
+        self.status_id = status_id
+        self.started = started
+
+    def __repr__(self):
+        return '<Wip Product: {product} Started: {started}>'.format(product=self.product_id, started=self.started)
+
+    @property
+    def wip_time(self):
+        """ Return time since product was started """
+        return datetime.now() - dateutil.parser.parse(self.started)
+
+    @property
+    def serialize(self):
+        """Return object data in easily serializeable format"""
+        return {
+            'product_id': self.product_id,
+            'status_id': self.status_id,
+            'started': self.started,
+            'wip_seconds': int(self.wip_time.total_seconds()),
+        }
+
+
+class Archived_Product(db.Model):
+    """
+    Index of products moved to archive database by archival (see app/archive.py) - product id -> archive name.
+    """
+    __tablename__ = 'archived_product'
+    product_id = db.Column(db.String(20), primary_key=True)
+    archive = db.Column(db.String(32), index=True)  # month of product (YYYY-MM) or empty for single archive database
+    archived_at = db.Column(db.DateTime, default=datetime.now)
+
+    def __init__(self, product, archive):
+        self.product_id = product
+        self.archive = archive
+
+    def __repr__(self):
+        return '<Archived_Product {product} Archive: {archive}>'.format(product=self.product_id, archive=self.archive)
+
+
+class Import_Checkpoint(db.Model):
+    """
+    Position of bulk import (manage.py import, see app/importer.py) in its source file.
+    Checkpoint is written in the same transaction as every imported batch, so interrupted import continues after
+    the last committed batch.
+    """
+    __tablename__ = 'import_checkpoint'
+    source = db.Column(db.String(255), primary_key=True)  # absolute path of imported file
+    kind = db.Column(db.String(16))
+    position = db.Column(db.Integer, default=0)  # number of records processed (imported or rejected)
+    imported = db.Column(db.Integer, default=0)
+    rejected = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.now)
+
+    def __repr__(self):
+        return '<Import_Checkpoint {source} Position: {position}>'.format(source=self.source, position=self.position)
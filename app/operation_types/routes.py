@@ -3,20 +3,26 @@ from flask_login import login_required, current_user
 from flask_babel import gettext
 from flask_paginate import Pagination
 from .. import db
-from ..models import Operation_Type
+from ..models import Operation_Type, Operation
+from ..querybudget import query_budget
 from . import operation_types
 from .forms import Operation_TypeForm
 
 
 @operation_types.route('/')
 @login_required
+@query_budget(5)
 def index():
     page = request.args.get('page', 1, type=int)
     per_page = current_app.config['OPERATION_TYPES_PER_PAGE']
     total = Operation_Type.query.count()
-    operation_types = Operation_Type.query.order_by(Operation_Type.id.desc()).paginate(page, per_page, False).items
+    operation_types = Operation_Type.query.order_by(Operation_Type.id.desc()).limit(per_page).offset((page - 1) * per_page).all()
+    operation_type_ids = [o.id for o in operation_types]
+    operation_counts = {}
+    if operation_type_ids:
+        operation_counts = dict(db.session.query(Operation.operation_type_id, db.func.count(Operation.id)).filter(Operation.operation_type_id.in_(operation_type_ids)).group_by(Operation.operation_type_id).all())
     pagination = Pagination(page=page, total=total, record_name='operation_types', per_page=per_page)
-    return render_template('operation_types/index.html', operation_types=operation_types, pagination=pagination)
+    return render_template('operation_types/index.html', operation_types=operation_types, operation_counts=operation_counts, pagination=pagination)
     
 
 @operation_types.route('/<int:id>')
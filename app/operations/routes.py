@@ -1,20 +1,37 @@
 from flask import render_template, flash, redirect, url_for, abort, request, current_app
 from flask_login import login_required, current_user
 from flask_babel import gettext
-from flask_paginate import Pagination
+from werkzeug.datastructures import MultiDict
 from .. import db
-from ..models import Operation
+from ..models import Operation, Station, Operation_Type, Operation_Status
+from ..keyset import KeysetPagination, jump_before
+from ..querybudget import query_budget
+from ..rows import OperationRow
 from . import operations
+from .search import OperationSearch
 
 @operations.route('/')
 @login_required
+@query_budget(9)
 def index():
-    page = request.args.get('page', 1, type=int)
-    per_page = current_app.config['OPERATIONS_PER_PAGE']
-    total = Operation.query.count()
-    operations = Operation.query.order_by(Operation.id.desc()).paginate(page, per_page, False).items
-    pagination = Pagination(page=page, total=total, record_name='operations', per_page=per_page)
-    return render_template('operations/index.html', operations=operations, pagination=pagination)
+    before = request.args.get('before', type=int)
+    after = request.args.get('after', type=int)
+    date = request.args.get('date')
+    try:
+        search = OperationSearch(request.args)
+    except (ValueError, OverflowError):
+        flash(gettext(u'Invalid date filter'))
+        search = OperationSearch(MultiDict())
+    if date:
+        try:
+            before, after = jump_before(Operation, date), None
+        except (ValueError, OverflowError):
+            flash(gettext(u'Invalid date: {date}'.format(date=date)))
+    query = search.apply(OperationRow.query())
+    pagination = KeysetPagination(query, Operation.id, current_app.config['OPERATIONS_PER_PAGE'], before, after, search.args)
+    return render_template('operations/index.html', operations=OperationRow.build(pagination.items), pagination=pagination, search=search,
+                           stations=Station.query.order_by(Station.id).all(), operation_types=Operation_Type.query.order_by(Operation_Type.id).all(),
+                           operation_statuses=Operation_Status.query.order_by(Operation_Status.id).all())
 
 @operations.route('/delete/<int:id>', methods=['GET', 'POST'])
 @login_required
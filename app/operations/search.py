@@ -0,0 +1,66 @@
+import dateutil.parser
+from .. import db
+from ..models import Operation
+from ..keyset import parse_jump_date
+
+
+def out_of_tolerance():
+    """
+    Return condition matching operations with any measured result outside of its min - max range.
+    Results with min == max (no limits configured) are never out of tolerance.
+    """
+    conditions = []
+    for i in (1, 2, 3):
+        value = getattr(Operation, 'result_{0}'.format(i))
+        minimum = getattr(Operation, 'result_{0}_min'.format(i))
+        maximum = getattr(Operation, 'result_{0}_max'.format(i))
+        conditions.append(db.and_(value.isnot(None), minimum != maximum, db.or_(value < minimum, value > maximum)))
+    return db.or_(*conditions)
+
+
+class OperationSearch(object):
+    """
+    Filters of operation list (operations.index and /api/operation) parsed from request arguments:
+    station_id, operation_type_id, operation_status_id, out_of_tolerance=1, date_from and date_to.
+
+    Equality filters are served by (station_id, operation_type_id, id) and (station_id, operation_status_id, id)
+    indexes and single column indexes (which end with id implicitly), so newest first pages are index range scans.
+    Raises ValueError for invalid dates.
+    """
+    FIELDS = ('station_id', 'operation_type_id', 'operation_status_id')
+
+    def __init__(self, args):
+        self.station_id = args.get('station_id', type=int)
+        self.operation_type_id = args.get('operation_type_id', type=int)
+        self.operation_status_id = args.get('operation_status_id', type=int)
+        self.out_of_tolerance = args.get('out_of_tolerance', 0, type=int) == 1
+        self.date_from = args.get('date_from') or None
+        self.date_to = args.get('date_to') or None
+        # date without time - whole day
+        self.date_time_from = str(dateutil.parser.parse(self.date_from)) if self.date_from else None
+        self.date_time_to = parse_jump_date(self.date_to) if self.date_to else None
+
+    @property
+    def args(self):
+        """ Return dictionary of used filters - to be passed to links of other pages """
+        args = dict((name, getattr(self, name)) for name in self.FIELDS if getattr(self, name) is not None)
+        if self.out_of_tolerance:
+            args['out_of_tolerance'] = 1
+        if self.date_from:
+            args['date_from'] = self.date_from
+        if self.date_to:
+            args['date_to'] = self.date_to
+        return args
+
+    def apply(self, query):
+        for name in self.FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                query = query.filter(getattr(Operation, name) == value)
+        if self.out_of_tolerance:
+            query = query.filter(out_of_tolerance())
+        if self.date_time_from:
+            query = query.filter(Operation.date_time >= self.date_time_from)
+        if self.date_time_to:
+            query = query.filter(Operation.date_time < self.date_time_to)
+        return query
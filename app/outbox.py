@@ -0,0 +1,104 @@
+from . import db
+from .models import Product, Status, Operation
+
+# values of prodasync column
+UNSYNCED = 0
+SYNCED = 1
+FAILED = 2
+WAITING = 9  # leased by sync agent
+
+MODELS = {
+    'product': Product,
+    'status': Status,
+    'operation': Operation,
+}
+
+
+def parse_cursor(model, cursor):
+    """
+    Return cursor value in type of model id (integer ids of status and operation, string id of product).
+    """
+    if cursor is None or cursor == '':
+        return None
+    if model is Product:
+        return str(cursor)
+    return int(cursor)
+
+
+def pull(model, after=None, limit=500, lease=False, include_waiting=False):
+    """
+    Return (records, next_cursor) - unsynced records with id greater than after, ordered by id.
+    With lease records are marked WAITING by guarded UPDATE (prodasync still UNSYNCED) and only records this call
+    changed are returned - records leased concurrently by other agent are left out. include_waiting returns already
+    leased records too (agent restarted before acknowledging).
+    """
+    states = [UNSYNCED, WAITING] if include_waiting else [UNSYNCED]
+    query = model.query.filter(model.prodasync.in_(states))
+    if after is not None:
+        query = query.filter(model.id > after)
+    records = query.order_by(model.id.asc()).limit(limit).all()
+    next_cursor = records[-1].id if records else after
+    if lease and records:
+        # state as loaded - records are detached so commit of the lease does not expire (and reload) them
+        loaded = dict((r.id, r.prodasync) for r in records)
+        for r in records:
+            db.session.expunge(r)
+        leased = set(lease_ids(model, [r.id for r in records if loaded[r.id] == UNSYNCED]))
+        records = [r for r in records if loaded[r.id] == WAITING or r.id in leased]
+        for r in records:
+            r.prodasync = WAITING
+    return records, next_cursor
+
+
+def lease_ids(model, ids):
+    """
+    Mark UNSYNCED records with given ids WAITING and commit. Returns ids of records changed by this call.
+    """
+    def update(chunk):
+        return model.query.filter(model.id.in_(chunk)).filter(model.prodasync == UNSYNCED).update({'prodasync': WAITING}, synchronize_session=False)
+
+    if all(update(chunk) == len(chunk) for chunk in chunks(ids, ack_chunk_size())):
+        db.session.commit()
+        return ids
+    # some records were leased by other agent meanwhile - find own ones row by row
+    db.session.rollback()
+    leased = [i for i in ids if update([i]) == 1]
+    db.session.commit()
+    return leased
+
+
+def ack(model, ids, state=SYNCED, only_state=None):
+    """
+    Set prodasync of records with given ids to state. Returns number of updated rows.
+    only_state limits update to records currently in given state.
+    """
+    updated = 0
+    for chunk in chunks(ids, ack_chunk_size()):
+        query = model.query.filter(model.id.in_(chunk))
+        if only_state is not None:
+            query = query.filter(model.prodasync == only_state)
+        updated += query.update({'prodasync': state}, synchronize_session=False)
+    db.session.commit()
+    return updated
+
+
+def release(model, ids=None):
+    """
+    Return leased (WAITING) records back to unsynced state - all of them when ids is None.
+    """
+    if ids is None:
+        updated = model.query.filter(model.prodasync == WAITING).update({'prodasync': UNSYNCED}, synchronize_session=False)
+        db.session.commit()
+        return updated
+    return ack(model, ids, UNSYNCED, only_state=WAITING)
+
+
+def ack_chunk_size():
+    from flask import current_app
+    return current_app.config.get('OUTBOX_ACK_CHUNK', 900)
+
+
+def chunks(ids, size):
+    ids = list(ids)
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
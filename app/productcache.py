@@ -0,0 +1,150 @@
+import time
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+logger = logging.getLogger(__name__)
+
+ProductInfo = namedtuple('ProductInfo', ['id', 'type', 'variant_id'])
+MISSING = object()
+PENDING = 'product_cache_pending'  # Session.info key: product id -> ProductInfo (None to invalidate) at commit
+
+
+class ProductCache(object):
+    """
+    Bounded LRU cache of product existence, type and variant used by ingest path (PRODUCT_CACHE).
+
+    Entries expire after PRODUCT_CACHE_TTL seconds, unknown product ids are remembered for
+    PRODUCT_CACHE_NEGATIVE_TTL seconds only. Cache is filled on lookup and on commit of product insert and
+    invalidated on product update and delete (ORM events, again on commit) - bulk deletes have to call
+    invalidate() themselves. Products inserted by rolled back transaction never get to the cache.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.size = 10000
+        self.ttl = 600
+        self.negative_ttl = 5
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from .models import Product
+        from . import metrics
+        self.enabled = app.config.get('PRODUCT_CACHE', self.enabled)
+        self.size = app.config.get('PRODUCT_CACHE_SIZE', self.size)
+        self.ttl = app.config.get('PRODUCT_CACHE_TTL', self.ttl)
+        self.negative_ttl = app.config.get('PRODUCT_CACHE_NEGATIVE_TTL', self.negative_ttl)
+        self.clear()
+        if not self.enabled:
+            return
+
+        if not event.contains(Product, 'after_insert', self.after_insert):
+            event.listen(Product, 'after_insert', self.after_insert)
+            event.listen(Product, 'after_update', self.after_update)
+            event.listen(Product, 'after_delete', self.after_delete)
+        if not event.contains(Session, 'after_commit', self.after_commit):
+            event.listen(Session, 'after_commit', self.after_commit)
+            event.listen(Session, 'after_rollback', self.after_rollback)
+
+        metrics.describe('product_cache_requests_total', 'counter', 'Number of product cache lookups per result (hit, miss).')
+        metrics.describe('product_cache_size', 'gauge', 'Number of entries in product cache.')
+        metrics.register_collector(self.collect)
+
+    def collect(self):
+        return [('product_cache_size', {}, len(self.entries))]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def put(self, product_id, info, ttl=None):
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        with self.lock:
+            self.entries.pop(product_id, None)
+            self.entries[product_id] = (expires, info)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, product_id=None):
+        """
+        Remove given product id from cache, all entries when product_id is None.
+        """
+        if product_id is None:
+            self.clear()
+            return
+        with self.lock:
+            self.entries.pop(product_id, None)
+
+    def cached(self, product_id):
+        """
+        Return cached ProductInfo, None for known missing product or MISSING when product id is not cached.
+        """
+        with self.lock:
+            entry = self.entries.get(product_id)
+            if entry is None:
+                return MISSING
+            if entry[0] < time.time():
+                del self.entries[product_id]
+                return MISSING
+            # move to the end - most recently used
+            del self.entries[product_id]
+            self.entries[product_id] = entry
+            return entry[1]
+
+    def get(self, product_id):
+        """
+        Return ProductInfo of given product or None when product does not exist.
+        """
+        from . import db, metrics
+        from .models import Product
+        product_id = str(product_id)
+        if self.enabled:
+            info = self.cached(product_id)
+            if info is not MISSING:
+                metrics.inc('product_cache_requests_total', result='hit')
+                return info
+            metrics.inc('product_cache_requests_total', result='miss')
+        row = db.session.query(Product.id, Product.type, Product.variant_id).filter(Product.id == product_id).first()
+        info = ProductInfo(*row) if row is not None else None
+        if self.enabled:
+            self.put(product_id, info, None if info is not None else self.negative_ttl)
+        return info
+
+    def exists(self, product_id):
+        return self.get(product_id) is not None
+
+    # ORM events - changes are remembered in session and applied when it commits
+
+    def pending(self, target):
+        session = object_session(target)
+        return session.info.setdefault(PENDING, {}) if session is not None else {}
+
+    def after_insert(self, mapper, connection, target):
+        self.pending(target)[target.id] = ProductInfo(target.id, target.type, target.variant_id)
+
+    def after_update(self, mapper, connection, target):
+        pending = self.pending(target)
+        for product_id in inspect(target).attrs.id.history.deleted or []:
+            self.invalidate(product_id)
+            pending[product_id] = None
+        self.invalidate(target.id)
+        pending[target.id] = None
+
+    def after_delete(self, mapper, connection, target):
+        self.invalidate(target.id)
+        self.pending(target)[target.id] = None
+
+    def after_commit(self, session):
+        for product_id, info in (session.info.pop(PENDING, None) or {}).items():
+            if info is None:
+                self.invalidate(product_id)
+            else:
+                self.put(product_id, info)
+
+    def after_rollback(self, session):
+        session.info.pop(PENDING, None)
@@ -1,62 +1,68 @@
 from StringIO import StringIO
 import csv
-from flask import render_template, flash, redirect, url_for, abort, request, current_app, make_response
+from flask import render_template, flash, redirect, url_for, abort, request, current_app, make_response, g
 from flask_login import login_required, current_user
 from flask_babel import gettext
 from flask_paginate import Pagination
-from .. import db, babel, cfg
+from .. import db, babel, cfg, wip_tracker, archive, replica
 from ..models import *
+from ..querybudget import query_budget
+from ..replica import use_replica
 from . import products
 from .forms import ProductForm, CommentForm, FindProductForm, FindProductsRangeForm
 
+def filter_products(args):
+    """ Return Product query filtered by arguments of product list and CSV download """
+    query = Product.query
+    if args.get('start_date'):
+        query = query.filter(args['start_date'] <= Product.date_added)
+    if args.get('end_date'):
+        query = query.filter(args['end_date'] >= Product.date_added)
+    if args.get('status'):
+        # include in the list in case any of statuses is equal to searched status_id
+        query = query.filter(Product.statuses.any(Status.status == args['status']))
+    if args.get('operation'):
+        # include in the list in case one of operations is equal to searched operation_id
+        query = query.filter(Product.operations.any(Operation.operation_status_id == args['operation']))
+    if args.get('variant_id'):
+        query = query.filter(args['variant_id'] == Product.variant_id)
+    return query
+
+def product_page(query, page, per_page):
+    """ Return page of product list - newest products first """
+    return query.options(db.joinedload(Product.variant)).order_by(Product.date_added.desc()).limit(per_page).offset((page - 1) * per_page)
+
 @products.route('/')
+@query_budget(6)
+@use_replica
 def index():
     page = request.args.get('page', 1, type=int)
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    status = request.args.get('status')
-    operation = request.args.get('operation')
-    variant_id = request.args.get('variant_id')
     per_page = current_app.config['PRODUCTS_PER_PAGE']
-    query = Product.query
-    if start_date:
-        query = query.filter(start_date <= Product.date_added)
-    if end_date:
-        query = query.filter(end_date >= Product.date_added)
-    if status:
-        # include in the list in case any of statuses is equal to searched status_id
-        query = query.filter(Product.statuses.any(Status.status==status))
-    if operation:
-        # include in the list in case one of operations is equal to searched operation_id
-        query = query.filter(Product.operations.any(Operation.operation_status_id==operation))
-    if variant_id:
-        query = query.filter(variant_id == Product.variant_id)
+    query = filter_products(request.args)
 
     total = query.count()
-    products = query.order_by(Product.date_added.desc()).paginate(page, per_page, False).items
+    products = product_page(query, page, per_page).all()
+    counts = Product.get_counts([p.id for p in products])
     pagination = Pagination(page=page, total=total, record_name='products', per_page=per_page)
-    return render_template('products/index.html', products=products, pagination=pagination, Status=Status, Operation=Operation)
+    return render_template('products/index.html', products=products, counts=counts, pagination=pagination, Status=Status, Operation=Operation)
+
+@products.route('/wip')
+@query_budget(5)
+def wip():
+    """
+    Work in progress - products started at first station and not stamped yet, oldest first.
+    """
+    page = request.args.get('page', 1, type=int)
+    per_page = current_app.config['WIP_PER_PAGE']
+    total, items = wip_tracker.listing(per_page, (page - 1) * per_page)
+    last_stations = wip_tracker.last_stations([w.product_id for w in items])
+    pagination = Pagination(page=page, total=total, record_name='products', per_page=per_page)
+    return render_template('products/wip.html', items=items, last_stations=last_stations, pagination=pagination)
 
 @products.route('/download')
+@use_replica
 def download(start_date=None, end_date=None, status=None, operation=None):
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    status = request.args.get('status')
-    operation = request.args.get('operation')
-    variant_id = request.args.get('variant_id')
-    query = Product.query
-    if start_date and start_date!='':
-        query = query.filter(start_date <= Product.date_added)
-    if end_date and end_date!='':
-        query = query.filter(end_date >= Product.date_added)
-    if status and status!='':
-        # include in the list in case any of statuses is equal to searched status_id
-        query = query.filter(Product.statuses.any(Status.status==status))
-    if operation and operation!='':
-        # include in the list in case one of operations is equal to searched operation_id
-        query = query.filter(Product.operations.any(Operation.operation_status_id==operation))
-    if variant_id:
-        query = query.filter(variant_id == Product.variant_id)
+    query = filter_products(request.args)
 
     csv_header = ['Id', 'Type', 'Serial', 'Variant', 'Date Added', 'Week', 'Year', 'Success Statuses', 'Failed Statuses', 'Success Operations', 'Failed Operations']
     buffer = StringIO()
@@ -126,11 +132,34 @@ def find_product():
     return render_template('products/find_product.html', basic_search_form=basic_search_form, detailed_search_form=detailed_search_form)
 
 @products.route('/product/<id>', methods=['GET', 'POST'])
+@query_budget(14)
+@use_replica
 def product(id):
-    product = Product.query.get_or_404(id)
+    session = db.session
+    archived = False
+    product = Product.query.get(id)
+    if product is None and replica.routed():
+        g.db_replica = False  # product not replicated yet - read it from primary
+        product = Product.query.get(id)
+    if product is None:
+        product, session = archive.find(id)
+        if product is None:
+            abort(404)
+        archived = True
+    try:
+        return render_product(product, session, archived)
+    finally:
+        if archived:
+            session.close()
+
+
+def render_product(product, session, archived=False):
+    """
+    Render product page - session is db.session or session of archive database holding the product.
+    """
     comment = None
     form = None
-    if current_user.is_authenticated:
+    if current_user.is_authenticated and not archived:
         form = CommentForm()
         if form.validate_on_submit():
             comment = Comment(body=form.body.data, product=product, author=current_user)
@@ -143,13 +172,33 @@ def product(id):
     page = request.args.get('page', 1, type=int)
     per_page = current_app.config['COMMENTS_PER_PAGE']
     total = product.comments.count()
-    comments = product.comments.order_by(Comment.timestamp.asc()).paginate(page, per_page, False).items
+    comments = product.comments.order_by(Comment.timestamp.asc()).limit(per_page).offset((page - 1) * per_page).all()
     pagination = Pagination(page=page, total=total, record_name='comments', per_page=per_page)
-    stations = {}
+
+    # load whole history of product at once - template must not issue queries per status or operation
+    statuses = product.statuses.order_by(Status.id.asc()).all()
+    operations = product.operations.order_by(Operation.id.asc()).all()
+    # reference tables are small - keep them in session identity map so relationships are resolved without queries
+    references = [session.query(model).all() for model in (Station, Operation_Status, Operation_Type, Unit)]
+    user_ids = set(s.user_id for s in statuses if s.user_id is not None)
+    if user_ids:
+        references.append(session.query(User).filter(User.id.in_(user_ids)).all())
+    status_operations = dict((s.id, s.get_operations(operations)) for s in statuses)
+    summary = {
+        'status_count': len(statuses),
+        'status_count_good': len([s for s in statuses if s.status == 1]),
+        'status_count_bad': len([s for s in statuses if s.status == 2]),
+        'operation_count': len(operations),
+        'operation_count_good': len([o for o in operations if o.operation_status_id == 1]),
+        'operation_count_bad': len([o for o in operations if o.operation_status_id == 2]),
+        'electronic_stamp': Product.find_electronic_stamp(statuses),
+        'processing_time': Product.calculate_processing_time(statuses),
+        'comment_count': total,
+    }
     headers = {}
     if current_user.is_authenticated:
         headers['X-XSS-Protection'] = '0'
-    return render_template('products/product.html', product=product, form=form, comments=comments, pagination=pagination, Status=Status, Operation=Operation), 200, headers
+    return render_template('products/product.html', product=product, form=form, comments=comments, pagination=pagination, statuses=statuses, status_operations=status_operations, summary=summary, archived=archived, Status=Status, Operation=Operation), 200, headers
 
 @products.route('/edit/<id>', methods=['GET', 'POST'])
 @login_required
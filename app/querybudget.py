@@ -0,0 +1,104 @@
+import re
+import logging
+import threading
+from functools import wraps
+from collections import Counter
+from flask import current_app, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAMETER = re.compile(r"%\([^)]+\)s|%s|:\w+")
+_PARAMETER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def statement_shape(statement):
+    """
+    Return statement with literals and parameters replaced by ? - statements differing only by values share the shape.
+    """
+    shape = _STRING_LITERAL.sub('?', statement)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    shape = _PARAMETER.sub('?', shape)
+    shape = _PARAMETER_LIST.sub('(?)', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    for counter in getattr(_local, 'counters', ()):
+        counter.statements.append(statement)
+
+
+class QueryCounter(object):
+    """
+    Context manager counting SQL statements executed by current thread.
+
+        with QueryCounter() as counter:
+            Product.query.all()
+        counter.count  # 1
+    """
+
+    def __init__(self):
+        self.statements = []
+
+    def __enter__(self):
+        if not event.contains(Engine, 'after_cursor_execute', _after_cursor_execute):
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        if not hasattr(_local, 'counters'):
+            _local.counters = []
+        _local.counters.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        _local.counters.remove(self)
+        return False
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def repeated(self):
+        """
+        Return list of (shape, count) of statements executed more than once - most repeated first.
+        """
+        shapes = Counter(statement_shape(s) for s in self.statements)
+        return [(shape, count) for shape, count in shapes.most_common() if count > 1]
+
+
+def query_budget(budget):
+    """
+    View decorator declaring maximal number of SQL statements executed by the view (including template rendering).
+    QUERY_BUDGET_MODE decides what happens when the budget is exceeded:
+    - 'raise' - QueryBudgetExceeded is raised (testing),
+    - 'warn' - warning naming the most repeated statement shape is logged (development),
+    - None - statements are not counted at all (production).
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            mode = current_app.config.get('QUERY_BUDGET_MODE')
+            if not mode:
+                return f(*args, **kwargs)
+            with QueryCounter() as counter:
+                rv = f(*args, **kwargs)
+            if counter.count > budget:
+                repeated = counter.repeated()
+                shape = "{count}x {shape}".format(count=repeated[0][1], shape=repeated[0][0]) if repeated else "no repeated statements"
+                message = "query budget exceeded for {endpoint}: {count} statements, budget {budget}. Most repeated: {shape}".format(
+                    endpoint=request.endpoint, count=counter.count, budget=budget, shape=shape)
+                if mode == 'raise':
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+            return rv
+        decorated_function.query_budget = budget
+        return decorated_function
+    return decorator
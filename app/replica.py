@@ -0,0 +1,150 @@
+import time
+import logging
+import threading
+from datetime import datetime
+from functools import wraps
+import dateutil.parser
+from flask import g, request, has_app_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+from sqlalchemy.exc import SQLAlchemyError
+
+logger = logging.getLogger(__name__)
+
+BIND = 'replica'
+
+
+class RoutingSession(SignallingSession):
+    """
+    Session reading from read replica in requests routed to it by @use_replica. Flushes always go to primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        from . import replica
+        if not self._flushing and replica.routed():
+            return replica.engine
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, info, options):
+        from . import engine_profiles
+        SQLAlchemy.apply_driver_hacks(self, app, info, options)
+        engine_profiles.apply(app, info, options)
+
+    def get_engine(self, app=None, bind=None):
+        from . import engine_profiles
+        app = self.get_app(app)
+        engine = SQLAlchemy.get_engine(self, app, bind)
+        engine_profiles.setup(app, engine)
+        return engine
+
+
+def use_replica(f):
+    """
+    Route reads of GET request to read replica unless it lags more than REPLICA_MAX_LAG - for heavy read views.
+    Writes and views without this decorator (ingest, interlock reads of PLC API) always use primary database.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        from . import replica
+        if request.method != 'GET':
+            return f(*args, **kwargs)
+        replica.route(replica.available())
+        try:
+            return f(*args, **kwargs)
+        finally:
+            g.db_replica = False
+    return decorated
+
+
+class ReadReplica(object):
+    """
+    Read replica of main database (REPLICA_DATABASE_URI) - SQLALCHEMY_BINDS 'replica'.
+
+    Views decorated by @use_replica read from replica. Replication lag is measured as age of the oldest status
+    present in primary and missing in replica (0 when replica has the newest status) - it needs no replication
+    privileges and works for any pair of databases, eg. two SQLite files. Lag is checked at most once per
+    REPLICA_LAG_CHECK_INTERVAL seconds; replica lagging more than REPLICA_MAX_LAG seconds or not reachable
+    is not used - requests fall back to primary.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.max_lag = 30
+        self.check_interval = 5
+        self.lock = threading.Lock()
+        self.checked = 0
+        self.usable = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from . import metrics
+        uri = app.config.get('REPLICA_DATABASE_URI')
+        self.enabled = bool(uri)
+        self.max_lag = app.config.get('REPLICA_MAX_LAG', self.max_lag)
+        self.check_interval = app.config.get('REPLICA_LAG_CHECK_INTERVAL', self.check_interval)
+        self.checked = 0
+        self.usable = False
+        if not self.enabled:
+            return
+        app.config['SQLALCHEMY_BINDS'] = dict(app.config.get('SQLALCHEMY_BINDS') or {}, **{BIND: uri})
+        metrics.describe('db_replica_lag_seconds', 'gauge', 'Replication lag of read replica measured by last check (-1 when not reachable).')
+        metrics.describe('db_replica_requests_total', 'counter', 'Number of requests of replica routed views per database used (replica, primary).')
+
+    @property
+    def engine(self):
+        from . import db
+        return db.get_engine(bind=BIND)
+
+    def route(self, use):
+        from . import metrics
+        g.db_replica = use
+        metrics.inc('db_replica_requests_total', target='replica' if use else 'primary')
+
+    def routed(self):
+        """ Return True when reads of current request go to replica """
+        return self.enabled and has_app_context() and g.get('db_replica', False)
+
+    def lag(self):
+        """
+        Return replication lag in seconds, None when replica is not reachable.
+        """
+        from . import db
+        from .models import Status
+        table = Status.__table__
+        try:
+            with self.engine.connect() as connection:
+                replicated = connection.execute(db.select([db.func.max(table.c.id)])).scalar() or 0
+            with db.engine.connect() as connection:
+                missing = connection.execute(db.select([table.c.date_time]).where(table.c.id > replicated).order_by(table.c.id).limit(1)).scalar()
+        except SQLAlchemyError, e:
+            logger.warning("read replica not reachable: {error}".format(error=e))
+            return None
+        if missing is None:
+            return 0.0
+        try:
+            return max((datetime.now() - dateutil.parser.parse(missing)).total_seconds(), 0.0)
+        except (ValueError, OverflowError):
+            return None
+
+    def available(self):
+        """ Return True when replica may be used - lag is checked at most once per check_interval """
+        from . import metrics
+        if not self.enabled:
+            return False
+        with self.lock:
+            if time.time() - self.checked < self.check_interval:
+                return self.usable
+            self.checked = time.time()
+        lag = self.lag()
+        usable = lag is not None and lag <= self.max_lag
+        if usable != self.usable:
+            logger.warning("read replica {state} (lag: {lag})".format(state='used' if usable else 'not used - reading from primary', lag=lag))
+        self.usable = usable
+        metrics.set('db_replica_lag_seconds', -1 if lag is None else lag)
+        return usable
@@ -0,0 +1,84 @@
+from . import db
+from .models import Status, Operation, Station, Operation_Status, Operation_Type
+
+
+class Row(object):
+    """
+    Lightweight read-only row of list page - projected columns and reference names resolved in bulk.
+    Rows are not tracked by session identity map and touching them never issues a query.
+    """
+    __slots__ = ()
+    model = None
+    columns = ()
+
+    def __init__(self, values):
+        for name, value in zip(self.columns, values):
+            setattr(self, name, value)
+
+    @classmethod
+    def query(cls):
+        """ Return query of projected columns - usable with KeysetPagination """
+        return db.session.query(*[getattr(cls.model, name) for name in cls.columns])
+
+    @classmethod
+    def build(cls, records):
+        rows = [cls(values) for values in records]
+        cls.resolve(rows)
+        return rows
+
+    @classmethod
+    def resolve(cls, rows):
+        pass
+
+
+class StatusRow(Row):
+    model = Status
+    columns = ('id', 'status', 'product_id', 'station_id', 'user_id', 'date_time', 'fail_step', 'prodasync')
+    __slots__ = columns + ('status_name', 'station_name')
+
+    @classmethod
+    def resolve(cls, rows):
+        status_names = names(Operation_Status, [r.status for r in rows])
+        station_names = names(Station, [r.station_id for r in rows])
+        for r in rows:
+            r.status_name = status_names.get(r.status)
+            r.station_name = station_names.get(r.station_id)
+
+
+class OperationRow(Row):
+    model = Operation
+    columns = ('id', 'product_id', 'station_id', 'operation_status_id', 'operation_type_id', 'date_time', 'prodasync',
+               'result_1', 'result_1_min', 'result_1_max', 'result_1_status_id',
+               'result_2', 'result_2_min', 'result_2_max', 'result_2_status_id',
+               'result_3', 'result_3_min', 'result_3_max', 'result_3_status_id')
+    __slots__ = columns + ('operation_status_name', 'operation_type_name', 'station_name', 'results')
+
+    @classmethod
+    def resolve(cls, rows):
+        status_ids = []
+        for r in rows:
+            status_ids.extend([r.operation_status_id, r.result_1_status_id, r.result_2_status_id, r.result_3_status_id])
+        status_names = names(Operation_Status, status_ids)
+        type_names = names(Operation_Type, [r.operation_type_id for r in rows])
+        station_names = names(Station, [r.station_id for r in rows])
+        for r in rows:
+            r.operation_status_name = status_names.get(r.operation_status_id)
+            r.operation_type_name = type_names.get(r.operation_type_id)
+            r.station_name = station_names.get(r.station_id)
+            # (value, min, max, status name) of results which were measured
+            r.results = []
+            for i in (1, 2, 3):
+                value, status_id = getattr(r, 'result_{0}'.format(i)), getattr(r, 'result_{0}_status_id'.format(i))
+                if value is None and not status_id:
+                    continue
+                r.results.append((value, getattr(r, 'result_{0}_min'.format(i)), getattr(r, 'result_{0}_max'.format(i)), status_names.get(status_id)))
+
+
+def names(model, ids):
+    """
+    Return dict id -> name of given reference records (station, operation status, operation type) - one query.
+    """
+    ids = set(i for i in ids if i is not None)
+    if not ids:
+        return {}
+    return dict(db.session.query(model.id, model.name).filter(model.id.in_(ids)).all())
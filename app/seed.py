@@ -0,0 +1,229 @@
+import time
+import random
+import logging
+from datetime import datetime, timedelta
+from . import db
+from .engineprofile import synchronous_off
+from .models import Product, Status, Operation, Station, Variant, Unit, Operation_Type, Operation_Status, Fail_Step, Comment, Wip
+
+logger = logging.getLogger(__name__)
+
+STATIONS = [10 * line + position for line in range(1, 6) for position in range(1, 6)]  # 11..15, 21..25, ..., 51..55
+STATUS_OK = 1
+STATUS_NOK = 2
+FAIL_STEPS = [u'leak test', u'torque', u'pressure', u'angle', u'vision check', u'missing part', u'label print', u'press fit force']
+UNITS = [(1, u'Newton metre', u'Nm'), (2, u'bar', u'bar'), (3, u'degree', u'deg'), (4, u'millimetre', u'mm'), (5, u'Newton', u'N')]
+PRODUCT_TYPE = 1000000000
+
+
+class HistoryGenerator(object):
+    """
+    Deterministic generator of synthetic production history - same arguments give the same rows in every database.
+
+    Every product passes stations 11..55 in order. Station test is repeated with probability repeat_rate
+    (operator restarted test), fails with probability nok_rate and failed test is reworked up to max_reworks
+    times - product with last attempt failed is scrapped and does not reach further stations.
+    Each status carries operations_min..operations_max operations with results spread around nominal value
+    so that some of them end up near or beyond result_N_max/result_N_min.
+
+    Rows are inserted with Core executemany in chunks of chunk_size rows - ORM objects are not created at all.
+    """
+
+    def __init__(self, products=1000, variants=4, operations_min=10, operations_max=30, operation_types=40,
+                 nok_rate=0.02, repeat_rate=0.03, max_reworks=2, comment_rate=0.01, seed=0,
+                 start=datetime(2018, 1, 1, 6, 0, 0), takt=45, chunk_size=20000):
+        self.products = products
+        self.variants = variants
+        self.operations_min = operations_min
+        self.operations_max = operations_max
+        self.operation_types = operation_types
+        self.nok_rate = nok_rate
+        self.repeat_rate = repeat_rate
+        self.max_reworks = max_reworks
+        self.comment_rate = comment_rate
+        self.seed = seed
+        self.start = start
+        self.takt = takt  # seconds between products entering the line
+        self.chunk_size = chunk_size
+        self.random = random.Random(seed)
+        self.counts = {'product': 0, 'status': 0, 'operation': 0, 'comments': 0}
+        self.fail_steps = {}
+        self.limits = {}
+        for operation_type_id in range(1, operation_types + 1):
+            self.limits[operation_type_id] = [self.nominal(operation_type_id, result) for result in range(3)]
+        self.types = dict((station_id, self.station_operation_types(station_id)) for station_id in STATIONS)
+
+    def nominal(self, operation_type_id, result):
+        """
+        Return (nominal, tolerance half-width, min, max, column names) of given operation type result.
+        """
+        r = random.Random(self.seed * 1000003 + operation_type_id * 7 + result)
+        nominal = round(r.uniform(1.0, 100.0), 1)
+        tolerance = round(nominal * r.uniform(0.02, 0.1), 2)
+        n = result + 1
+        keys = ('result_{0}'.format(n), 'result_{0}_max'.format(n), 'result_{0}_min'.format(n), 'result_{0}_status_id'.format(n))
+        return nominal, tolerance, round(nominal - tolerance, 3), round(nominal + tolerance, 3), keys
+
+    def add_references(self, connection):
+        """
+        Insert reference rows (stations, variants, units, operation types and statuses, fail steps) not present yet.
+        """
+        def missing(table, rows):
+            existing = set(r[0] for r in connection.execute(db.select([table.c.id])))
+            rows = [row for row in rows if row['id'] not in existing]
+            if rows:
+                connection.execute(table.insert(), rows)
+
+        missing(Unit.__table__, [{'id': i, 'name': name, 'symbol': symbol, 'description': name} for i, name, symbol in UNITS])
+        missing(Operation_Status.__table__, [
+            {'id': STATUS_OK, 'name': u'OK', 'description': u'OK', 'unit_id': None},
+            {'id': STATUS_NOK, 'name': u'NOK', 'description': u'NOK', 'unit_id': None},
+        ])
+        missing(Variant.__table__, [{'id': i, 'name': u'Variant {0}'.format(i), 'description': u'Variant {0}'.format(i)} for i in range(1, self.variants + 1)])
+        missing(Operation_Type.__table__, [{'id': i, 'name': u'Operation {0}'.format(i), 'description': u'Operation {0}'.format(i)} for i in range(1, self.operation_types + 1)])
+        missing(Station.__table__, [{'id': i, 'ip': u'192.168.0.{0}'.format(i), 'name': u'Station {0}'.format(i), 'port': 102, 'rack': 0, 'slot': 2} for i in STATIONS])
+
+        fail_step = Fail_Step.__table__
+        existing = set(r[0] for r in connection.execute(db.select([fail_step.c.name])))
+        rows = [{'name': name} for name in FAIL_STEPS if name not in existing]
+        if rows:
+            connection.execute(fail_step.insert(), rows)
+        self.fail_steps = dict((name, id) for id, name in connection.execute(db.select([fail_step.c.id, fail_step.c.name])) if name in FAIL_STEPS)
+
+    def station_operation_types(self, station_id):
+        """
+        Return operation types executed at given station - every station has its own deterministic subset.
+        """
+        r = random.Random(self.seed * 1000003 + station_id)
+        return r.sample(range(1, self.operation_types + 1), min(self.operation_types, 8))
+
+    def operation(self, product_id, station_id, operation_type_id, date_time, fail):
+        rnd = self.random
+        row = {
+            'product_id': product_id,
+            'station_id': station_id,
+            'operation_type_id': operation_type_id,
+            'date_time': date_time,
+            'prodasync': 0,
+        }
+        operation_status = STATUS_OK
+        for i, (nominal, tolerance, low, high, keys) in enumerate(self.limits[operation_type_id]):
+            if fail and i == 0:
+                value = nominal + rnd.choice((-1, 1)) * tolerance * rnd.uniform(1.01, 1.3)
+            else:
+                value = rnd.gauss(nominal, tolerance * 0.35)
+            status = STATUS_OK if low <= value <= high else STATUS_NOK
+            if status == STATUS_NOK:
+                operation_status = STATUS_NOK
+            row[keys[0]] = round(value, 3)
+            row[keys[1]] = high
+            row[keys[2]] = low
+            row[keys[3]] = status
+        row['operation_status_id'] = operation_status
+        return row
+
+    def product_history(self, index):
+        """
+        Return (product row, status rows, operation rows, comment rows) of index-th product.
+        """
+        rnd = self.random
+        entered = self.start + timedelta(seconds=index * self.takt)
+        week = entered.isocalendar()[1]
+        year = entered.year % 100
+        serial = index % 1000000
+        variant_id = index % self.variants + 1
+        product_id = Product.calculate_product_id(PRODUCT_TYPE, serial, week, year)
+        product = {
+            'id': product_id,
+            'type': str(PRODUCT_TYPE),
+            'serial': str(serial).zfill(6),
+            'week': str(week).zfill(2),
+            'year': str(year).zfill(2),
+            'variant_id': variant_id,
+            'prodasync': 0,
+            'date_added': entered,
+        }
+        statuses, operations, comments = [], [], []
+        date_time = entered
+        for station_id in STATIONS:
+            types = self.types[station_id]
+            attempts = 0
+            while True:
+                date_time += timedelta(seconds=rnd.randint(20, 60))
+                fail = rnd.random() < self.nok_rate
+                repeat = not fail and rnd.random() < self.repeat_rate
+                fail_step = rnd.choice(FAIL_STEPS) if fail else u''
+                stamp = str(date_time)
+                statuses.append({
+                    'status': STATUS_NOK if fail else STATUS_OK,
+                    'date_time': stamp,
+                    'product_id': product_id,
+                    'station_id': station_id,
+                    'user_id': None,
+                    'fail_step': fail_step,
+                    'fail_step_id': self.fail_steps[fail_step] if fail else None,
+                    'prodasync': 0,
+                })
+                count = rnd.randint(self.operations_min, self.operations_max)
+                for i in range(count):
+                    operations.append(self.operation(product_id, station_id, types[i % len(types)], stamp, fail and i == count - 1))
+                attempts += 1
+                if not (fail or repeat) or attempts > self.max_reworks:
+                    break
+            if fail:
+                comments.append({'body': u'{0} failed at station {1} - scrapped'.format(fail_step, station_id), 'body_html': None, 'timestamp': date_time, 'product_id': product_id, 'author_id': None})
+                break  # scrapped
+        if rnd.random() < self.comment_rate:
+            comments.append({'body': u'Sample taken for audit', 'body_html': None, 'timestamp': date_time, 'product_id': product_id, 'author_id': None})
+        return product, statuses, operations, comments
+
+    def run(self, engine=None, progress=None):
+        """
+        Generate and insert whole history. Returns dictionary with number of inserted rows per table.
+        progress is called with counts dictionary after every flushed chunk.
+        """
+        engine = engine or db.engine
+        tables = {
+            'product': Product.__table__,
+            'status': Status.__table__,
+            'operation': Operation.__table__,
+            'comments': Comment.__table__,
+        }
+        with engine.begin() as connection:
+            self.add_references(connection)
+
+        buffers = dict((name, []) for name in tables)
+        started = time.time()
+
+        def flush():
+            with engine.connect() as connection, synchronous_off(connection), connection.begin():
+                for name in ('product', 'status', 'operation', 'comments'):  # parents first - foreign keys
+                    if buffers[name]:
+                        connection.execute(tables[name].insert(), buffers[name])
+                        self.counts[name] += len(buffers[name])
+                        buffers[name] = []
+            if progress is not None:
+                progress(self.counts, time.time() - started)
+
+        for index in range(self.products):
+            product, statuses, operations, comments = self.product_history(index)
+            buffers['product'].append(product)
+            buffers['status'].extend(statuses)
+            buffers['operation'].extend(operations)
+            buffers['comments'].extend(comments)
+            if len(buffers['operation']) + len(buffers['status']) >= self.chunk_size:
+                flush()
+        flush()
+        logger.info("seeded {products} products, {statuses} statuses, {operations} operations in {time:.1f}s".format(
+            products=self.counts['product'], statuses=self.counts['status'], operations=self.counts['operation'], time=time.time() - started))
+        return self.counts
+
+
+def clear_history(engine=None):
+    """
+    Delete all products with their statuses, operations and comments.
+    """
+    engine = engine or db.engine
+    with engine.begin() as connection:
+        for table in (Wip.__table__, Comment.__table__, Operation.__table__, Status.__table__, Product.__table__):
+            connection.execute(table.delete())
@@ -0,0 +1,169 @@
+import os
+import sys
+import time
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from flask import request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+THIS_FILE = os.path.splitext(os.path.abspath(__file__))[0]
+
+
+def get_call_site(limit=8):
+    """
+    Return trimmed stack of application frames (views, models, templates) which caused current SQL statement.
+    Template frames are reported with template line numbers. Most recent call is last.
+    """
+    stack = []
+    frame = sys._getframe(1)
+    while frame is not None and len(stack) < limit:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(APP_DIR) and os.path.splitext(filename)[0] != THIS_FILE:
+            template = frame.f_globals.get('__jinja_template__')
+            if template is not None:
+                lineno = template.get_corresponding_lineno(frame.f_lineno)
+                name = 'template'
+            else:
+                lineno = frame.f_lineno
+                name = frame.f_code.co_name
+            stack.append('{file}:{line} {name}'.format(file=os.path.relpath(filename, APP_DIR), line=lineno, name=name))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+class SlowQuery(object):
+    __slots__ = ('timestamp', 'duration', 'endpoint', 'url', 'statement', 'parameters', 'stack')
+
+    def __init__(self, timestamp, duration, endpoint, url, statement, parameters, stack):
+        self.timestamp = timestamp
+        self.duration = duration
+        self.endpoint = endpoint
+        self.url = url
+        self.statement = statement
+        self.parameters = parameters
+        self.stack = stack
+
+    @property
+    def serialize(self):
+        """Return object data in easily serializeable format"""
+        return {
+            'timestamp': str(self.timestamp),
+            'duration': self.duration,
+            'endpoint': self.endpoint,
+            'url': self.url,
+            'statement': self.statement,
+            'parameters': self.parameters,
+            'stack': self.stack,
+        }
+
+
+class SlowQueryLog(object):
+    """
+    Log of SQL statements slower than SLOW_QUERY_THRESHOLD seconds.
+    Every slow statement is stored with endpoint, parameters, duration and trimmed application stack in bounded
+    ring buffer (SLOW_QUERY_LOG_SIZE entries). With SLOW_QUERY_LOG_TABLE enabled entries are also written
+    to slow_query table at the end of request, threads without requests call flush() themselves (ingest writer
+    after every batch). Entries waiting for flush are bounded by SLOW_QUERY_LOG_SIZE per thread - oldest are dropped.
+    """
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.enabled = True
+        self.threshold = 0.5
+        self.persist = False
+        self.entries = deque(maxlen=500)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('SLOW_QUERY_LOG', self.enabled)
+        self.threshold = app.config.get('SLOW_QUERY_THRESHOLD', self.threshold)
+        self.persist = app.config.get('SLOW_QUERY_LOG_TABLE', self.persist)
+        self.entries = deque(maxlen=app.config.get('SLOW_QUERY_LOG_SIZE', self.entries.maxlen))
+        if not self.enabled:
+            return
+
+        if not event.contains(Engine, 'before_cursor_execute', self.before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+            event.listen(Engine, 'handle_error', self.handle_error)
+
+        app.teardown_request(self.teardown_request)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('slow_query_start_time', []).append(time.time())
+
+    def handle_error(self, context):
+        # failed statement gets no after_cursor_execute
+        conn = context.connection
+        if conn is not None and conn.info.get('slow_query_start_time'):
+            conn.info['slow_query_start_time'].pop()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.time() - conn.info['slow_query_start_time'].pop()
+        if not self.enabled or duration < self.threshold or getattr(self.local, 'storing', False):
+            return
+        endpoint, url = None, None
+        if has_request_context():
+            endpoint = request.endpoint
+            url = request.full_path
+        entry = SlowQuery(datetime.now(), duration, endpoint, url, statement[:4000], repr(parameters)[:1000], get_call_site())
+        logger.warning("slow query ({duration:.3f}s) at {endpoint}: {statement}".format(duration=duration, endpoint=endpoint, statement=statement[:200]))
+        with self.lock:
+            self.entries.append(entry)
+        if self.persist:
+            pending = getattr(self.local, 'pending', None)
+            if pending is None:
+                pending = self.local.pending = deque(maxlen=self.entries.maxlen)
+            pending.append(entry)
+
+    def teardown_request(self, exception=None):
+        self.flush()
+
+    def flush(self):
+        """
+        Write slow queries logged by current thread to slow_query table (SLOW_QUERY_LOG_TABLE).
+        """
+        pending = getattr(self.local, 'pending', None)
+        if not pending:
+            return
+        self.local.pending = None
+        from . import db
+        from .models import Slow_Query
+        self.local.storing = True
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(Slow_Query.__table__.insert(), [{
+                    'timestamp': e.timestamp,
+                    'duration': e.duration,
+                    'endpoint': e.endpoint,
+                    'url': e.url,
+                    'statement': e.statement,
+                    'parameters': e.parameters,
+                    'stack': '\n'.join(e.stack),
+                } for e in pending])
+        except Exception as e:
+            logger.error("unable to store slow queries: {error}".format(error=e))
+        finally:
+            self.local.storing = False
+
+    def get_entries(self):
+        """
+        Return logged slow queries - most recent first.
+        """
+        with self.lock:
+            entries = list(self.entries)
+        entries.reverse()
+        return entries
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
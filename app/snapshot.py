@@ -0,0 +1,228 @@
+import os
+import gzip
+import time
+import shutil
+import logging
+import threading
+from datetime import datetime
+from sqlalchemy import create_engine, event, MetaData, Table, Column, String, BigInteger, Integer, DateTime
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from .archive import USER_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+SUFFIX = '.sqlite.gz'
+# append-only tables with increasing integer ids - incremental snapshot copies only rows past high-water mark
+APPEND_TABLES = ('status', 'operation', 'fail_step', 'slow_query')
+
+snapshot_metadata = MetaData()
+snapshot_info = Table(
+    'snapshot_info', snapshot_metadata,
+    Column('table_name', String(64), primary_key=True),
+    Column('high_water', BigInteger),
+    Column('rows', Integer),
+    Column('taken_at', DateTime),
+)
+
+
+def query_only(dbapi_connection, connection_record):
+    dbapi_connection.execute('PRAGMA query_only = ON')
+
+
+class SnapshotStore(object):
+    """
+    Consistent snapshots of the whole database for analysis (SNAPSHOT_DIRECTORY).
+
+    take() copies all tables of the main database (MySQL or SQLite) into new SQLite file with the same schema and
+    gzips it. Tables are read in one transaction (START TRANSACTION WITH CONSISTENT SNAPSHOT on MySQL, BEGIN on
+    SQLite - writers wait for the copy), in chunks of SNAPSHOT_CHUNK_SIZE rows by primary key. Users are copied
+    without credentials. snapshot_info table of the snapshot keeps id high-water mark of every table.
+
+    Incremental snapshot starts from previous snapshot, appends rows of APPEND_TABLES past its high-water marks
+    (last SNAPSHOT_OVERLAP rows are copied again - ids of transactions committed late) and copies other tables whole.
+    Rows deleted from append-only tables meanwhile (eg. archived) stay in incremental snapshot.
+
+    mount() gives read-only engine of snapshot. With SNAPSHOT_MOUNT set the whole application runs read-only on it.
+    """
+
+    def __init__(self, app=None):
+        self.directory = None
+        self.chunk_size = 10000
+        self.overlap = 1000
+        self.lock = threading.Lock()
+        self.engines = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from . import db
+        self.directory = app.config.get('SNAPSHOT_DIRECTORY', self.directory)
+        self.chunk_size = app.config.get('SNAPSHOT_CHUNK_SIZE', self.chunk_size)
+        self.overlap = app.config.get('SNAPSHOT_OVERLAP', self.overlap)
+        self.dispose()
+        if app.config.get('SNAPSHOT_MOUNT'):
+            app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + self.extract(app.config['SNAPSHOT_MOUNT'])
+            event.listen(db.get_engine(app), 'connect', query_only)
+            logger.warning("running on read-only snapshot {name}".format(name=app.config['SNAPSHOT_MOUNT']))
+
+    def dispose(self):
+        with self.lock:
+            for engine in self.engines.values():
+                engine.dispose()
+            self.engines = {}
+
+    # files
+
+    def names(self):
+        """ Return names of snapshots - oldest first """
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(SUFFIX))
+
+    def path(self, name):
+        """ Return path of snapshot with given name. Raises ValueError for unknown snapshot. """
+        if name != os.path.basename(name) or name not in self.names():
+            raise ValueError("unknown snapshot {name}".format(name=name))
+        return os.path.join(self.directory, name)
+
+    def extract(self, name):
+        """ Return path of uncompressed copy of snapshot, created on first use. """
+        path = os.path.join(self.directory, 'mounted', name[:-len('.gz')])
+        if not os.path.exists(path):
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            decompress(self.path(name), path + '.part')
+            os.rename(path + '.part', path)
+        return path
+
+    # read-only access
+
+    def mount(self, name):
+        """ Return read-only engine of snapshot with given name """
+        path = self.extract(name)
+        with self.lock:
+            engine = self.engines.get(name)
+            if engine is None:
+                engine = create_engine('sqlite:///' + path)
+                event.listen(engine, 'connect', query_only)
+                self.engines[name] = engine
+            return engine
+
+    def session(self, name):
+        return sessionmaker(bind=self.mount(name))()
+
+    # taking
+
+    def take(self, incremental=False, base=None, progress=None):
+        """
+        Take snapshot of main database, incremental one starts from base (default the newest snapshot).
+        Returns dictionary with name, size, base (None for full snapshot) and rows (table name -> copied rows).
+        progress is called with table name and copied rows after every chunk.
+        """
+        from . import db
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        if incremental and base is None:
+            names = self.names()
+            base = names[-1] if names else None
+        if not incremental:
+            base = None
+        name = datetime.now().strftime('trace-%Y%m%d-%H%M%S-%f') + SUFFIX
+        work = os.path.join(self.directory, name[:-len('.gz')] + '.part')
+        if base is not None:
+            decompress(self.path(base), work)
+        elif os.path.exists(work):
+            os.remove(work)
+        started = time.time()
+        target_engine = create_engine('sqlite:///' + work, poolclass=NullPool)
+        try:
+            db.metadata.create_all(target_engine)
+            snapshot_metadata.create_all(target_engine)
+            target = target_engine.connect()
+            try:
+                target.execute('PRAGMA synchronous = OFF')
+                rows = self.copy(target, progress)
+            finally:
+                target.close()
+            compress(work, os.path.join(self.directory, name))
+        finally:
+            target_engine.dispose()
+            os.remove(work)
+        size = os.path.getsize(os.path.join(self.directory, name))
+        logger.info("snapshot {name} ({size} bytes, base {base}) taken in {time:.1f}s: {rows}".format(
+            name=name, size=size, base=base, rows=rows, time=time.time() - started))
+        return {'name': name, 'size': size, 'base': base, 'rows': rows}
+
+    def source(self):
+        """
+        Return (engine, connection) of main database with transaction giving consistent view of all tables.
+        """
+        from . import db
+        if db.engine.dialect.name == 'sqlite':
+            # pysqlite would not begin transaction for SELECT - autocommit mode and explicit BEGIN instead
+            engine = create_engine(db.engine.url, connect_args={'isolation_level': None}, poolclass=NullPool)
+            connection = engine.connect()
+            connection.execute('BEGIN')
+        else:
+            engine = db.engine
+            # consistent snapshot works only in REPEATABLE READ - engine profile mysql-prod uses READ COMMITTED
+            connection = engine.connect().execution_options(isolation_level='REPEATABLE READ')
+            connection.execute('START TRANSACTION WITH CONSISTENT SNAPSHOT')
+        return engine, connection
+
+    def copy(self, target, progress=None):
+        from . import db
+        marks = dict((row.table_name, row.high_water) for row in target.execute(snapshot_info.select()))
+        engine, source = self.source()
+        rows = {}
+        try:
+            for table in db.metadata.sorted_tables:
+                key = list(table.primary_key.columns)[0]
+                columns = [c for c in table.c if table.name != 'users' or c.name in USER_COLUMNS]
+                last = None
+                if table.name in APPEND_TABLES and marks.get(table.name) is not None:
+                    last = max(marks[table.name] - self.overlap, 0)
+                    target.execute(table.delete().where(key > last))
+                else:
+                    target.execute(table.delete())
+                rows[table.name] = 0
+                while True:
+                    query = db.select(columns).order_by(key).limit(self.chunk_size)
+                    if last is not None:
+                        query = query.where(key > last)
+                    chunk = [dict(row) for row in source.execute(query)]
+                    if not chunk:
+                        break
+                    with target.begin():
+                        target.execute(table.insert(), chunk)
+                    rows[table.name] += len(chunk)
+                    last = chunk[-1][key.name]
+                    if progress is not None:
+                        progress(table.name, rows[table.name])
+                    if len(chunk) < self.chunk_size:
+                        break
+                high_water = target.execute(db.select([db.func.max(key)])).scalar() if table.name in APPEND_TABLES else None
+                total = target.execute(db.select([db.func.count()]).select_from(table)).scalar()
+                with target.begin():
+                    target.execute(snapshot_info.delete().where(snapshot_info.c.table_name == table.name))
+                    target.execute(snapshot_info.insert().values(table_name=table.name, high_water=high_water, rows=total, taken_at=datetime.now()))
+            source.execute('COMMIT')
+        finally:
+            source.close()  # transaction left open by failed copy is rolled back on close
+            if engine is not db.engine:
+                engine.dispose()
+        return rows
+
+
+def compress(source, destination):
+    with open(source, 'rb') as src:
+        with gzip.open(destination + '.part', 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.rename(destination + '.part', destination)
+
+
+def decompress(source, destination):
+    with gzip.open(source, 'rb') as src:
+        with open(destination, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
@@ -1,22 +1,30 @@
+import dateutil.parser
 from flask import render_template, flash, redirect, url_for, abort, request, current_app
 from flask_login import login_required, current_user
 from flask_babel import gettext
 from flask_paginate import Pagination
 from .. import db
-from ..models import Station
+from ..models import Station, Status, Operation, Operation_Status
+from ..querybudget import query_budget
 from . import stations
 from .forms import StationForm
 
 
 @stations.route('/')
 @login_required
+@query_budget(6)
 def index():
     page = request.args.get('page', 1, type=int)
     per_page = current_app.config['STATIONS_PER_PAGE']
     total = Station.query.count()
-    stations = Station.query.order_by(Station.id.desc()).paginate(page, per_page, False).items
+    stations = Station.query.order_by(Station.id.desc()).limit(per_page).offset((page - 1) * per_page).all()
+    station_ids = [s.id for s in stations]
+    status_counts, operation_counts = {}, {}
+    if station_ids:
+        status_counts = dict(db.session.query(Status.station_id, db.func.count(Status.id)).filter(Status.station_id.in_(station_ids)).group_by(Status.station_id).all())
+        operation_counts = dict(db.session.query(Operation.station_id, db.func.count(Operation.id)).filter(Operation.station_id.in_(station_ids)).group_by(Operation.station_id).all())
     pagination = Pagination(page=page, total=total, record_name='stations', per_page=per_page)
-    return render_template('stations/index.html', stations=stations, pagination=pagination)
+    return render_template('stations/index.html', stations=stations, status_counts=status_counts, operation_counts=operation_counts, pagination=pagination)
     
     
     page = request.args.get('page', 1, type=int)
@@ -27,6 +35,64 @@ def index():
     return render_template('stations/index.html', stations=station_list, pagination=pagination)
 
 
+@stations.route('/live')
+@login_required
+@query_budget(6)
+def live():
+    """
+    Line overview - last part, status, cycle time and status streak of every station.
+    Page is rendered in fixed number of queries and then updated from /api/changes events.
+    """
+    stations = Station.query.order_by(Station.id.asc()).all()
+    overview = line_overview()
+    status_names = dict(db.session.query(Operation_Status.id, Operation_Status.name).all())
+    last_status_id = max([o['id'] for o in overview.values()] or [0])
+    return render_template('stations/live.html', stations=stations, overview=overview, status_names=status_names,
+                           last_event_id='{0}:0'.format(last_status_id))
+
+
+def line_overview():
+    """
+    Return dict of station id -> last status (id, status, product_id, date_time, cycle_time, streak, streak_more).
+    Uses correlated subqueries walking station_id index from the newest status, so cost depends on number
+    of stations and STATION_STREAK_LIMIT and not on size of status table. streak_more is True when streak
+    is at least STATION_STREAK_LIMIT long.
+    """
+    last = db.aliased(Status)
+    previous = db.aliased(Status)
+    last_id = db.session.query(Status.id).filter(Status.station_id == Station.id).order_by(Status.id.desc()).limit(1).correlate(Station).as_scalar()
+    previous_id = db.session.query(Status.id).filter(Status.station_id == Station.id).order_by(Status.id.desc()).limit(1).offset(1).correlate(Station).as_scalar()
+    ids = db.session.query(Station.id, last_id, previous_id).all()
+    last_ids = [row[1] for row in ids if row[1] is not None]
+    if not last_ids:
+        return {}
+    previous_dates = dict(db.session.query(Status.id, Status.date_time).filter(Status.id.in_([row[2] for row in ids if row[2] is not None])).all())
+    # streak - statuses newer than last status with different value, looked for among the newest STATION_STREAK_LIMIT
+    # statuses only (station without status change would be walked whole) - longer streak is shown as "limit+"
+    limit = current_app.config.get('STATION_STREAK_LIMIT', 100)
+    floor = db.session.query(previous.id).filter(previous.station_id == last.station_id).order_by(previous.id.desc()).limit(1).offset(limit).correlate(last).as_scalar()
+    streak_break = db.session.query(previous.id).filter(previous.station_id == last.station_id).filter(previous.id > db.func.coalesce(floor, 0)).filter(previous.status != last.status).order_by(previous.id.desc()).limit(1).correlate(last).as_scalar()
+    streak = db.session.query(db.func.count(Status.id)).filter(Status.station_id == last.station_id).filter(Status.id > db.func.coalesce(streak_break, floor, 0)).correlate(last).as_scalar()
+    rows = db.session.query(last.id, last.station_id, last.status, last.product_id, last.date_time, streak).filter(last.id.in_(last_ids)).all()
+    previous_ids = dict((row[0], row[2]) for row in ids)
+    overview = {}
+    for status_id, station_id, status, product_id, date_time, streak_length in rows:
+        cycle_time = None
+        previous_date = previous_dates.get(previous_ids.get(station_id))
+        if previous_date is not None:
+            cycle_time = (dateutil.parser.parse(date_time) - dateutil.parser.parse(previous_date)).total_seconds()
+        overview[station_id] = {
+            'id': status_id,
+            'status': status,
+            'product_id': product_id,
+            'date_time': date_time,
+            'cycle_time': cycle_time,
+            'streak': streak_length,
+            'streak_more': streak_length >= limit,
+        }
+    return overview
+
+
 @stations.route('/<int:id>')
 @login_required
 def station(id):
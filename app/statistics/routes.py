@@ -1,11 +1,17 @@
+import dateutil.parser
 from flask import render_template, flash, redirect, url_for, abort, request, current_app
+from flask_login import login_required, current_user
 from flask_babel import gettext
-from .. import db
-from ..models import Product, Status, Operation, Operation_Type, Operation_Status, Station, Unit, Comment, User
+from flask_paginate import Pagination
+from .. import db, slowlog
+from ..models import Product, Status, Operation, Operation_Type, Operation_Status, Station, Unit, Comment, User, Fail_Step, Slow_Query
+from ..replica import use_replica
+from ..keyset import parse_jump_date
 from . import statistics
 
 
 @statistics.route('/')
+@use_replica
 def index():
     products = Product.query.order_by(Product.id.desc())
     statuses = Status.query.order_by(Status.id.desc())
@@ -18,3 +24,59 @@ def index():
     users = User.query.order_by(User.id.desc())
 
     return render_template('statistics/index.html', products=products, statuses=statuses, operations=operations, operation_types=operation_types, operation_statuses=operation_statuses, stations=stations, units=units, comments=comments, users=users)
+
+
+@statistics.route('/fail_steps')
+@use_replica
+def fail_steps():
+    station_id = request.args.get('station_id', type=int)
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    try:
+        pareto = Fail_Step.pareto(station_id, start_date, end_date)
+    except (ValueError, OverflowError):
+        flash(gettext(u'Invalid date filter'))
+        pareto = Fail_Step.pareto(station_id)
+    stations = Station.query.order_by(Station.id.asc()).all()
+    return render_template('statistics/fail_steps.html', pareto=pareto, stations=stations, station_id=station_id, start_date=start_date, end_date=end_date)
+
+
+@statistics.route('/fail_steps/<int:id>')
+@use_replica
+def fail_step(id):
+    fail_step = Fail_Step.query.get_or_404(id)
+    station_id = request.args.get('station_id', type=int)
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    page = request.args.get('page', 1, type=int)
+    per_page = current_app.config['STATUSES_PER_PAGE']
+    query = db.session.query(Status.id, Status.product_id, Status.station_id, Status.status, Status.date_time).filter(Status.fail_step_id == fail_step.id)
+    if station_id:
+        query = query.filter(Status.station_id == station_id)
+    try:
+        # date without time - whole day
+        date_time_from = str(dateutil.parser.parse(start_date)) if start_date else None
+        date_time_to = parse_jump_date(end_date) if end_date else None
+    except (ValueError, OverflowError):
+        flash(gettext(u'Invalid date filter'))
+        date_time_from = date_time_to = None
+    if date_time_from:
+        query = query.filter(Status.date_time >= date_time_from)
+    if date_time_to:
+        query = query.filter(Status.date_time < date_time_to)
+    total = query.count()
+    statuses = query.order_by(Status.id.desc()).limit(per_page).offset((page - 1) * per_page).all()
+    pagination = Pagination(page=page, total=total, record_name='statuses', per_page=per_page)
+    return render_template('statistics/fail_step.html', fail_step=fail_step, statuses=statuses, pagination=pagination, station_id=station_id, start_date=start_date, end_date=end_date)
+
+
+@statistics.route('/slow_queries')
+@login_required
+def slow_queries():
+    if not current_user.is_admin:
+        abort(403)
+    entries = slowlog.get_entries()
+    stored = []
+    if current_app.config['SLOW_QUERY_LOG_TABLE']:
+        stored = Slow_Query.query.order_by(Slow_Query.id.desc()).limit(current_app.config['SLOW_QUERY_LOG_SIZE']).all()
+    return render_template('statistics/slow_queries.html', entries=entries, stored=stored)
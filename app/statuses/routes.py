@@ -1,20 +1,27 @@
 from flask import render_template, flash, redirect, url_for, abort, request, current_app
 from flask_login import login_required, current_user
 from flask_babel import gettext
-from flask_paginate import Pagination
 from .. import db
 from ..models import Status
+from ..keyset import KeysetPagination, jump_before
+from ..querybudget import query_budget
+from ..rows import StatusRow
 from . import statuses
 
 @statuses.route('/')
 @login_required
+@query_budget(5)
 def index():
-    page = request.args.get('page', 1, type=int)
-    per_page = current_app.config['STATUSES_PER_PAGE']
-    total = Status.query.count()
-    statuses = Status.query.order_by(Status.id.desc()).paginate(page, per_page, False).items
-    pagination = Pagination(page=page, total=total, record_name='statuses', per_page=per_page, prev_label=gettext(u'Older'), next_label=gettext(u'Newer'))
-    return render_template('statuses/index.html', statuses=statuses, pagination=pagination)
+    before = request.args.get('before', type=int)
+    after = request.args.get('after', type=int)
+    date = request.args.get('date')
+    if date:
+        try:
+            before, after = jump_before(Status, date), None
+        except (ValueError, OverflowError):
+            flash(gettext(u'Invalid date: {date}'.format(date=date)))
+    pagination = KeysetPagination(StatusRow.query(), Status.id, current_app.config['STATUSES_PER_PAGE'], before, after)
+    return render_template('statuses/index.html', statuses=StatusRow.build(pagination.items), pagination=pagination)
 
 @statuses.route('/delete/<int:id>', methods=['GET', 'POST'])
 @login_required
@@ -0,0 +1,68 @@
+import six
+
+NUMBER_TYPES = (float,) + six.integer_types
+RESULT_KEYS = [('result_{slot}{suffix}'.format(slot=slot, suffix=suffix), types)
+               for slot in (1, 2, 3)
+               for suffix, types in [('', NUMBER_TYPES), ('_max', NUMBER_TYPES), ('_min', NUMBER_TYPES), ('_status_id', six.integer_types)]]
+
+
+class ValidationError(ValueError):
+    """
+    Record does not follow rules of ingest API.
+    """
+
+
+def require(data, keys, integers):
+    if not data or not isinstance(data, dict):
+        raise ValidationError("incorrect data")
+    for key in keys:
+        if key not in data:
+            raise ValidationError("required key: %s missing" % key)
+    for key in integers:
+        if isinstance(data[key], bool) or not isinstance(data[key], six.integer_types):
+            raise ValidationError("key: %s is not type of Int" % key)
+    if not isinstance(data['product_id'], six.string_types):
+        raise ValidationError("key: %s is not type of String" % 'product_id')
+
+
+def text(data, key):
+    """ Return optional text value - values of other types are ignored """
+    value = data.get(key)
+    return value if isinstance(value, six.text_type) else None
+
+
+def status_values(data):
+    """
+    Validate status record (POST /api/status, manage.py import).
+    Returns dictionary of Status columns - date_time is None when not given. Raises ValidationError.
+    """
+    require(data, ['status', 'station_id', 'product_id'], ['status', 'station_id'])
+    return {
+        'status': data['status'],
+        'product_id': data['product_id'],
+        'station_id': data['station_id'],
+        'date_time': text(data, 'date_time'),
+        'fail_step': text(data, 'fail_step') or "",
+    }
+
+
+def operation_values(data):
+    """
+    Validate operation record (POST /api/operation, manage.py import).
+    Returns dictionary of Operation columns - date_time is None when not given, results not given are None.
+    Raises ValidationError.
+    """
+    require(data, ['product_id', 'station_id', 'operation_status_id', 'operation_type_id'], ['station_id', 'operation_status_id', 'operation_type_id'])
+    values = {
+        'product_id': data['product_id'],
+        'station_id': data['station_id'],
+        'operation_status_id': data['operation_status_id'],
+        'operation_type_id': data['operation_type_id'],
+        'date_time': text(data, 'date_time'),
+    }
+    for key, types in RESULT_KEYS:
+        value = data.get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, types)):
+            raise ValidationError("key: %s is not a number" % key)
+        values[key] = value
+    return values
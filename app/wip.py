@@ -0,0 +1,135 @@
+import logging
+from sqlalchemy import event, select, exists, func, literal
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+
+class WipTracker(object):
+    """
+    Work in progress tracker (WIP_TRACKER) - set of products started at WIP_START_STATION (11) and not yet stamped
+    at WIP_END_STATION (55, electronic stamp).
+
+    wip table is maintained at ingest - by ORM events of Status and by write-behind writer of IngestQueue (track())
+    in the transaction inserting the status: product is added on its first start station status and removed on end
+    station status, so listing WIP costs O(WIP size) instead of scanning status history. Seed and bulk import
+    insert rows in bulk and rebuild WIP afterwards (manage.py wip_rebuild).
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.start_station = 11
+        self.end_station = 55
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from .models import Status, Product
+        self.enabled = app.config.get('WIP_TRACKER', self.enabled)
+        self.start_station = app.config.get('WIP_START_STATION', self.start_station)
+        self.end_station = app.config.get('WIP_END_STATION', self.end_station)
+        if not event.contains(Status, 'after_insert', self.after_status_insert):
+            event.listen(Status, 'after_insert', self.after_status_insert)
+            event.listen(Product, 'before_delete', self.before_product_delete)
+
+    # ORM events
+
+    def after_status_insert(self, mapper, connection, target):
+        self.track(connection, target)
+
+    def before_product_delete(self, mapper, connection, target):
+        if self.enabled:
+            self.finish(connection, target.id)
+
+    def track(self, connection, status):
+        """
+        Update WIP by inserted status (with id assigned) - in the transaction which inserted it.
+        """
+        if not self.enabled:
+            return
+        if status.station_id == self.start_station:
+            self.start(connection, status)
+        elif status.station_id == self.end_station:
+            self.finish(connection, status.product_id)
+
+    def start(self, connection, status):
+        """
+        Add product of given start station status unless it is already in WIP, already stamped or unknown (same
+        rules as rebuild()). Single INSERT ... SELECT - product started concurrently by other transaction is not
+        an error of the status insert.
+        """
+        from .models import Wip, Status, Product
+        wip = Wip.__table__
+        statuses = Status.__table__
+        products = Product.__table__
+        in_wip = exists().where(wip.c.product_id == status.product_id)
+        stamped = exists().where(statuses.c.product_id == status.product_id).where(statuses.c.station_id == self.end_station)
+        query = select([products.c.id, literal(status.id, wip.c.status_id.type), literal(status.date_time, wip.c.started.type)]) \
+            .where(products.c.id == status.product_id).where(~in_wip).where(~stamped)
+        insert = wip.insert().from_select(['product_id', 'status_id', 'started'], query)
+        if connection.dialect.name == 'sqlite':
+            # writers are serialized by database lock and pysqlite would commit the transaction on SAVEPOINT
+            connection.execute(insert)
+            return
+        savepoint = connection.begin_nested()
+        try:
+            connection.execute(insert)
+            savepoint.commit()
+        except IntegrityError:
+            savepoint.rollback()
+            logger.debug("product {product_id} added to WIP in the meantime".format(product_id=status.product_id))
+
+    def finish(self, connection, product_id):
+        from .models import Wip
+        wip = Wip.__table__
+        connection.execute(wip.delete().where(wip.c.product_id == product_id))
+
+    def rebuild(self):
+        """
+        Recalculate WIP from status history - known products with start station status and without end station
+        status.
+        Returns number of products in WIP.
+        """
+        from . import db
+        from .models import Wip, Status, Product
+        wip = Wip.__table__
+        statuses = Status.__table__
+        stamped = statuses.alias('stamped')
+        first = select([statuses.c.product_id, func.min(statuses.c.id).label('status_id')]) \
+            .where(statuses.c.station_id == self.start_station) \
+            .where(~exists().where(stamped.c.product_id == statuses.c.product_id).where(stamped.c.station_id == self.end_station)) \
+            .group_by(statuses.c.product_id).alias('first')
+        products = Product.__table__
+        query = select([first.c.product_id, first.c.status_id, statuses.c.date_time]) \
+            .where(statuses.c.id == first.c.status_id) \
+            .where(products.c.id == first.c.product_id)
+        connection = db.session.connection()
+        connection.execute(wip.delete())
+        connection.execute(wip.insert().from_select(['product_id', 'status_id', 'started'], query))
+        db.session.commit()
+        count = Wip.query.count()
+        logger.info("WIP rebuilt: {count} products".format(count=count))
+        return count
+
+    def listing(self, limit=None, offset=0):
+        """
+        Return (total, list of Wip) ordered from oldest started product.
+        """
+        from .models import Wip
+        query = Wip.query.order_by(Wip.started.asc(), Wip.product_id.asc())
+        if limit is not None:
+            query = query.limit(limit).offset(offset)
+        return Wip.query.count(), query.all()
+
+    @staticmethod
+    def last_stations(product_ids):
+        """
+        Return dict product_id -> (station_id, date_time) of last status of given products - one grouped query.
+        """
+        from . import db
+        from .models import Status
+        if not product_ids:
+            return {}
+        last_ids = db.session.query(func.max(Status.id)).filter(Status.product_id.in_(product_ids)).group_by(Status.product_id)
+        rows = db.session.query(Status.product_id, Status.station_id, Status.date_time).filter(Status.id.in_(last_ids.subquery()))
+        return dict((product_id, (station_id, date_time)) for product_id, station_id, date_time in rows)
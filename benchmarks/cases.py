@@ -0,0 +1,57 @@
+import json
+from datetime import timedelta
+from app import db
+from app.models import Product, Status
+
+
+class Case(object):
+    """
+    Single benchmarked request. cleanup (optional) is called after all rounds - it removes rows written by the case.
+    """
+
+    def __init__(self, name, method, url, data=None, cleanup=None):
+        self.name = name
+        self.method = method
+        self.url = url
+        self.data = data
+        self.cleanup = cleanup
+
+    def request(self, client):
+        if self.method == 'POST':
+            return client.post(self.url, data=json.dumps(self.data), content_type='application/json')
+        return client.get(self.url)
+
+
+def build_cases():
+    """
+    Return list of benchmark cases with parameters picked from seeded database (see manage.py seed).
+    Picking is deterministic - same dataset gives same urls.
+    """
+    newest = Product.query.order_by(Product.date_added.desc()).first()
+    if newest is None:
+        raise RuntimeError("database is empty - run 'python manage.py seed' first")
+
+    # product which passed station 21 most recently and product with most statuses (heavily reworked part)
+    status = Status.query.filter(Status.station_id == 21).order_by(Status.id.desc()).first()
+    reworked_id = db.session.query(Status.product_id).group_by(Status.product_id).order_by(db.func.count(Status.id).desc(), Status.product_id).limit(1).scalar()
+    last_status_id = db.session.query(db.func.max(Status.id)).scalar() or 0
+    day_end = newest.date_added
+    day_start = day_end - timedelta(days=1)
+    term = newest.serial[:3]
+
+    def remove_posted_statuses():
+        Status.query.filter(Status.id > last_status_id).delete(synchronize_session=False)
+        db.session.commit()
+
+    return [
+        Case('api.status_station_product', 'GET', '/api/status/station/{0}/product/{1}'.format(status.station_id, status.product_id)),
+        Case('api.current_reference', 'GET', '/api/current_reference'),
+        Case('api.autocomplete', 'GET', '/api/autocomplete/{0}?term={1}'.format(newest.type, term)),
+        Case('api.add_status', 'POST', '/api/status', data={
+            'status': 1, 'station_id': 11, 'product_id': newest.id, 'date_time': u'2099-01-01 00:00:00'}, cleanup=remove_posted_statuses),
+        Case('products.index', 'GET', '/app/'),
+        Case('products.index_filtered', 'GET', '/app/?start_date={0}&end_date={1}&status=2&variant_id={2}'.format(day_start, day_end, newest.variant_id)),
+        Case('products.product_reworked', 'GET', '/app/product/{0}'.format(reworked_id)),
+        Case('products.download', 'GET', '/app/download?start_date={0}&end_date={1}'.format(day_start, day_end)),
+        Case('statistics.index', 'GET', '/app/statistics/'),
+    ]
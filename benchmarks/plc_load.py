@@ -0,0 +1,308 @@
+"""
+Load simulator of PLC stations (requires Python 3.7+, standard library only).
+
+Every simulated station is an asyncio task repeating the station cycle once per takt:
+    GET  /api/serverstatus                                   - like PLC clock/reference sync
+    GET  /api/status/station/<upstream>/product/<product_id>  - upstream status check (not for first station)
+    POST /api/status                                          - station result
+    POST /api/operation                                       - --operations times
+
+Load is ramped from --start stations by --step every --duration seconds. Each step reports sustained
+throughput, p50/p99 latency, error rate, records acknowledged as queued (202) and DB lock errors / mean SQL statement time scraped from /api/metrics.
+Step is healthy when stations keep up with the takt, error rate and p99 stay below limits - saturation point is
+the last healthy number of stations.
+
+    $ python3 benchmarks/plc_load.py --start-server "python run_prod.py" --takt 2 --start 5 --step 5 --max 100
+    $ python3 benchmarks/plc_load.py --url http://127.0.0.1:5000 --output load.json
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+from datetime import datetime
+from urllib.parse import urlsplit
+
+STATIONS = [10 * line + position for line in range(1, 6) for position in range(1, 6)]  # same layout as app/seed.py
+PRODUCT_TYPE = 2000000000  # different from seeded products
+STATUS_OK = 1
+STATUS_NOK = 2
+INGEST_ACCEPTED = (200, 201, 202)  # 202 - stored by write-behind queue (INGEST_QUEUE), not committed yet
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return None
+    k = (len(values) - 1) * p / 100.0
+    f = int(k)
+    c = min(f + 1, len(values) - 1)
+    return values[f] + (values[c] - values[f]) * (k - f)
+
+
+class HttpClient(object):
+    """
+    Minimal asynchronous HTTP/1.1 client - one connection per request (werkzeug server closes them anyway).
+    """
+
+    def __init__(self, url, timeout=10.0):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+
+    async def request(self, method, path, data=None):
+        body = b'' if data is None else json.dumps(data).encode('utf-8')
+        head = '{method} {path} HTTP/1.1\r\nHost: {host}:{port}\r\nConnection: close\r\nContent-Length: {length}\r\n'.format(
+            method=method, path=path, host=self.host, port=self.port, length=len(body))
+        if data is not None:
+            head += 'Content-Type: application/json\r\n'
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+        try:
+            writer.write(head.encode('ascii') + b'\r\n' + body)
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), self.timeout)
+        finally:
+            writer.close()
+        status_line, _, rest = response.partition(b'\r\n')
+        headers, _, content = rest.partition(b'\r\n\r\n')
+        return int(status_line.split()[1]), content
+
+
+class Step(object):
+    """
+    Measurements of single load step.
+    """
+
+    def __init__(self, stations, takt):
+        self.stations = stations
+        self.takt = takt
+        self.latencies = {}
+        self.requests = 0
+        self.errors = 0
+        self.queued = 0
+        self.cycles = 0
+        self.late_cycles = 0
+        self.upstream_missing = 0
+        self.started = time.time()
+        self.finished = None
+        self.server_before = {}
+        self.server_after = {}
+
+    def record(self, kind, latency, ok):
+        self.latencies.setdefault(kind, []).append(latency)
+        self.requests += 1
+        if not ok:
+            self.errors += 1
+
+    def summary(self):
+        elapsed = (self.finished or time.time()) - self.started
+        latencies = [l for values in self.latencies.values() for l in values]
+        server = dict((name, self.server_after.get(name, 0) - self.server_before.get(name, 0)) for name in self.server_after)
+        queries = server.get('sql_queries_total', 0)
+        return {
+            'stations': self.stations,
+            'offered_cycles_per_second': self.stations / self.takt,
+            'cycles_per_second': self.cycles / elapsed,
+            'requests_per_second': self.requests / elapsed,
+            'late_cycles': self.late_cycles,
+            'error_rate': float(self.errors) / self.requests if self.requests else 0.0,
+            'queued': self.queued,
+            'p50': percentile(latencies, 50),
+            'p99': percentile(latencies, 99),
+            'p99_per_request': dict((kind, percentile(values, 99)) for kind, values in sorted(self.latencies.items())),
+            'upstream_missing': self.upstream_missing,
+            'db_lock_errors': server.get('db_lock_errors_total', 0),
+            'sql_errors': server.get('sql_errors_total', 0),
+            'mean_sql_statement_seconds': server.get('sql_duration_seconds_total', 0) / queries if queries else None,
+        }
+
+
+class Station(object):
+    """
+    Simulated station. Stations of one line process products one after another - product of cycle n at station
+    with index k is the one station k-1 processed in cycle n, so upstream status usually already exists.
+    """
+
+    def __init__(self, client, index, operations, nok_rate, rnd):
+        self.client = client
+        self.station_id = STATIONS[index % len(STATIONS)]
+        self.upstream_id = STATIONS[index % len(STATIONS) - 1] if index % len(STATIONS) else None
+        self.line = index // len(STATIONS)
+        self.operations = operations
+        self.nok_rate = nok_rate
+        self.random = rnd
+
+    def product_id(self, cycle):
+        now = datetime.now()
+        serial = (self.line * 100000 + cycle) % 1000000
+        return '{type}{serial:06d}{week:02d}{year:02d}'.format(type=PRODUCT_TYPE, serial=serial, week=now.isocalendar()[1], year=now.year % 100)
+
+    async def call(self, step, kind, method, path, data=None, expected=(200, 201)):
+        start = time.time()
+        try:
+            status, content = await self.client.request(method, path, data)
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+            step.record(kind, time.time() - start, False)
+            return None
+        step.record(kind, time.time() - start, status in expected)
+        if status == 202:
+            step.queued += 1
+        return status
+
+    async def cycle(self, step, cycle):
+        product_id = self.product_id(cycle)
+        await self.call(step, 'serverstatus', 'GET', '/api/serverstatus')
+        if self.upstream_id is not None:
+            status = await self.call(step, 'upstream', 'GET', '/api/status/station/{0}/product/{1}'.format(self.upstream_id, product_id), expected=(200, 404))
+            if status == 404:
+                step.upstream_missing += 1
+        fail = self.random.random() < self.nok_rate
+        now = str(datetime.now())
+        await self.call(step, 'status', 'POST', '/api/status', {
+            'status': STATUS_NOK if fail else STATUS_OK, 'station_id': self.station_id, 'product_id': product_id,
+            'date_time': now, 'fail_step': 'simulated' if fail else ''}, expected=INGEST_ACCEPTED)
+        for i in range(self.operations):
+            value = self.random.gauss(10.0, 0.3)
+            await self.call(step, 'operation', 'POST', '/api/operation', {
+                'product_id': product_id, 'station_id': self.station_id, 'operation_status_id': STATUS_OK,
+                'operation_type_id': i + 1, 'date_time': now,
+                'result_1': value, 'result_1_max': 11.0, 'result_1_min': 9.0, 'result_1_status_id': STATUS_OK if 9.0 <= value <= 11.0 else STATUS_NOK}, expected=INGEST_ACCEPTED)
+        step.cycles += 1
+
+    async def run(self, step, takt, stop):
+        # spread stations over takt so that they do not fire at the same moment
+        await asyncio.sleep(self.random.uniform(0, takt))
+        cycle = 0
+        while not stop.is_set():
+            started = time.time()
+            await self.cycle(step, cycle)
+            cycle += 1
+            remaining = takt - (time.time() - started)
+            if remaining < 0:
+                step.late_cycles += 1
+                continue
+            try:
+                await asyncio.wait_for(stop.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def scrape_metrics(client):
+    """
+    Return dictionary of not labelled counters from /api/metrics.
+    """
+    try:
+        status, content = await client.request('GET', '/api/metrics')
+    except (OSError, asyncio.TimeoutError):
+        return {}
+    values = {}
+    for line in content.decode('utf-8').splitlines():
+        if line.startswith('#') or '{' in line:
+            continue
+        name, _, value = line.partition(' ')
+        try:
+            values[name] = float(value)
+        except ValueError:
+            pass
+    return values
+
+
+async def run_step(client, stations, args, rnd):
+    step = Step(stations, args.takt)
+    step.server_before = await scrape_metrics(client)
+    step.started = time.time()
+    stop = asyncio.Event()
+    tasks = [asyncio.ensure_future(Station(client, i, args.operations, args.nok_rate, random.Random(rnd.random())).run(step, args.takt, stop)) for i in range(stations)]
+    await asyncio.sleep(args.duration)
+    stop.set()
+    step.finished = time.time()
+    await asyncio.gather(*tasks)
+    step.server_after = await scrape_metrics(client)
+    return step.summary()
+
+
+def healthy(summary, args):
+    return (summary['cycles_per_second'] >= 0.95 * summary['offered_cycles_per_second']
+            and summary['error_rate'] <= args.max_error_rate
+            and summary['p99'] is not None and summary['p99'] <= args.max_p99)
+
+
+async def ramp(args):
+    client = HttpClient(args.url, args.timeout)
+    rnd = random.Random(args.seed)
+    steps = []
+    saturation = None
+    stations = args.start
+    while stations <= args.max:
+        summary = await run_step(client, stations, args, rnd)
+        summary['healthy'] = healthy(summary, args)
+        steps.append(summary)
+        print('{stations:4d} stations: {cps:7.2f}/{offered:7.2f} cycles/s {rps:8.1f} req/s  p50 {p50:7.1f} ms  p99 {p99:7.1f} ms  '
+              'errors {errors:5.1%}  queued {queued:d}  lock errors {locks:.0f}  {state}'.format(
+                  stations=stations, cps=summary['cycles_per_second'], offered=summary['offered_cycles_per_second'],
+                  rps=summary['requests_per_second'], p50=(summary['p50'] or 0) * 1000, p99=(summary['p99'] or 0) * 1000,
+                  errors=summary['error_rate'], queued=summary['queued'], locks=summary['db_lock_errors'], state='ok' if summary['healthy'] else 'SATURATED'))
+        if not summary['healthy']:
+            break
+        saturation = stations
+        stations += args.step
+    return {'timestamp': str(datetime.now()), 'url': args.url, 'takt': args.takt, 'operations': args.operations,
+            'saturation_stations': saturation, 'steps': steps}
+
+
+def wait_for_server(url, timeout=30.0):
+    client = HttpClient(url, 2.0)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            status, content = asyncio.run(client.request('GET', '/api/serverstatus'))
+            if status == 200:
+                return True
+        except (OSError, asyncio.TimeoutError):
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate PLC stations posting statuses and operations and find saturation point.')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='server base url')
+    parser.add_argument('--start-server', help='command starting local server (terminated at the end)')
+    parser.add_argument('--takt', type=float, default=2.0, help='seconds between cycles of one station')
+    parser.add_argument('--operations', type=int, default=10, help='operations posted per cycle')
+    parser.add_argument('--nok-rate', type=float, default=0.02, help='probability of NOK status')
+    parser.add_argument('--start', type=int, default=5, help='number of stations in first step')
+    parser.add_argument('--step', type=int, default=5, help='stations added in every step')
+    parser.add_argument('--max', type=int, default=200, help='maximal number of stations')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds per step')
+    parser.add_argument('--timeout', type=float, default=10.0, help='request timeout in seconds')
+    parser.add_argument('--max-error-rate', type=float, default=0.01, help='error rate of healthy step')
+    parser.add_argument('--max-p99', type=float, default=1.0, help='p99 latency of healthy step in seconds')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--output', help='write results to JSON file')
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.start_server:
+        server = subprocess.Popen(args.start_server, shell=True)
+        if not wait_for_server(args.url):
+            server.terminate()
+            sys.exit('server did not start at {0}'.format(args.url))
+    try:
+        result = asyncio.run(ramp(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    print('saturation point: {0} stations'.format(result['saturation_stations']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+Ingest throughput of database engine profiles (see app/engineprofile.py).
+
+Every profile gets its own empty SQLite file. --threads workers (like PLC stations served by threaded server) post
+statuses and operations through the application for --duration seconds; rows per second, request latency,
+errors and mean pool checkout wait are reported per profile.
+
+    $ python -m benchmarks.profiles --threads 8 --duration 10
+    $ python -m benchmarks.profiles --profile defaults --profile sqlite-ingest --output profiles.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import argparse
+import threading
+from datetime import datetime
+
+from config import config
+from app import create_app, db, metrics, product_cache
+from app.engineprofile import PROFILES
+from app.models import Product, Fail_Step
+from .run import percentile
+
+CONFIG_NAME = 'profile-benchmark'
+PRODUCTS = 50
+STATIONS = [11, 12, 13, 21, 22, 23, 31, 32, 33, 55]
+
+
+def make_app(profile, path):
+    class ProfileBenchmarkConfig(config['testing']):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + path
+        DATABASE_ENGINE_PROFILE = profile
+        QUERY_BUDGET_MODE = None
+        ADMISSION_CONTROL = False  # measure database, not admission limits
+        CHANGE_FEED = False
+
+    config[CONFIG_NAME] = ProfileBenchmarkConfig
+    try:
+        return create_app(CONFIG_NAME)
+    finally:
+        del config[CONFIG_NAME]
+
+
+def worker(app, number, deadline, timings, errors):
+    client = app.test_client()
+    i = 0
+    while time.time() < deadline:
+        product = Product('0000000001', (number * 7 + i) % PRODUCTS + 1, '02', '18', 1, 0).id
+        station = STATIONS[i % len(STATIONS)]
+        for url, data in (
+                ('/api/status', {'status': 1, 'station_id': station, 'product_id': product}),
+                ('/api/operation', {'product_id': product, 'station_id': station, 'operation_status_id': 1, 'operation_type_id': 301, 'result_1': 12.5})):
+            start = time.time()
+            try:
+                res = client.post(url, data=json.dumps(data), content_type='application/json')
+                failed = res.status_code >= 400
+            except Exception:
+                failed = True
+            timings.append(time.time() - start)
+            if failed:
+                errors.append(url)
+        i += 1
+
+
+def pool_wait(samples):
+    """ Return mean pool checkout wait in seconds, None for profile without connection pool """
+    waits = [h for (name, labels), h in samples.items() if name == 'db_pool_checkout_wait_seconds']
+    count = sum(h[3] for h in waits)
+    return sum(h[2] for h in waits) / count if count else None
+
+
+def run_profile(profile, threads=8, duration=10.0):
+    directory = tempfile.mkdtemp(prefix='trace-profile-')
+    try:
+        app = make_app(profile, os.path.join(directory, 'trace.sqlite'))
+        with app.app_context():
+            db.create_all()
+            Fail_Step._ids.clear()
+            product_cache.clear()
+            for serial in range(1, PRODUCTS + 1):
+                db.session.add(Product('0000000001', serial, '02', '18', 1, 0))
+            db.session.commit()
+            db.session.remove()
+            metrics.reset()
+
+            timings = []
+            errors = []
+            deadline = time.time() + duration
+            started = time.time()
+            workers = [threading.Thread(target=worker, args=(app, number, deadline, timings, errors)) for number in range(threads)]
+            for t in workers:
+                t.start()
+            for t in workers:
+                t.join()
+            elapsed = time.time() - started
+            wait = pool_wait(metrics.histograms)
+            db.session.remove()
+            db.get_engine(app).dispose()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return {
+        'threads': threads,
+        'requests': len(timings),
+        'errors': len(errors),
+        'rows_per_second': (len(timings) - len(errors)) / elapsed,
+        'p50': percentile(timings, 50),
+        'p99': percentile(timings, 99),
+        'pool_wait_mean': wait,
+    }
+
+
+def format_results(data):
+    lines = ['{0:16} {1:>10} {2:>9} {3:>9} {4:>7} {5:>13}'.format('profile', 'rows/s', 'p50 ms', 'p99 ms', 'errors', 'pool wait ms')]
+    for name, r in sorted(data['results'].items(), key=lambda item: item[1]['rows_per_second']):
+        wait = '-' if r['pool_wait_mean'] is None else '{0:.2f}'.format(r['pool_wait_mean'] * 1000)
+        lines.append('{0:16} {1:10.1f} {2:9.1f} {3:9.1f} {4:7d} {5:>13}'.format(name, r['rows_per_second'], r['p50'] * 1000, r['p99'] * 1000, r['errors'], wait))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    sqlite_profiles = sorted(name for name, profile in PROFILES.items() if profile.get('dialect', 'sqlite') == 'sqlite')
+    parser = argparse.ArgumentParser(description='Compare ingest throughput of database engine profiles on SQLite.')
+    parser.add_argument('--profile', action='append', choices=sqlite_profiles, help='profile to run (may be repeated, default all SQLite profiles)')
+    parser.add_argument('--threads', type=int, default=8, help='concurrent posting workers')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per profile')
+    parser.add_argument('--output', help='write results to JSON file')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for profile in args.profile or sqlite_profiles:
+        results[profile] = run_profile(profile, args.threads, args.duration)
+    data = {
+        'timestamp': str(datetime.now()),
+        'python': platform.python_version(),
+        'duration': args.duration,
+        'results': results,
+    }
+    print(format_results(data))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,184 @@
+"""
+Benchmarks of hot endpoints and pages against seeded database.
+
+    $ python manage.py seed --products 20000 --clear
+    $ python -m benchmarks.run --rounds 50 --output before.json
+    ... upgrade ...
+    $ python -m benchmarks.run --rounds 50 --output after.json --baseline before.json --threshold 0.2
+
+Every case reports latency percentiles, SQL statements per request and peak memory allocated during the case.
+With --baseline the run exits with status 1 when any case got slower (p50 or p90) or issues more statements
+than baseline by more than threshold.
+"""
+import os
+import sys
+import gc
+import json
+import time
+import platform
+import argparse
+from datetime import datetime
+
+try:
+    import tracemalloc
+except ImportError:  # python 2
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+from app import create_app, db
+from app.querybudget import QueryCounter
+
+COMPARED = ('p50', 'p90', 'queries')
+
+
+def percentile(values, p):
+    """
+    Return p-th percentile (0..100) of values with linear interpolation.
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    k = (len(values) - 1) * p / 100.0
+    f = int(k)
+    c = min(f + 1, len(values) - 1)
+    return values[f] + (values[c] - values[f]) * (k - f)
+
+
+class MemoryPeak(object):
+    """
+    Peak memory allocated while inside the block - tracemalloc on python 3, growth of max RSS otherwise.
+    """
+
+    def __enter__(self):
+        gc.collect()
+        if tracemalloc is not None:
+            tracemalloc.start()
+        elif resource is not None:
+            self.start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.peak = None
+        if tracemalloc is not None:
+            self.peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        elif resource is not None:
+            scale = 1 if sys.platform == 'darwin' else 1024  # ru_maxrss is in kilobytes on linux
+            self.peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - self.start) * scale
+        return False
+
+
+def run_case(client, case, rounds=20, warmup=2):
+    for i in range(warmup):
+        case.request(client)
+    timings = []
+    queries = []
+    errors = 0
+    with MemoryPeak() as memory:
+        for i in range(rounds):
+            db.session.remove()
+            with QueryCounter() as counter:
+                start = time.time()
+                res = case.request(client)
+                timings.append(time.time() - start)
+            queries.append(counter.count)
+            if res.status_code >= 400:
+                errors += 1
+    if case.cleanup is not None:
+        case.cleanup()
+    return {
+        'url': case.url,
+        'method': case.method,
+        'rounds': rounds,
+        'errors': errors,
+        'min': min(timings),
+        'mean': sum(timings) / len(timings),
+        'p50': percentile(timings, 50),
+        'p90': percentile(timings, 90),
+        'p99': percentile(timings, 99),
+        'max': max(timings),
+        'queries': max(queries),
+        'peak_memory': memory.peak,
+    }
+
+
+def run(app, rounds=20, warmup=2, only=None):
+    from .cases import build_cases
+    results = {}
+    with app.app_context():
+        client = app.test_client()
+        for case in build_cases():
+            if only and case.name not in only:
+                continue
+            results[case.name] = run_case(client, case, rounds, warmup)
+        db.session.remove()
+        dialect = db.engine.dialect.name
+    return {
+        'timestamp': str(datetime.now()),
+        'python': platform.python_version(),
+        'database': dialect,
+        'rounds': rounds,
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold=0.2):
+    """
+    Return list of (case, measure, baseline value, current value) which are worse than baseline by more than threshold.
+    """
+    regressions = []
+    for name, result in sorted(current['results'].items()):
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        for measure in COMPARED:
+            if base[measure] is None or result[measure] is None:
+                continue
+            if result[measure] > base[measure] * (1 + threshold):
+                regressions.append((name, measure, base[measure], result[measure]))
+    return regressions
+
+
+def format_results(data):
+    lines = ['{0:32} {1:>9} {2:>9} {3:>9} {4:>8} {5:>10}'.format('case', 'p50 ms', 'p90 ms', 'p99 ms', 'queries', 'memory kB')]
+    for name, r in sorted(data['results'].items()):
+        memory = '-' if r['peak_memory'] is None else '{0:.0f}'.format(r['peak_memory'] / 1024.0)
+        lines.append('{0:32} {1:9.1f} {2:9.1f} {3:9.1f} {4:8d} {5:>10}'.format(name, r['p50'] * 1000, r['p90'] * 1000, r['p99'] * 1000, r['queries'], memory))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark hot endpoints and pages against seeded database.')
+    parser.add_argument('--config', default=os.getenv('FLASK_CONFIG') or 'default', help='application config name')
+    parser.add_argument('--rounds', type=int, default=20, help='measured requests per case')
+    parser.add_argument('--warmup', type=int, default=2, help='not measured requests per case')
+    parser.add_argument('--case', action='append', help='run only given case (may be repeated)')
+    parser.add_argument('--output', help='write results to JSON file')
+    parser.add_argument('--baseline', help='compare with results of previous run')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative slowdown against baseline')
+    args = parser.parse_args(argv)
+
+    app = create_app(args.config)
+    app.config['QUERY_BUDGET_MODE'] = None
+    data = run(app, args.rounds, args.warmup, args.case)
+    print(format_results(data))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, data, args.threshold)
+        for name, measure, before, after in regressions:
+            print('REGRESSION {name} {measure}: {before:.4g} -> {after:.4g}'.format(name=name, measure=measure, before=before, after=after))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,9 +8,9 @@ if os.path.exists('.env'):
             os.environ[var[0]] = var[1]
 
 from app import create_app
-from flask_script import Manager
+from flask_script import Manager, Command, Option
 app = create_app(os.getenv('FLASK_CONFIG') or 'default')
-from app import db
+from app import db, wip_tracker
 from app.models import User
 
 from flask import Flask
@@ -45,6 +45,95 @@ def adduser(login, admin=False):
     print('User {0} was registered successfully.'.format(login))
 
 
+@manager.option('-p', '--products', dest='products', type=int, default=1000, help='number of products')
+@manager.option('-v', '--variants', dest='variants', type=int, default=4, help='number of product variants')
+@manager.option('--operations-min', dest='operations_min', type=int, default=10, help='minimal number of operations per status')
+@manager.option('--operations-max', dest='operations_max', type=int, default=30, help='maximal number of operations per status')
+@manager.option('--nok-rate', dest='nok_rate', type=float, default=0.02, help='probability of failed station test')
+@manager.option('--repeat-rate', dest='repeat_rate', type=float, default=0.03, help='probability of repeated station test')
+@manager.option('-s', '--seed', dest='seed', type=int, default=0, help='random seed - same seed gives same dataset')
+@manager.option('--chunk-size', dest='chunk_size', type=int, default=20000, help='number of rows inserted per transaction')
+@manager.option('--clear', dest='clear', action='store_true', default=False, help='delete existing products, statuses, operations and comments first')
+def seed(products, variants, operations_min, operations_max, nok_rate, repeat_rate, seed, chunk_size, clear):
+    """Generate deterministic synthetic production history."""
+    from app.seed import HistoryGenerator, clear_history
+    db.create_all()
+    if clear:
+        clear_history()
+
+    def progress(counts, elapsed):
+        rows = sum(counts.values())
+        print('{products} products, {statuses} statuses, {operations} operations - {rate:.0f} rows/s'.format(
+            products=counts['product'], statuses=counts['status'], operations=counts['operation'], rate=rows / max(elapsed, 0.001)))
+
+    generator = HistoryGenerator(products=products, variants=variants, operations_min=operations_min, operations_max=operations_max,
+                                 nok_rate=nok_rate, repeat_rate=repeat_rate, seed=seed, chunk_size=chunk_size)
+    counts = generator.run(progress=progress)
+    print('Inserted {rows} rows.'.format(rows=sum(counts.values())))
+    print('{count} products in WIP.'.format(count=wip_tracker.rebuild()))
+
+
+@manager.option('-d', '--days', dest='days', type=int, default=None, help='archive products older than given number of days (default ARCHIVE_AFTER_DAYS)')
+@manager.option('-l', '--limit', dest='limit', type=int, default=None, help='maximal number of products to archive')
+def archive(days, limit):
+    """Move old products with their history to archive database."""
+    from app import archive as product_archive
+
+    def progress(totals, elapsed):
+        print('{products} products, {statuses} statuses, {operations} operations archived - {elapsed:.0f}s'.format(
+            products=totals.get('product', 0), statuses=totals.get('status', 0), operations=totals.get('operation', 0), elapsed=elapsed))
+
+    totals = product_archive.run(days, limit, progress)
+    print('Archived {products} products.'.format(products=totals.get('product', 0)))
+
+
+@manager.option('-i', '--incremental', dest='incremental', action='store_true', default=False, help='append new rows to copy of previous snapshot')
+@manager.option('-b', '--base', dest='base', default=None, help='previous snapshot of incremental snapshot (default the newest one)')
+def snapshot(incremental, base):
+    """Take consistent snapshot of the database to gzipped SQLite file in SNAPSHOT_DIRECTORY."""
+    from app import snapshots
+
+    def progress(table, rows):
+        print('{table}: {rows} rows'.format(table=table, rows=rows))
+
+    info = snapshots.take(incremental=incremental or base is not None, base=base, progress=progress)
+    print('Snapshot {name} ({size} bytes) with {rows} rows{base}.'.format(
+        name=info['name'], size=info['size'], rows=sum(info['rows'].values()), base=' appended to {0}'.format(info['base']) if info['base'] else ''))
+
+
+class ImportCommand(Command):
+    """Import historical statuses or operations from CSV or NDJSON file, interrupted import is resumed."""
+    option_list = (
+        Option('path', help='CSV or NDJSON file'),
+        Option('-k', '--kind', dest='kind', choices=('status', 'operation'), required=True, help='kind of imported records'),
+        Option('-f', '--format', dest='format', choices=('csv', 'ndjson'), default=None, help='file format (default by extension)'),
+        Option('-b', '--batch-size', dest='batch_size', type=int, default=None, help='number of rows inserted per transaction (default IMPORT_BATCH_SIZE)'),
+        Option('--restart', dest='restart', action='store_true', default=False, help='ignore checkpoint of previous import of the file'),
+    )
+
+    def run(self, path, kind, format, batch_size, restart):
+        from app.importer import Importer
+
+        def progress(counts, elapsed):
+            rows = counts['imported'] + counts['rejected'] - counts['skipped']
+            print('{imported} imported, {rejected} rejected - {rate:.0f} rows/s'.format(
+                imported=counts['imported'], rejected=counts['rejected'], rate=max(rows, 0) / max(elapsed, 0.001)))
+
+        counts = Importer(path, kind, format, batch_size).run(progress=progress, restart=restart)
+        print('Imported {imported} records, {rejected} rejected, {skipped} skipped as already imported.'.format(**counts))
+        if 'wip' in counts:
+            print('{count} products in WIP.'.format(count=counts['wip']))
+
+
+manager.add_command('import', ImportCommand())
+
+
+@manager.command
+def wip_rebuild():
+    """Recalculate work in progress from status history."""
+    print('{count} products in WIP.'.format(count=wip_tracker.rebuild()))
+
+
 if __name__ == '__main__':
     manager.run()
 
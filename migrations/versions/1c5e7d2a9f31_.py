@@ -0,0 +1,45 @@
+"""fail step dictionary
+
+Revision ID: 1c5e7d2a9f31
+Revises: 4ae3f8cb8954
+Create Date: 2026-10-19 16:20:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '1c5e7d2a9f31'
+down_revision = '4ae3f8cb8954'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('fail_step',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_fail_step_name', 'fail_step', ['name'], unique=True)
+
+    with op.batch_alter_table('status') as batch_op:
+        batch_op.add_column(sa.Column('fail_step_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_status_fail_step_id', 'fail_step', ['fail_step_id'], ['id'])
+        batch_op.create_index('ix_status_fail_step_id', ['fail_step_id'], unique=False)
+        batch_op.create_index('ix_status_fail_step_id_date_time', ['fail_step_id', 'date_time'], unique=False)
+        batch_op.create_index('ix_status_station_id_fail_step_id_date_time', ['station_id', 'fail_step_id', 'date_time'], unique=False)
+
+    # intern existing fail step descriptions
+    op.execute("INSERT INTO fail_step (name) SELECT DISTINCT fail_step FROM status WHERE fail_step IS NOT NULL AND fail_step != ''")
+    op.execute("UPDATE status SET fail_step_id = (SELECT fail_step.id FROM fail_step WHERE fail_step.name = status.fail_step) WHERE fail_step IS NOT NULL AND fail_step != ''")
+
+
+def downgrade():
+    with op.batch_alter_table('status') as batch_op:
+        batch_op.drop_index('ix_status_station_id_fail_step_id_date_time')
+        batch_op.drop_index('ix_status_fail_step_id_date_time')
+        batch_op.drop_index('ix_status_fail_step_id')
+        batch_op.drop_constraint('fk_status_fail_step_id', type_='foreignkey')
+        batch_op.drop_column('fail_step_id')
+    op.drop_index('ix_fail_step_name', table_name='fail_step')
+    op.drop_table('fail_step')
@@ -0,0 +1,36 @@
+"""slow query log
+
+Revision ID: 2b8f4e6c1a07
+Revises: 1c5e7d2a9f31
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2b8f4e6c1a07'
+down_revision = '1c5e7d2a9f31'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('slow_query',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+        sa.Column('duration', sa.Float(), nullable=True),
+        sa.Column('endpoint', sa.String(length=128), nullable=True),
+        sa.Column('url', sa.String(length=255), nullable=True),
+        sa.Column('statement', sa.Text(), nullable=True),
+        sa.Column('parameters', sa.Text(), nullable=True),
+        sa.Column('stack', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_slow_query_timestamp', 'slow_query', ['timestamp'], unique=False)
+    op.create_index('ix_slow_query_endpoint', 'slow_query', ['endpoint'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_slow_query_endpoint', table_name='slow_query')
+    op.drop_index('ix_slow_query_timestamp', table_name='slow_query')
+    op.drop_table('slow_query')
@@ -0,0 +1,32 @@
+"""work in progress tracker
+
+Revision ID: 3d9a5c7e2f14
+Revises: 2b8f4e6c1a07
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3d9a5c7e2f14'
+down_revision = '2b8f4e6c1a07'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('wip',
+        sa.Column('product_id', sa.String(length=20), nullable=False),
+        sa.Column('status_id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=True),
+        sa.Column('started', sa.String(length=40), nullable=True),
+        sa.ForeignKeyConstraint(['product_id'], ['product.id'], ),
+        sa.ForeignKeyConstraint(['status_id'], ['status.id'], ),
+        sa.PrimaryKeyConstraint('product_id')
+    )
+    op.create_index('ix_wip_started', 'wip', ['started'], unique=False)
+    # existing history has to be loaded with: python manage.py wip_rebuild
+
+
+def downgrade():
+    op.drop_index('ix_wip_started', table_name='wip')
+    op.drop_table('wip')
@@ -0,0 +1,24 @@
+"""date_time indexes for jump to date
+
+Revision ID: 4e1b8d3f6a25
+Revises: 3d9a5c7e2f14
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4e1b8d3f6a25'
+down_revision = '3d9a5c7e2f14'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_index('ix_status_date_time', 'status', ['date_time'], unique=False)
+    op.create_index('ix_operation_date_time', 'operation', ['date_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_operation_date_time', table_name='operation')
+    op.drop_index('ix_status_date_time', table_name='status')
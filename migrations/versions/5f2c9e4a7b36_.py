@@ -0,0 +1,24 @@
+"""composite indexes for operation search
+
+Revision ID: 5f2c9e4a7b36
+Revises: 4e1b8d3f6a25
+Create Date: 2026-10-19 21:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5f2c9e4a7b36'
+down_revision = '4e1b8d3f6a25'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_index('ix_operation_station_id_operation_type_id_id', 'operation', ['station_id', 'operation_type_id', 'id'], unique=False)
+    op.create_index('ix_operation_station_id_operation_status_id_id', 'operation', ['station_id', 'operation_status_id', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_operation_station_id_operation_status_id_id', table_name='operation')
+    op.drop_index('ix_operation_station_id_operation_type_id_id', table_name='operation')
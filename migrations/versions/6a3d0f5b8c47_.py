@@ -0,0 +1,29 @@
+"""archived product index
+
+Revision ID: 6a3d0f5b8c47
+Revises: 5f2c9e4a7b36
+Create Date: 2026-10-19 22:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '6a3d0f5b8c47'
+down_revision = '5f2c9e4a7b36'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('archived_product',
+        sa.Column('product_id', sa.String(length=20), nullable=False),
+        sa.Column('archive', sa.String(length=32), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('product_id')
+    )
+    op.create_index('ix_archived_product_archive', 'archived_product', ['archive'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_archived_product_archive', table_name='archived_product')
+    op.drop_table('archived_product')
@@ -0,0 +1,30 @@
+"""import checkpoint
+
+Revision ID: 7b4e1a6c9d58
+Revises: 6a3d0f5b8c47
+Create Date: 2026-10-19 23:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7b4e1a6c9d58'
+down_revision = '6a3d0f5b8c47'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('import_checkpoint',
+        sa.Column('source', sa.String(length=255), nullable=False),
+        sa.Column('kind', sa.String(length=16), nullable=True),
+        sa.Column('position', sa.Integer(), nullable=True),
+        sa.Column('imported', sa.Integer(), nullable=True),
+        sa.Column('rejected', sa.Integer(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('source')
+    )
+
+
+def downgrade():
+    op.drop_table('import_checkpoint')
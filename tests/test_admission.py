@@ -0,0 +1,64 @@
+import json
+import unittest
+from app import create_app, db, admission, metrics
+from app.admission import Gate
+
+
+class AdmissionControlTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        metrics.reset()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def post_status(self):
+        return self.client.post('/api/status', data=json.dumps({
+            'status': 1, 'station_id': 11, 'product_id': u'0000000001000001', 'date_time': u'2018-01-10 10:00:00'}),
+            content_type='application/json')
+
+    def test_gate(self):
+        gate = Gate(1)
+        self.assertTrue(gate.acquire())
+        self.assertFalse(gate.acquire(0.01))
+        gate.release()
+        self.assertTrue(gate.acquire(0.01))
+        self.assertTrue(gate.active == 1 and gate.waiting == 0)
+
+    def test_classify(self):
+        self.assertTrue(admission.classify('api.add_status') == 'ingest')
+        self.assertTrue(admission.classify('api.get_status_station_product') == 'interlock')
+        self.assertTrue(admission.classify('products.download') == 'export')
+        self.assertTrue(admission.classify('products.index') == 'ui')
+        self.assertTrue(admission.classify('api.get_metrics') is None)
+        self.assertTrue(admission.classify('static') is None)
+
+    def test_ingest_saturated(self):
+        gate = admission.gates['ingest']
+        for i in range(gate.limit):
+            gate.acquire()
+        admission.timeouts['ingest'] = 0.01
+        res = self.post_status()
+        self.assertTrue(res.status_code == 429)
+        self.assertTrue(res.headers['Retry-After'] == '1')
+        # other classes are not affected
+        self.assertTrue(self.client.get('/api/serverstatus').status_code == 200)
+        for i in range(gate.limit):
+            gate.release()
+        self.assertTrue(self.post_status().status_code == 201)
+        self.assertTrue(gate.active == 0)
+        self.assertTrue('admission_rejected_total{class="ingest"} 1.0' in metrics.render())
+
+    def test_interlock_priority(self):
+        admission.gates['interlock'].waiting = 1  # station read is waiting for slot
+        try:
+            self.assertTrue(self.client.get('/app/download').status_code == 503)
+        finally:
+            admission.gates['interlock'].waiting = 0
+        self.assertTrue(self.client.get('/app/download').status_code == 200)
@@ -0,0 +1,105 @@
+import os
+import json
+import shutil
+import unittest
+from datetime import datetime
+from app import create_app, db, archive
+from app.models import User, Product, Status, Operation, Comment, Station, Operation_Status, Operation_Type, Unit, Variant, Archived_Product
+
+
+class ArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        self.directory = os.path.dirname(self.app.config['ARCHIVE_DATABASE_URI'][len('sqlite:///'):])
+        db.session.add_all([Variant(1), Unit(1), Operation_Type(1), Operation_Status(1, unit_id=1), Station(11)])
+        user = User(login='john', password='cat')
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+        self.product_ids = []
+        for serial, date_added in enumerate([datetime(2017, 1, 5), datetime(2017, 2, 5), datetime(2017, 2, 6), datetime.now()]):
+            p = Product('0000000001', serial, '02', '17', 1, 0)
+            p.date_added = date_added
+            db.session.add(p)
+            db.session.add(Status(1, p.id, 11, user=self.user_id, date_time=str(date_added)))
+            db.session.add(Operation(p.id, 11, 1, 1, str(date_added), r1=1.5, r1_max=2.0, r1_min=1.0, r1_stat=1, r2=1.5, r2_max=2.0, r2_min=1.0, r2_stat=1, r3=1.5, r3_max=2.0, r3_min=1.0, r3_stat=1))
+            db.session.add(Comment(body='comment', product_id=p.id, author_id=self.user_id))
+            self.product_ids.append(p.id)
+        db.session.commit()
+
+    def tearDown(self):
+        archive.dispose()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_run(self):
+        archive.batch_size = 2
+        try:
+            totals = archive.run(after_days=30)
+        finally:
+            archive.batch_size = self.app.config['ARCHIVE_BATCH_SIZE']
+        self.assertTrue(totals == {'product': 3, 'status': 3, 'operation': 3, 'comments': 3})
+        self.assertTrue([p.id for p in Product.query.all()] == self.product_ids[3:])
+        self.assertTrue(Status.query.count() == 1 and Operation.query.count() == 1 and Comment.query.count() == 1)
+        self.assertTrue(sorted(os.listdir(self.directory)) == ['archive-2017-01.sqlite', 'archive-2017-02.sqlite'])
+        self.assertTrue(dict((a.product_id, a.archive) for a in Archived_Product.query.all()) == {
+            self.product_ids[0]: '2017-01', self.product_ids[1]: '2017-02', self.product_ids[2]: '2017-02'})
+        session = archive.session('2017-02')
+        self.assertTrue(session.query(Status).count() == 2)
+        # archive has no credentials
+        self.assertTrue(session.query(User).one().password_hash is None)
+        session.close()
+
+    def test_rerun(self):
+        # interrupted run - rows were copied to archive but not deleted from hot tables
+        archive.copy(archive.engine('2017-01'), self.product_ids[:1])
+        archive.run(after_days=30)
+        session = archive.session('2017-01')
+        self.assertTrue(session.query(Operation).count() == 1)
+        session.close()
+
+    def test_write_during_run(self):
+        # status written between copy and delete is neither lost nor deleted, product stays until next run
+        copy = archive.copy
+
+        def copy_and_write(engine, product_ids):
+            result = copy(engine, product_ids)
+            db.session.add(Status(2, product_ids[0], 11, user=self.user_id, date_time=str(datetime.now())))
+            db.session.commit()
+            return result
+        archive.copy = copy_and_write
+        try:
+            archive.run(after_days=30, limit=1)
+        finally:
+            del archive.copy
+        self.assertTrue(Product.query.get(self.product_ids[0]) is not None)
+        self.assertTrue([s.status for s in Status.query.filter_by(product_id=self.product_ids[0])] == [2])
+        self.assertTrue(Operation.query.filter_by(product_id=self.product_ids[0]).count() == 0)
+        archive.run(after_days=30, limit=1)
+        self.assertTrue(Product.query.get(self.product_ids[0]) is None)
+        session = archive.session('2017-01')
+        self.assertTrue(sorted(s.status for s in session.query(Status)) == [1, 2])
+        self.assertTrue(session.query(Operation).count() == 1)
+        session.close()
+
+    def test_lookup(self):
+        archive.run(after_days=30)
+        product, session = archive.find(self.product_ids[1])
+        self.assertTrue(product.statuses.count() == 1)
+        session.close()
+        self.assertTrue(archive.find('missing') == (None, None))
+
+        res = self.client.get('/api/product/{0}'.format(self.product_ids[1]))
+        self.assertTrue(json.loads(res.data.decode('utf-8'))['id'] == self.product_ids[1])
+        self.assertTrue(self.client.get('/api/product/missing').status_code == 404)
+        res = self.client.get('/app/product/{0}'.format(self.product_ids[1]))
+        self.assertTrue(res.status_code == 200)
+        self.assertTrue('moved to archive' in res.data.decode('utf-8'))
+        self.assertTrue(self.client.get('/app/product/{0}'.format(self.product_ids[3])).status_code == 200)
+        self.assertTrue(self.client.get('/app/product/missing').status_code == 404)
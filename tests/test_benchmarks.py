@@ -0,0 +1,41 @@
+import unittest
+from app import create_app, db
+from app.models import Status, Fail_Step
+from app.seed import HistoryGenerator
+from benchmarks.run import run, compare, percentile
+
+
+class BenchmarksTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['QUERY_BUDGET_MODE'] = None
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Fail_Step._ids.clear()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_percentile(self):
+        self.assertTrue(percentile([3, 1, 2], 50) == 2)
+        self.assertTrue(percentile([1, 2, 3, 4], 50) == 2.5)
+        self.assertTrue(percentile([1, 2, 3, 4], 100) == 4)
+
+    def test_compare(self):
+        baseline = {'results': {'a': {'p50': 0.010, 'p90': 0.020, 'queries': 4}, 'b': {'p50': 0.010, 'p90': 0.020, 'queries': 4}}}
+        current = {'results': {'a': {'p50': 0.011, 'p90': 0.021, 'queries': 4}, 'b': {'p50': 0.010, 'p90': 0.020, 'queries': 9}, 'c': {'p50': 1, 'p90': 1, 'queries': 1}}}
+        self.assertTrue(compare(baseline, current, 0.2) == [('b', 'queries', 4, 9)])
+
+    def test_run(self):
+        HistoryGenerator(products=5, operations_min=1, operations_max=2).run()
+        statuses = Status.query.count()
+        data = run(self.app, rounds=2, warmup=0, only=['api.status_station_product', 'api.add_status', 'products.index'])
+        self.assertTrue(sorted(data['results']) == ['api.add_status', 'api.status_station_product', 'products.index'])
+        for result in data['results'].values():
+            self.assertTrue(result['errors'] == 0)
+            self.assertTrue(result['queries'] > 0)
+        # posted statuses are removed after the case
+        self.assertTrue(Status.query.count() == statuses)
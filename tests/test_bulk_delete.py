@@ -0,0 +1,87 @@
+import json
+import unittest
+from app import create_app, db, product_cache
+from app.models import User, Product, Status, Operation, Comment, Wip
+from app.bulkdelete import delete_products, delete_products_by
+from app.querybudget import QueryCounter
+
+
+class BulkDeleteTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['PRODUCT_DELETE_CHUNK'] = 2
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        self.admin = User(login='john', password='cat', is_admin=True)
+        self.operator = User(login='susan', password='cat')
+        db.session.add_all([self.admin, self.operator])
+        self.product_ids = []
+        for serial in range(1, 6):
+            p = Product('0000000001', serial, '02', '18', 1 + serial % 2, 0)
+            db.session.add(p)
+            for station_id in (11, 21):
+                db.session.add(Status(1, p.id, station_id, date_time=u'2018-01-10 10:00:00'))
+                db.session.add(Operation(p.id, station_id, 1, 1, u'2018-01-10 10:00:00'))
+            db.session.add(Comment(body='comment', product_id=p.id))
+            self.product_ids.append(p.id)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def delete(self, url, user, data):
+        data = dict(data, token=user.get_api_token())
+        return self.client.delete(url, data=json.dumps(data), content_type='application/json')
+
+    def remaining(self):
+        return [model.query.count() for model in (Product, Status, Operation, Comment, Wip)]
+
+    def test_delete_products(self):
+        self.assertTrue(Wip.query.count() == 5)
+        with QueryCounter() as counter:
+            counts = delete_products(self.product_ids[:3] + ['missing'])
+        self.assertTrue(counts == {'product': 3, 'status': 6, 'operation': 6, 'comments': 3, 'wip': 3})
+        self.assertTrue(self.remaining() == [2, 4, 4, 2, 2])
+        # 2 chunks, 5 set based DELETEs each
+        self.assertTrue(len([s for s in counter.statements if s.startswith('DELETE')]) == 10)
+        self.assertFalse(product_cache.exists(self.product_ids[0]))
+
+    def test_delete_by_filter(self):
+        counts = delete_products_by({'variant_id': 2})
+        self.assertTrue(counts['product'] == 3 and counts['status'] == 6)
+        self.assertTrue(sorted(p.variant_id for p in Product.query.all()) == [1, 1])
+        self.assertTrue(delete_products_by({'date_to': '2000-01-01'})['product'] == 0)
+
+    def test_webapi(self):
+        res = self.delete('/webapi/1.0/products', self.operator, {'ids': self.product_ids})
+        self.assertTrue(res.status_code == 403)
+        res = self.delete('/webapi/1.0/products', self.admin, {'filter': {}})
+        self.assertTrue(res.status_code == 400)
+        res = self.delete('/webapi/1.0/products', self.admin, {'ids': self.product_ids[:2]})
+        self.assertTrue(json.loads(res.data.decode('utf-8'))['deleted']['operation'] == 4)
+        res = self.delete('/webapi/1.0/products', self.admin, {'filter': {'type': '1'}})
+        self.assertTrue(json.loads(res.data.decode('utf-8'))['deleted']['product'] == 3)
+        self.assertTrue(self.remaining() == [0, 0, 0, 0, 0])
+
+    def test_webapi_filter_types(self):
+        for criteria in ({'variant_id': 'x'}, {'variant_id': True},
+                         {'date_from': 20180101}, {'date_to': ['2018-01-01']}, {'type': {'a': 1}}, ['type']):
+            res = self.delete('/webapi/1.0/products', self.admin, {'filter': criteria})
+            self.assertTrue(res.status_code == 400, criteria)
+        self.assertTrue(self.remaining() == [5, 10, 10, 5, 5])
+        res = self.delete('/webapi/1.0/products', self.admin, {'filter': {'variant_id': '2', 'date_from': ''}})
+        self.assertTrue(json.loads(res.data.decode('utf-8'))['deleted']['product'] == 3)
+        # empty value is not a filter
+        res = self.delete('/webapi/1.0/products', self.admin, {'filter': {'type': '1', 'variant_id': ''}})
+        self.assertTrue(json.loads(res.data.decode('utf-8'))['deleted']['product'] == 2)
+
+    def test_single(self):
+        res = self.delete('/webapi/1.0/products/{0}'.format(self.product_ids[0]), self.admin, {})
+        self.assertTrue(res.status_code == 200)
+        self.assertTrue(self.client.delete('/api/product/{0}'.format(self.product_ids[1])).status_code == 200)
+        self.assertTrue(self.client.delete('/api/product/{0}'.format(self.product_ids[1])).status_code == 404)
+        self.assertTrue(self.remaining() == [3, 6, 6, 3, 3])
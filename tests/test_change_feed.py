@@ -0,0 +1,92 @@
+import json
+import unittest
+from app import create_app, db, change_feed
+from app.models import Status, Operation
+from app.changefeed import parse_event_id
+
+
+class ChangeFeedTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        change_feed.max_duration = 0.3
+        change_feed.poll_interval = 0.05
+        self.client = self.app.test_client()
+        for i in range(3):
+            db.session.add(Status(1, u'0000000001000001', 11 + i, date_time=u'2018-01-10 10:00:{0:02d}'.format(i)))
+        db.session.add(Operation(u'0000000001000002', 12, 1, 1, u'2018-01-10 10:01:00'))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get_events(self, url, **kwargs):
+        res = self.client.get(url, **kwargs)
+        self.assertTrue(res.status_code == 200)
+        self.assertTrue(res.mimetype == 'text/event-stream')
+        events = []
+        for block in res.data.decode('utf-8').split('\n\n'):
+            fields = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+            if 'event' in fields:
+                events.append((fields['id'], fields['event'], json.loads(fields['data'])))
+        return events
+
+    def test_replay(self):
+        events = self.get_events('/api/changes?last_event_id=0:0')
+        self.assertTrue([e[1] for e in events] == ['status', 'status', 'status', 'operation'])
+        self.assertTrue(events[-1][0] == '3:1')
+        self.assertTrue(events[0][2]['station_id'] == 11)
+
+    def test_filters(self):
+        events = self.get_events('/api/changes?last_event_id=0:0&station_id=12')
+        self.assertTrue([e[1] for e in events] == ['status', 'operation'])
+        events = self.get_events('/api/changes?last_event_id=0:0&product_id=0000000001000002')
+        self.assertTrue([e[0] for e in events] == ['0:1'])
+        events = self.get_events('/api/changes?last_event_id=0:0&types=status')
+        self.assertTrue(len(events) == 3)
+        self.assertTrue(self.client.get('/api/changes?types=comment').status_code == 400)
+
+    def test_resume(self):
+        events = self.get_events('/api/changes', headers={'Last-Event-ID': '2:0'})
+        self.assertTrue([e[0] for e in events] == ['3:0', '3:1'])
+        # without event id only new rows are sent
+        self.assertTrue(self.get_events('/api/changes') == [])
+
+    def test_batches(self):
+        change_feed.batch_size = 2
+        try:
+            events = self.get_events('/api/changes?last_event_id=0:0')
+        finally:
+            change_feed.batch_size = self.app.config['CHANGE_FEED_BATCH_SIZE']
+        self.assertTrue([e[0] for e in events] == ['1:0', '2:0', '2:1', '3:1'])
+
+    def test_late_commit(self):
+        seen = {}
+        events, complete = change_feed.fetch((0, 0), seen=seen)
+        self.assertTrue(events[-1][2] == (3, 1))
+        # status with lower id committed after status 5 was sent
+        status = Status(1, u'0000000001000001', 15, date_time=u'2018-01-10 10:00:05')
+        status.id = 5
+        db.session.add(status)
+        db.session.commit()
+        late = Status(1, u'0000000001000001', 14, date_time=u'2018-01-10 10:00:04')
+        late.id = 4
+        events, complete = change_feed.fetch((3, 1), seen=seen)
+        self.assertTrue([(e[1]['station_id'], e[2]) for e in events] == [(15, (5, 1))])
+        db.session.add(late)
+        db.session.commit()
+        events, complete = change_feed.fetch((5, 1), seen=seen)
+        self.assertTrue([(e[1]['station_id'], e[2]) for e in events] == [(14, (5, 1))])
+        self.assertTrue(change_feed.fetch((5, 1), seen=seen)[0] == [])
+        # stream (re)connected with the late row already in window takes it as sent
+        self.assertTrue(change_feed.fetch((5, 1), seen={})[0] == [])
+
+    def test_parse_event_id(self):
+        self.assertTrue(parse_event_id('12:7') == (12, 7))
+        self.assertTrue(parse_event_id('') is None)
+        self.assertTrue(parse_event_id('abc') is None)
+        self.assertTrue(parse_event_id('1:x') is None)
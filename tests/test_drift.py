@@ -0,0 +1,126 @@
+import json
+import unittest
+from flask import render_template
+from app import create_app, drift
+from app.drift import RingBuffer, DriftDetector
+
+
+class RingBufferTestCase(unittest.TestCase):
+    def test_rolling_statistics(self):
+        buf = RingBuffer(3)
+        for value in [1.0, 2.0, 3.0, 4.0]:
+            buf.append(value)
+        self.assertTrue(buf.size == 3)
+        self.assertTrue(buf.last == 4.0)
+        self.assertAlmostEqual(buf.mean, 3.0)
+        self.assertAlmostEqual(buf.std, 1.0)
+
+
+class DriftDetectorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.detector = DriftDetector()
+        self.detector.window_size = 10
+
+    def test_no_tolerance_band_is_ignored(self):
+        self.assertIsNone(self.detector.observe(11, 1, 1, 5.0, 0.0, 0.0))
+        self.assertIsNone(self.detector.observe(11, 1, 1, None, 1.0, 2.0))
+        self.assertTrue(len(self.detector.get_series()) == 0)
+
+    def test_stable_process(self):
+        for i in range(100):
+            self.detector.observe(11, 1, 1, 10.0 + (i % 3 - 1) * 0.1, 8.0, 12.0)
+        self.assertTrue(len(self.detector.active_alerts()) == 0)
+
+    def test_ewma_close_to_max(self):
+        for i in range(20):
+            self.detector.observe(11, 1, 1, 11.8, 8.0, 12.0)
+        alerts = self.detector.active_alerts()
+        self.assertTrue(len(alerts) == 1)
+        self.assertTrue('EWMA_MAX' in alerts[0].reasons)
+
+    def test_cusum_detects_shift(self):
+        for i in range(10):
+            self.detector.observe(21, 2, 3, 10.0 + (i % 2) * 0.1, 8.0, 12.0)
+        self.assertTrue(len(self.detector.active_alerts()) == 0)
+        for i in range(10):
+            self.detector.observe(21, 2, 3, 9.2, 8.0, 12.0)
+        alerts = self.detector.active_alerts(station_id=21)
+        self.assertTrue(len(alerts) == 1)
+        self.assertTrue('CUSUM_DOWN' in alerts[0].reasons)
+        self.assertTrue(alerts[0].result_slot == 3)
+        self.assertTrue(len(self.detector.active_alerts(station_id=11)) == 0)
+
+    def test_alert_is_cleared(self):
+        for i in range(5):
+            self.detector.observe(11, 1, 1, 11.9, 8.0, 12.0)
+        self.assertTrue(len(self.detector.active_alerts()) == 1)
+        for i in range(5):
+            self.detector.observe(11, 1, 1, 10.0, 8.0, 12.0)
+        self.assertTrue(len(self.detector.active_alerts()) == 0)
+
+    def test_rebaseline(self):
+        for i in range(10):
+            self.detector.observe(21, 2, 3, 10.0 + (i % 2) * 0.1, 8.0, 12.0)
+            self.detector.observe(21, 2, 1, 10.0 + (i % 2) * 0.1, 8.0, 12.0)
+        for i in range(10):
+            self.detector.observe(21, 2, 3, 9.2 + (i % 2) * 0.1, 8.0, 12.0)
+        self.assertTrue(len(self.detector.active_alerts()) == 1)
+        # process was adjusted on purpose - new level becomes the baseline
+        self.assertTrue(self.detector.rebaseline(21, 2, 3) == 1)
+        self.assertTrue(len(self.detector.active_alerts()) == 0)
+        series = self.detector.get_series()[-1]
+        self.assertTrue(series.baseline is None and series.cusum_neg == 0.0)
+        for i in range(20):
+            self.detector.observe(21, 2, 3, 9.2 + (i % 2) * 0.1, 8.0, 12.0)
+        self.assertTrue(len(self.detector.active_alerts()) == 0)
+        self.assertAlmostEqual(series.baseline, -0.375)
+        self.assertTrue(self.detector.rebaseline(station_id=21) == 2)
+
+    def test_periodic_rebaseline(self):
+        self.detector.rebaseline_every = 20
+        for i in range(10):
+            self.detector.observe(11, 1, 1, 10.0 + (i % 2) * 0.1, 8.0, 12.0)
+        series = self.detector.get_series()[0]
+        first = series.baseline
+        # slow change within limits of CUSUM - baseline follows it every 20 results
+        for i in range(40):
+            self.detector.observe(11, 1, 1, 10.0 + i * 0.002 + (i % 2) * 0.1, 8.0, 12.0)
+        self.assertTrue(series.baseline > first)
+        self.assertTrue(series.baseline_count == 50)
+        self.detector.rebaseline_every = 0
+        for i in range(40):
+            self.detector.observe(11, 1, 1, 10.0 + (i % 2) * 0.1, 8.0, 12.0)
+        self.assertTrue(series.baseline_count == 50)
+
+
+class DriftViewsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        drift.reset()
+        self.app_context.pop()
+
+    def test_rebaseline_api(self):
+        for i in range(5):
+            drift.observe(11, 1, 1, 11.9, 8.0, 12.0)
+            drift.observe(12, 1, 1, 11.9, 8.0, 12.0)
+        res = self.client.post('/api/drift/rebaseline', data=json.dumps({'station_id': 11}), content_type='application/json')
+        self.assertTrue(res.status_code == 200)
+        self.assertTrue(json.loads(res.get_data(as_text=True))['rebaselined'] == 1)
+        res = self.client.post('/api/drift/rebaseline', data=json.dumps({'station_id': '11'}), content_type='application/json')
+        self.assertTrue(res.status_code == 400)
+        res = self.client.post('/api/drift/rebaseline')
+        self.assertTrue(json.loads(res.get_data(as_text=True))['rebaselined'] == 2)
+
+    def test_banner(self):
+        drift.observe(11, 1, 1, 12.5, 8.0, 12.0)
+        drift.observe(12, 1, 1, 11.9, 8.0, 12.0)
+        with self.app.test_request_context('/'):
+            page = render_template('base.html')
+        self.assertTrue('12.50 &gt; 12.00' in page)
+        self.assertTrue('8.00 &le; 11.90 &le; 12.00' in page)
+        self.assertFalse('&le; 12.50' in page)
@@ -0,0 +1,113 @@
+import os
+import unittest
+from sqlalchemy import create_engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import NullPool, StaticPool
+from config import config, basedir
+from app import create_app, db, metrics, engine_profiles
+from app.engineprofile import MeteredQueuePool, synchronous_off
+
+
+class EngineProfilesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(basedir, 'data-test-profile.sqlite')
+        self.app = None
+
+    def tearDown(self):
+        if self.app is not None:
+            db.session.remove()
+            db.get_engine(self.app).dispose()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def make_app(self, profile):
+        testing = config['testing']
+        original = testing.SQLALCHEMY_DATABASE_URI, testing.DATABASE_ENGINE_PROFILE
+        testing.SQLALCHEMY_DATABASE_URI, testing.DATABASE_ENGINE_PROFILE = 'sqlite:///' + self.path, profile
+        try:
+            self.app = create_app('testing')
+        finally:
+            testing.SQLALCHEMY_DATABASE_URI, testing.DATABASE_ENGINE_PROFILE = original
+        return self.app
+
+    def test_sqlite_ingest(self):
+        app = self.make_app('sqlite-ingest')
+        with app.app_context():
+            engine = db.engine
+            self.assertTrue(isinstance(engine.pool, MeteredQueuePool))
+            self.assertTrue(engine.pool.size() == 5)
+            self.assertTrue(engine.execute('PRAGMA journal_mode').scalar() == 'wal')
+            self.assertTrue(engine.execute('PRAGMA synchronous').scalar() == 1)  # NORMAL
+            self.assertTrue(engine.execute('PRAGMA temp_store').scalar() == 2)  # MEMORY
+            self.assertTrue(db.get_engine() is engine)
+            self.assertTrue(engine_profiles.engines[engine] == 'sqlite-ingest')
+
+    def test_pool_metrics(self):
+        app = self.make_app('sqlite-ingest')
+        metrics.reset()
+        with app.app_context():
+            connection = db.engine.connect()
+            try:
+                samples = dict((name, value) for name, labels, value in engine_profiles.collect() if labels == {'pool': 'data-test-profile.sqlite'})
+                self.assertTrue(samples['db_pool_checked_out'] == 1)
+                self.assertTrue(samples['db_pool_saturation'] == 1.0 / 15)
+            finally:
+                connection.close()
+            self.assertTrue(any(name == 'db_pool_checkout_wait_seconds' for name, labels in metrics.histograms))
+            res = app.test_client().get('/api/metrics')
+            self.assertTrue('db_pool_saturation{pool="data-test-profile.sqlite"}' in res.get_data(as_text=True))
+
+    def test_test_profile(self):
+        app = self.make_app('test')
+        with app.app_context():
+            self.assertTrue(isinstance(db.engine.pool, NullPool))
+            self.assertTrue(db.engine.execute('PRAGMA synchronous').scalar() == 0)  # OFF
+
+    def test_auto(self):
+        app = self.make_app(None)
+        options = {}
+        engine_profiles.apply(app, make_url('mysql+pymysql://trace:trace@db/trace'), options)
+        self.assertTrue(options['pool_pre_ping'] and options['pool_recycle'] == 280)
+        self.assertTrue(options['pool_logging_name'] == 'db/trace')
+        with app.app_context():
+            self.assertTrue(isinstance(db.engine.pool, MeteredQueuePool))
+
+    def test_memory_database(self):
+        app = self.make_app(None)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        with app.app_context():
+            db.create_all()
+            engine = db.engine
+            self.assertFalse(isinstance(engine.pool, MeteredQueuePool))
+            first, second = engine.connect(), engine.connect()
+            try:
+                tables = "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'"
+                self.assertTrue(first.execute(tables).scalar() > 0)
+                self.assertTrue(second.execute(tables).scalar() == first.execute(tables).scalar())
+            finally:
+                first.close()
+                second.close()
+
+    def test_synchronous_off(self):
+        # bulk import batch failed in the middle - pooled connection still gets its setting back
+        engine = create_engine('sqlite://', poolclass=StaticPool)
+        engine.execute('PRAGMA synchronous = NORMAL')
+        try:
+            with engine.connect() as connection, synchronous_off(connection), connection.begin():
+                self.assertTrue(connection.execute('PRAGMA synchronous').scalar() == 0)
+                raise KeyError('batch')
+        except KeyError:
+            pass
+        self.assertTrue(engine.execute('PRAGMA synchronous').scalar() == 1)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, self.make_app, 'fast')
+        app = self.make_app('mysql-prod')
+        with app.app_context():
+            self.assertRaises(ValueError, lambda: db.engine)
+        self.app = None
+
+
+if __name__ == '__main__':
+    unittest.main()
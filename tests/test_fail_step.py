@@ -0,0 +1,86 @@
+import unittest
+import json
+from app import create_app, db
+from app.models import Status, Fail_Step
+
+
+class FailStepTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Fail_Step._ids.clear()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_status(self, station_id, fail_step, status=2, date_time=u'2018-01-10 10:00:00'):
+        return self.client.post('/api/status', data=json.dumps({
+            'status': status,
+            'station_id': station_id,
+            'product_id': u'0000000001000001{0}'.format(station_id),
+            'date_time': date_time,
+            'fail_step': fail_step,
+        }), content_type='application/json')
+
+    def test_intern(self):
+        id1 = Fail_Step.intern(u'leak test')
+        id2 = Fail_Step.intern(u'leak test')
+        db.session.commit()
+        self.assertTrue(id1 == id2)
+        self.assertTrue(Fail_Step.intern(u'') is None)
+        self.assertTrue(Fail_Step.query.count() == 1)
+
+    def test_ingest_and_pareto(self):
+        for fail_step in [u'leak test', u'leak test', u'torque', u'leak test', u'']:
+            res = self.add_status(21, fail_step)
+            self.assertTrue(res.status_code == 201)
+        self.add_status(31, u'torque', date_time=u'2018-02-10 10:00:00')
+
+        self.assertTrue(Status.query.filter(Status.fail_step_id.is_(None)).count() == 1)
+        pareto = Fail_Step.pareto()
+        self.assertTrue([(p[1], p[2]) for p in pareto] == [(u'leak test', 3), (u'torque', 2)])
+        self.assertAlmostEqual(pareto[-1][3], 100.0)
+
+        pareto = Fail_Step.pareto(station_id=31)
+        self.assertTrue([(p[1], p[2]) for p in pareto] == [(u'torque', 1)])
+        pareto = Fail_Step.pareto(start_date='2018-02-01', end_date='2018-03-01')
+        self.assertTrue([(p[1], p[2]) for p in pareto] == [(u'torque', 1)])
+        # date without time includes whole end day
+        pareto = Fail_Step.pareto(start_date='2018-02-10', end_date='2018-02-10')
+        self.assertTrue([(p[1], p[2]) for p in pareto] == [(u'torque', 1)])
+        pareto = Fail_Step.pareto(end_date='2018-02-10 09:00')
+        self.assertTrue([(p[1], p[2]) for p in pareto] == [(u'leak test', 3), (u'torque', 1)])
+        self.assertRaises(ValueError, Fail_Step.pareto, end_date='yesterday')
+
+        res = self.client.get('/app/statistics/fail_steps?station_id=21')
+        self.assertTrue(res.status_code == 200)
+        self.assertTrue(b'leak test' in res.data)
+        fail_step_id = Fail_Step.intern(u'torque')
+        res = self.client.get('/app/statistics/fail_steps/{0}'.format(fail_step_id))
+        self.assertTrue(res.status_code == 200)
+        self.assertTrue(b'/app/product/000000000100000131' in res.data)
+        res = self.client.get('/app/statistics/fail_steps/{0}?end_date=2018-02-10'.format(fail_step_id))
+        self.assertTrue(b'/app/product/000000000100000131' in res.data)
+        res = self.client.get('/app/statistics/fail_steps/{0}?end_date=2018-02-09'.format(fail_step_id))
+        self.assertFalse(b'/app/product/000000000100000131' in res.data)
+        res = self.client.get('/app/statistics/fail_steps?end_date=yesterday')
+        self.assertTrue(res.status_code == 200)
+
+    def test_intern_cache_is_bounded(self):
+        self.app.config['FAIL_STEP_CACHE_SIZE'] = 2
+        ids = [Fail_Step.intern(name) for name in (u'leak test', u'torque', u'leak test', u'pressure')]
+        self.assertTrue(list(Fail_Step._ids) == [u'leak test', u'pressure'])
+        self.assertTrue(Fail_Step.intern(u'torque') == ids[1])
+        fail_step = Fail_Step.query.get(ids[0])
+        db.session.delete(fail_step)
+        db.session.commit()
+        self.assertFalse(u'leak test' in Fail_Step._ids)
+        # ids of dropped table are not valid any more
+        db.drop_all()
+        self.assertFalse(Fail_Step._ids)
+        db.create_all()
@@ -0,0 +1,117 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from app import create_app, db
+from app.models import Product, Status, Operation, Fail_Step, Wip, Import_Checkpoint
+from app.importer import Importer
+from app.validation import ValidationError, status_values, operation_values
+
+
+class Interrupted(Exception):
+    pass
+
+
+class ImporterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        self.directory = tempfile.mkdtemp()
+        self.product_ids = []
+        for serial in range(1, 4):
+            p = Product('0000000001', serial, '02', '18', 1, 0)
+            db.session.add(p)
+            self.product_ids.append(p.id)
+        db.session.commit()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def write(self, name, lines):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        return path
+
+    def test_validation(self):
+        values = status_values({'status': 1, 'station_id': 11, 'product_id': u'1'})
+        self.assertTrue(values['date_time'] is None and values['fail_step'] == '')
+        self.assertRaises(ValidationError, status_values, {'status': 1, 'station_id': 11})
+        self.assertRaises(ValidationError, status_values, {'status': 1, 'station_id': u'11', 'product_id': u'1'})
+        self.assertRaises(ValidationError, status_values, {'status': True, 'station_id': 11, 'product_id': u'1'})
+        self.assertRaises(ValidationError, status_values, {'status': 1, 'station_id': 11, 'product_id': 1})
+        values = operation_values({'product_id': u'1', 'station_id': 11, 'operation_status_id': 1, 'operation_type_id': 2, 'result_1': 1})
+        self.assertTrue(values['result_1'] == 1 and values['result_2'] is None)
+        self.assertRaises(ValidationError, operation_values, {'product_id': u'1', 'station_id': 11, 'operation_status_id': 1, 'operation_type_id': 2, 'result_1': u'1.5'})
+        self.assertRaises(ValidationError, operation_values, {'product_id': u'1', 'station_id': 11, 'operation_status_id': 1, 'operation_type_id': 2, 'result_1_status_id': 1.0})
+        # API applies the same rules
+        res = self.client.post('/api/status', data=json.dumps({'status': 1, 'station_id': 11}), content_type='application/json')
+        self.assertTrue(res.status_code == 400)
+
+    def test_csv_statuses(self):
+        first, second, third = self.product_ids
+        path = self.write('statuses.csv', [
+            'status,station_id,product_id,date_time,fail_step',
+            '1,11,{0},2018-01-10 10:00:00,'.format(first),
+            '2,11,{0},2018-01-10 10:01:00,torque'.format(second),
+            'x,11,{0},2018-01-10 10:02:00,'.format(third),  # status is not a number
+            '1,55,{0},2018-01-10 10:03:00,'.format(first),
+        ])
+        counts = Importer(path, 'status', batch_size=2).run()
+        self.assertTrue(counts == {'imported': 3, 'rejected': 1, 'skipped': 0, 'wip': 1})
+        statuses = Status.query.order_by(Status.id).all()
+        self.assertTrue([(s.status, s.station_id, s.product_id) for s in statuses] == [(1, 11, first), (2, 11, second), (1, 55, first)])
+        self.assertTrue(statuses[1].fail_step == u'torque' and statuses[1].fail_step_id == Fail_Step.query.filter_by(name=u'torque').one().id)
+        self.assertTrue(statuses[0].date_time == u'2018-01-10 10:00:00' and statuses[0].fail_step_id is None)
+        # WIP is rebuilt once after import - first product was stamped at station 55
+        self.assertTrue([w.product_id for w in Wip.query.all()] == [second])
+        checkpoint = Import_Checkpoint.query.get(os.path.abspath(path))
+        self.assertTrue((checkpoint.kind, checkpoint.position, checkpoint.imported, checkpoint.rejected) == ('status', 4, 3, 1))
+
+    def test_ndjson_operations(self):
+        first = self.product_ids[0]
+        path = self.write('operations.ndjson', [
+            json.dumps({'product_id': first, 'station_id': 21, 'operation_status_id': 1, 'operation_type_id': 3, 'date_time': '2018-01-10 10:00:00',
+                        'result_1': 12.5, 'result_1_max': 14.0, 'result_1_min': 11.0, 'result_1_status_id': 1}),
+            '{"product_id": ',
+            '',
+            json.dumps({'product_id': first, 'station_id': 21, 'operation_status_id': 1, 'operation_type_id': 4, 'result_1': True}),
+            json.dumps({'product_id': first, 'station_id': 21, 'operation_status_id': 2, 'operation_type_id': 4}),
+        ])
+        counts = Importer(path, 'operation').run()
+        self.assertTrue(counts == {'imported': 2, 'rejected': 2, 'skipped': 0})
+        operations = Operation.query.order_by(Operation.id).all()
+        self.assertTrue([(o.operation_type_id, o.result_1, o.result_1_max) for o in operations] == [(3, 12.5, 14.0), (4, None, None)])
+        self.assertTrue(operations[1].date_time is not None and operations[1].prodasync == 0)
+
+    def test_resume(self):
+        path = self.write('statuses.ndjson', [
+            json.dumps({'status': 1, 'station_id': station_id, 'product_id': product_id, 'date_time': '2018-01-10 10:00:00'})
+            for product_id in self.product_ids for station_id in (11, 21)])
+
+        def interrupt(counts, elapsed):
+            raise Interrupted()
+
+        self.assertRaises(Interrupted, Importer(path, 'status', batch_size=4).run, progress=interrupt)
+        self.assertTrue(Status.query.count() == 4)
+        counts = Importer(path, 'status', batch_size=4).run()
+        self.assertTrue(counts == {'imported': 6, 'rejected': 0, 'skipped': 4, 'wip': 3})
+        self.assertTrue(Status.query.count() == 6)
+        # repeated import of finished file inserts nothing
+        self.assertTrue(Importer(path, 'status').run()['skipped'] == 6)
+        self.assertTrue(Status.query.count() == 6)
+        # restart imports the whole file again
+        self.assertTrue(Importer(path, 'status').run(restart=True)['imported'] == 6)
+        self.assertTrue(Status.query.count() == 12)
+        self.assertRaises(ValueError, Importer(path, 'operation').run)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import json
+import threading
+import unittest
+from app import create_app, db, ingest, metrics
+from app.ingest import IngestQueue, IngestQueueFull
+from app.models import Status, Operation
+
+
+class IngestQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['INGEST_QUEUE'] = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        metrics.reset()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        ingest.stop()
+        self.app.config['INGEST_QUEUE'] = False
+        ingest.init_app(self.app)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def enable(self, ack):
+        self.app.config['INGEST_ACK'] = ack
+        ingest.init_app(self.app)
+
+    def post_status(self, serial, station_id=11):
+        return self.client.post('/api/status', data=json.dumps({
+            'status': 1, 'station_id': station_id, 'product_id': u'00000000010000{0:02d}0218'.format(serial), 'date_time': u'2018-01-10 10:00:00'}),
+            content_type='application/json')
+
+    def test_ack_after_commit(self):
+        self.enable('commit')
+        res = self.post_status(1)
+        self.assertTrue(res.status_code == 201)
+        status = json.loads(res.data.decode('utf-8'))
+        self.assertTrue(status['id'] is not None)
+        self.assertTrue(Status.query.get(status['id']).product_id == u'0000000001000001' + u'0218')
+        res = self.client.post('/api/operation', data=json.dumps({
+            'product_id': u'0000000001000001', 'station_id': 11, 'operation_status_id': 1, 'operation_type_id': 301, 'result_1': 12.5}),
+            content_type='application/json')
+        self.assertTrue(res.status_code == 201)
+        self.assertTrue(Operation.query.count() == 1)
+        self.assertTrue('ingest_rows_total{kind="status"} 1.0' in metrics.render())
+
+    def test_ack_after_enqueue_and_drain(self):
+        self.enable('enqueue')
+        for serial in range(20):
+            res = self.post_status(serial)
+            self.assertTrue(res.status_code == 202)
+        ingest.stop()
+        self.assertTrue(Status.query.count() == 20)
+        self.assertTrue('ingest_queue_depth 0.0' in metrics.render())
+
+    def test_group_commit(self):
+        self.enable('enqueue')
+        ingest.flush_interval = 0.2
+        for serial in range(10):
+            self.post_status(serial)
+        ingest.stop()
+        data = metrics.render()
+        self.assertTrue('ingest_batch_size_count 1' in data or 'ingest_batch_size_count 2' in data)
+
+    def test_backpressure(self):
+        self.enable('enqueue')
+        ingest.queue.maxsize = 1
+        ingest.enqueue_timeout = 0.01
+        ingest.thread = threading.current_thread()  # pretend writer is running but stalled
+        try:
+            self.assertTrue(self.post_status(1).status_code == 202)
+            res = self.post_status(2)
+            self.assertTrue(res.status_code == 503)
+            self.assertTrue(res.headers['Retry-After'] == '1')
+            self.assertTrue('ingest_queue_rejected_total 1.0' in metrics.render())
+        finally:
+            ingest.thread = None
+        ingest.start()
+        ingest.stop()
+        self.assertTrue(Status.query.count() == 1)
+
+    def test_commit_timeout(self):
+        self.enable('commit')
+        ingest.commit_timeout = 0.01
+        ingest.thread = threading.current_thread()  # pretend writer is running but stalled
+        try:
+            res = self.post_status(1)
+            # record stays queued - 202 so PLC does not send it again
+            self.assertTrue(res.status_code == 202)
+        finally:
+            ingest.thread = None
+        ingest.start()
+        ingest.stop()
+        self.assertTrue(Status.query.count() == 1)
+
+    def test_queue_full(self):
+        q = IngestQueue()
+        q.queue.maxsize = 1
+        q.enqueue_timeout = 0
+        q.thread = threading.current_thread()
+        q.submit(Status(1, u'0000000001000001', 11))
+        self.assertRaises(IngestQueueFull, q.submit, Status(1, u'0000000001000002', 11))
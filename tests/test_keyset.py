@@ -0,0 +1,75 @@
+import re
+import unittest
+from app import create_app, db
+from app.models import User, Status, Operation
+from app.keyset import KeysetPagination, parse_jump_date
+from app.querybudget import QueryCounter
+
+
+class KeysetPaginationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['STATUSES_PER_PAGE'] = 10
+        self.app.config['OPERATIONS_PER_PAGE'] = 10
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        for i in range(25):
+            date_time = u'2018-01-{0:02d} 10:00:00'.format(i + 1)
+            db.session.add(Status(1, u'0000000001000001', 11, date_time=date_time))
+            db.session.add(Operation(u'0000000001000001', 11, 1, 1, date_time))
+        u = User(login='john')
+        db.session.add(u)
+        db.session.commit()
+        with self.client.session_transaction() as session:
+            session['user_id'] = str(u.id)
+            session['_fresh'] = True
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def page_ids(self, url):
+        res = self.client.get(url)
+        self.assertTrue(res.status_code == 200)
+        data = res.data.decode('utf-8')
+        ids = [int(i) for i in re.findall(r'<tr>\s*<td>(\d+)</td>', data)]
+        older = re.search(r'href="[^"]*\?before=(\d+)"', data)
+        newer = re.search(r'href="[^"]*\?after=(\d+)"', data)
+        return ids, older and int(older.group(1)), newer and int(newer.group(1))
+
+    def test_walk(self):
+        for base in ('/app/statuses/', '/app/operations/'):
+            ids, older, newer = self.page_ids(base)
+            self.assertTrue(ids == list(range(25, 15, -1)) and newer is None)
+            seen = list(ids)
+            while older is not None:
+                ids, older, newer = self.page_ids('{0}?before={1}'.format(base, older))
+                seen.extend(ids)
+            self.assertTrue(seen == list(range(25, 0, -1)))
+            # back from the oldest page
+            ids, older, newer = self.page_ids('{0}?after={1}'.format(base, newer))
+            self.assertTrue(ids == list(range(15, 5, -1)) and older == 6 and newer == 15)
+
+    def test_no_count(self):
+        db.session.remove()
+        with QueryCounter() as counter:
+            self.client.get('/app/operations/?before=20')
+        self.assertFalse([s for s in counter.statements if 'count(' in s.lower()])
+
+    def test_jump_to_date(self):
+        ids, older, newer = self.page_ids('/app/statuses/?date=2018-01-12')
+        self.assertTrue(ids == list(range(12, 2, -1)) and newer == 12)
+        ids, older, newer = self.page_ids('/app/operations/?date=2018-01-12 09:00')
+        self.assertTrue(ids[0] == 11)
+        self.assertTrue(self.page_ids('/app/statuses/?date=2017-01-01')[0] == [])
+        res = self.client.get('/app/statuses/?date=yesterday-ish')
+        self.assertTrue(res.status_code == 200 and 'Invalid date' in res.data.decode('utf-8'))
+
+    def test_pagination(self):
+        pagination = KeysetPagination(Status.query, Status.id, 10, after=20)
+        self.assertTrue([s.id for s in pagination.items] == list(range(25, 20, -1)))
+        self.assertTrue(pagination.newer is None and pagination.older == {'before': 21})
+        self.assertTrue(parse_jump_date('2018-01-12') == '2018-01-13 00:00:00')
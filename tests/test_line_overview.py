@@ -0,0 +1,80 @@
+import unittest
+from app import create_app, db
+from app.models import User, Station, Status, Operation_Status, Unit
+from app.querybudget import QueryCounter
+from app.stations.routes import line_overview
+
+
+class LineOverviewTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        db.session.add(Unit(1))
+        db.session.add(Operation_Status(1, name='OK', unit_id=1))
+        db.session.add(Operation_Status(2, name='NOK', unit_id=1))
+        for station_id in (11, 12, 13):
+            db.session.add(Station(station_id))
+        for i, status in enumerate([1, 1, 2, 2, 2]):
+            db.session.add(Status(status, u'000000000100000{0}'.format(i), 11, date_time=u'2018-01-10 10:0{0}:{1:02d}'.format(i * 20 // 60, i * 20 % 60)))
+        db.session.add(Status(1, u'0000000001000009', 12, date_time=u'2018-01-10 10:05:00'))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self):
+        u = User(login='john')
+        db.session.add(u)
+        db.session.commit()
+        with self.client.session_transaction() as session:
+            session['user_id'] = str(u.id)
+            session['_fresh'] = True
+
+    def count_queries(self, url):
+        db.session.remove()
+        with QueryCounter() as counter:
+            res = self.client.get(url)
+        self.assertTrue(res.status_code == 200)
+        return counter.count
+
+    def test_overview(self):
+        overview = line_overview()
+        self.assertTrue(overview[11]['product_id'] == u'0000000001000004')
+        self.assertTrue(overview[11]['status'] == 2)
+        self.assertTrue(overview[11]['streak'] == 3)
+        self.assertTrue(overview[11]['cycle_time'] == 20.0)
+        self.assertTrue(overview[12]['streak'] == 1)
+        self.assertTrue(overview[12]['cycle_time'] is None)
+        self.assertTrue(13 not in overview)
+        self.assertFalse(overview[11]['streak_more'] or overview[12]['streak_more'])
+
+    def test_streak_limit(self):
+        self.app.config['STATION_STREAK_LIMIT'] = 2
+        overview = line_overview()
+        self.assertTrue(overview[11]['streak'] == 2 and overview[11]['streak_more'])
+        self.assertTrue(overview[12]['streak'] == 1 and not overview[12]['streak_more'])
+        self.login()
+        self.assertTrue('2+ &times; NOK' in self.client.get('/app/stations/live').data.decode('utf-8'))
+
+    def test_page(self):
+        self.login()
+        res = self.client.get('/app/stations/live')
+        data = res.data.decode('utf-8')
+        self.assertTrue('id="live-station-13"' in data)
+        self.assertTrue('3 &times; NOK' in data)
+        self.assertTrue('last_event_id=6%3A0' in data or 'last_event_id=6:0' in data)
+
+    def test_fixed_queries(self):
+        self.login()
+        small = self.count_queries('/app/stations/live')
+        for i in range(20):
+            db.session.add(Station(21 + i))
+            db.session.add(Status(1 + i % 2, u'0000000001000010', 21 + i, date_time=u'2018-01-10 11:00:00'))
+            db.session.add(Status(1, u'0000000001000011', 11, date_time=u'2018-01-10 11:00:{0:02d}'.format(i)))
+        db.session.commit()
+        self.assertTrue(self.count_queries('/app/stations/live') == small)
@@ -0,0 +1,68 @@
+import unittest
+from app import create_app, db
+from app.models import User, Station, Status, Operation, Operation_Status, Operation_Type, Unit
+from app.querybudget import QueryCounter
+from app.rows import StatusRow, OperationRow
+
+
+class ListRowsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        db.session.add(Unit(1))
+        db.session.add(Operation_Status(1, name='OK', unit_id=1))
+        db.session.add(Operation_Status(2, name='NOK', unit_id=1))
+        db.session.add(Operation_Status(3, name='Torque', unit_id=1))
+        db.session.add(Operation_Type(1, name='Screwing'))
+        db.session.add(Station(11, name='Start'))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_rows(self, count):
+        for i in range(count):
+            db.session.add(Status(1 + i % 2, u'0000000001000001', 11, date_time=u'2018-01-10 10:00:00'))
+            db.session.add(Operation(u'0000000001000001', 11, 1, 1, u'2018-01-10 10:00:00', r1=1.5, r1_max=2.0, r1_min=1.0, r1_stat=3))
+        db.session.commit()
+
+    def login(self):
+        u = User(login='john', is_admin=True)
+        db.session.add(u)
+        db.session.commit()
+        with self.client.session_transaction() as session:
+            session['user_id'] = str(u.id)
+            session['_fresh'] = True
+
+    def count_queries(self, url):
+        db.session.remove()
+        with QueryCounter() as counter:
+            res = self.client.get(url)
+        self.assertTrue(res.status_code == 200)
+        return counter.count, res.data.decode('utf-8')
+
+    def test_rows(self):
+        self.add_rows(2)
+        db.session.remove()
+        statuses = StatusRow.build(StatusRow.query().order_by(Status.id.asc()).all())
+        operations = OperationRow.build(OperationRow.query().all())
+        self.assertFalse(hasattr(statuses[0], '__dict__'))
+        self.assertTrue([s.status_name for s in statuses] == ['OK', 'NOK'])
+        self.assertTrue(statuses[0].station_name == 'Start')
+        self.assertTrue(operations[0].operation_type_name == 'Screwing')
+        self.assertTrue(operations[0].results == [(1.5, 1.0, 2.0, 'Torque')])
+        self.assertTrue(len(db.session.identity_map) == 0)
+
+    def test_fixed_queries(self):
+        self.login()
+        self.add_rows(2)
+        small = [self.count_queries(url)[0] for url in ('/app/statuses/', '/app/operations/')]
+        self.add_rows(30)
+        large = [self.count_queries(url) for url in ('/app/statuses/', '/app/operations/')]
+        self.assertTrue([count for count, data in large] == small)
+        self.assertTrue('Screwing' in large[1][1] and 'Torque' in large[1][1])
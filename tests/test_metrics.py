@@ -0,0 +1,87 @@
+import os
+import json
+import shutil
+import tempfile
+import subprocess
+import unittest
+from app import create_app, db, metrics
+from app.metrics import Metrics, LATENCY_BUCKETS
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        metrics.reset()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_request_and_sql_metrics(self):
+        res = self.client.post('/api/status', data=json.dumps({
+            'status': 1, 'station_id': 11, 'product_id': u'0000000001000001', 'date_time': u'2018-01-10 10:00:00'}),
+            content_type='application/json')
+        self.assertTrue(res.status_code == 201)
+        res = self.client.get('/api/metrics')
+        self.assertTrue(res.status_code == 200)
+        self.assertTrue(res.content_type.startswith('text/plain'))
+        data = res.data.decode('utf-8')
+        self.assertTrue('# TYPE http_request_duration_seconds histogram' in data)
+        self.assertTrue('http_request_duration_seconds_count{endpoint="api.add_status"} 1' in data)
+        self.assertTrue('http_requests_total{endpoint="api.add_status",method="POST",status="201"} 1.0' in data)
+        self.assertTrue('ingest_rows_total{kind="status"} 1.0' in data)
+        self.assertTrue('sql_queries_per_request_bucket{endpoint="api.add_status",le="+Inf"} 1' in data)
+        self.assertTrue('sql_queries_total ' in data)
+
+    def test_multiprocess_aggregation(self):
+        directory = tempfile.mkdtemp()
+        try:
+            m = Metrics()
+            m.multiproc_dir = directory
+            m.inc('ingest_rows_total', 2, kind='status')
+            m.observe('http_request_duration_seconds', 0.02, endpoint='api.add_status')
+            with open(os.path.join(directory, 'metrics_1.json'), 'w') as f:
+                json.dump({
+                    'counters': [['ingest_rows_total', [['kind', 'status']], 3]],
+                    'gauges': [],
+                    'histograms': [['http_request_duration_seconds', [['endpoint', 'api.add_status']], list(LATENCY_BUCKETS), [1] + [0] * (len(LATENCY_BUCKETS) - 1), 0.005, 1]],
+                }, f)
+            data = m.render()
+            self.assertTrue('ingest_rows_total{kind="status"} 5.0' in data)
+            self.assertTrue('http_request_duration_seconds_count{endpoint="api.add_status"} 2' in data)
+            self.assertTrue('http_request_duration_seconds_bucket{endpoint="api.add_status",le="0.005"} 1' in data)
+            self.assertTrue('http_request_duration_seconds_bucket{endpoint="api.add_status",le="0.025"} 2' in data)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_multiprocess_gauges(self):
+        directory = tempfile.mkdtemp()
+        try:
+            m = Metrics()
+            m.multiproc_dir = directory
+            m.set('change_feed_clients', 2)
+            process = subprocess.Popen(['sleep', '0'])
+            process.wait()
+            for pid, value in ((1, 5), (process.pid, 9)):
+                with open(os.path.join(directory, 'metrics_{0}.json'.format(pid)), 'w') as f:
+                    json.dump({'counters': [['ingest_rows_total', [], 1]], 'gauges': [['change_feed_clients', [], value]], 'histograms': []}, f)
+            data = m.render()
+            # gauge of exited worker is dropped, the others are not summed
+            self.assertTrue('change_feed_clients 5.0' in data)
+            self.assertTrue('ingest_rows_total 2.0' in data)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_sql_errors(self):
+        try:
+            db.engine.execute('select * from no_such_table')
+        except Exception:
+            pass
+        data = metrics.render()
+        self.assertTrue('sql_errors_total 1.0' in data)
+        self.assertTrue('db_lock_errors_total' not in data)
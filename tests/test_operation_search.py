@@ -0,0 +1,78 @@
+import json
+import unittest
+from app import create_app, db
+from app.models import User, Operation
+from app.operations.search import OperationSearch
+
+
+class OperationSearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        # station 11/12, operation type 1/2, status 1/2, every 5th operation out of tolerance
+        for i in range(20):
+            r1 = 3.0 if i % 5 == 0 else 1.5
+            db.session.add(Operation(u'0000000001000001', 11 + i % 2, 1 + i % 4 // 2, 1 + i % 3 // 2, u'2018-01-{0:02d} 10:00:00'.format(i + 1),
+                                     r1=r1, r1_min=1.0, r1_max=2.0, r1_stat=1))
+        db.session.add(Operation(u'0000000001000001', 11, 1, 1, u'2018-02-01 10:00:00', r1=5.0, r1_min=0.0, r1_max=0.0, r1_stat=1))  # no limits
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def search(self, query):
+        res = self.client.get('/api/operation?' + query)
+        self.assertTrue(res.status_code == 200)
+        return json.loads(res.data.decode('utf-8'))
+
+    def ids(self, query):
+        return [o['id'] for o in self.search(query)['json_list']]
+
+    def expected(self, condition):
+        return sorted([o.id for o in Operation.query.all() if condition(o)], reverse=True)
+
+    def test_filters(self):
+        self.assertTrue(self.ids('station_id=12') == self.expected(lambda o: o.station_id == 12))
+        self.assertTrue(self.ids('station_id=11&operation_type_id=2') == self.expected(lambda o: o.station_id == 11 and o.operation_type_id == 2))
+        self.assertTrue(self.ids('operation_status_id=2') == self.expected(lambda o: o.operation_status_id == 2))
+        self.assertTrue(self.ids('out_of_tolerance=1') == [16, 11, 6, 1])
+        self.assertTrue(self.ids('date_from=2018-01-05&date_to=2018-01-07') == [7, 6, 5])
+        self.assertTrue(self.client.get('/api/operation?date_from=not-a-date').status_code == 400)
+
+    def test_paging(self):
+        seen = []
+        before = ''
+        while True:
+            data = self.search('station_id=11&limit=3&before={0}'.format(before))
+            seen.extend(o['id'] for o in data['json_list'])
+            if not data['has_more']:
+                break
+            before = data['next_before']
+        self.assertTrue(seen == self.expected(lambda o: o.station_id == 11))
+
+    def test_view(self):
+        u = User(login='john')
+        db.session.add(u)
+        db.session.commit()
+        with self.client.session_transaction() as session:
+            session['user_id'] = str(u.id)
+            session['_fresh'] = True
+        self.app.config['OPERATIONS_PER_PAGE'] = 1
+        res = self.client.get('/app/operations/?station_id=11&out_of_tolerance=1')
+        data = res.data.decode('utf-8')
+        self.assertTrue(res.status_code == 200)
+        self.assertTrue('before=11' in data and 'station_id=11' in data and 'out_of_tolerance=1' in data)
+
+    def test_index_range_scan(self):
+        with self.app.test_request_context('/?station_id=11&operation_type_id=2'):
+            from flask import request
+            query = OperationSearch(request.args).apply(db.session.query(Operation.id)).order_by(Operation.id.desc()).limit(10)
+        statement = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+        plan = ' '.join(row[-1] for row in db.session.execute('EXPLAIN QUERY PLAN {0}'.format(statement)))
+        self.assertTrue('ix_operation_station_id_operation_type_id_id' in plan)
+        self.assertTrue('TEMP B-TREE' not in plan)
@@ -0,0 +1,112 @@
+import json
+import unittest
+from app import create_app, db
+from app.models import Product, Status
+from app.querybudget import QueryCounter
+
+
+class OutboxTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        for i in range(10):
+            db.session.add(Status(1, u'0000000001000001', 11, date_time=u'2018-01-10 10:00:{0:02d}'.format(i)))
+        db.session.add(Product('0000000001', 1, '02', '18', 1, 0))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get_json(self, url):
+        res = self.client.get(url)
+        self.assertTrue(res.status_code == 200)
+        return json.loads(res.data.decode('utf-8'))
+
+    def post_json(self, url, data):
+        return self.client.post(url, data=json.dumps(data), content_type='application/json')
+
+    def test_cursor_pull(self):
+        ids = []
+        cursor = ''
+        while True:
+            data = self.get_json('/api/outbox/status?limit=4&after={0}'.format(cursor))
+            ids.extend(s['id'] for s in data['json_list'])
+            cursor = data['next_cursor']
+            if not data['has_more']:
+                break
+        self.assertTrue(ids == sorted(ids) and len(ids) == 10)
+        data = self.get_json('/api/outbox/product')
+        self.assertTrue(data['json_list'][0]['id'] == Product.calculate_product_id('0000000001', 1, '02', '18'))
+
+    def test_bulk_ack(self):
+        ids = [s.id for s in Status.query.all()]
+        with QueryCounter() as counter:
+            res = self.post_json('/api/outbox/status/ack', {'ids': ids[:6]})
+        self.assertTrue(json.loads(res.data.decode('utf-8'))['updated'] == 6)
+        self.assertTrue(len([s for s in counter.statements if s.startswith('UPDATE')]) == 1)
+        res = self.post_json('/api/outbox/status/ack', {'ids': ids[6:7], 'prodasync': 2})
+        self.assertTrue(json.loads(res.data.decode('utf-8'))['updated'] == 1)
+        self.assertTrue(Status.query.filter_by(prodasync=0).count() == 3)
+        self.assertTrue(self.post_json('/api/outbox/status/ack', {'ids': ids, 'prodasync': 9}).status_code == 400)
+        self.assertTrue(self.post_json('/api/outbox/status/ack', {'ids': 'x'}).status_code == 400)
+
+    def test_ack_chunks(self):
+        self.app.config['OUTBOX_ACK_CHUNK'] = 3
+        ids = [s.id for s in Status.query.all()]
+        res = self.post_json('/api/outbox/status/ack', {'ids': ids})
+        self.assertTrue(json.loads(res.data.decode('utf-8'))['updated'] == 10)
+
+    def test_lease(self):
+        data = self.get_json('/api/outbox/status?limit=4&lease=1')
+        self.assertTrue(all(s['id'] for s in data['json_list']))
+        self.assertTrue(Status.query.filter_by(prodasync=9).count() == 4)
+        # leased records are not returned again
+        data = self.get_json('/api/outbox/status?limit=100')
+        self.assertTrue(len(data['json_list']) == 6)
+        data = self.get_json('/api/outbox/status?limit=100&include_waiting=1')
+        self.assertTrue(len(data['json_list']) == 10)
+        res = self.post_json('/api/outbox/status/release', {})
+        self.assertTrue(json.loads(res.data.decode('utf-8'))['updated'] == 4)
+        self.assertTrue(Status.query.filter_by(prodasync=0).count() == 10)
+
+    def test_lease_is_exclusive(self):
+        from app.outbox import lease_ids
+        ids = [s.id for s in Status.query.order_by(Status.id).limit(4)]
+        # other agent leased two of the records meanwhile
+        Status.query.filter(Status.id.in_([ids[1], ids[3]])).update({'prodasync': 9}, synchronize_session=False)
+        db.session.commit()
+        self.assertTrue(lease_ids(Status, ids) == [ids[0], ids[2]])
+        self.assertTrue(Status.query.filter_by(prodasync=9).count() == 4)
+        data = self.get_json('/api/outbox/status?limit=100&lease=1')
+        self.assertTrue(len(data['json_list']) == 6 and not set(s['id'] for s in data['json_list']) & set(ids))
+
+    def test_pull_races_lease(self):
+        from app import outbox
+        ids = [s.id for s in Status.query.order_by(Status.id).limit(10)]
+        lease_ids = outbox.lease_ids
+
+        def concurrent_lease(model, chunk):
+            # other agent leases records after this pull loaded them
+            db.engine.execute(Status.__table__.update().where(Status.id.in_([ids[1], ids[3]])).values(prodasync=9))
+            return lease_ids(model, chunk)
+
+        outbox.lease_ids = concurrent_lease
+        try:
+            with QueryCounter() as counter:
+                records, cursor = outbox.pull(Status, lease=True, include_waiting=True)
+        finally:
+            outbox.lease_ids = lease_ids
+        returned = [r.id for r in records]
+        self.assertTrue(returned == [i for i in ids if i not in (ids[1], ids[3])])
+        self.assertTrue(all(r.prodasync == 9 and r.serialize['id'] for r in records))
+        # select, two bulk chunk updates at most, rollback and row by row updates - no reloads of records
+        self.assertTrue(len([s for s in counter.statements if s.startswith('SELECT')]) == 1)
+
+    def test_unknown_kind(self):
+        self.assertTrue(self.client.get('/api/outbox/comment').status_code == 404)
+        self.assertTrue(self.client.get('/api/outbox/status?after=abc').status_code == 400)
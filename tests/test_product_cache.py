@@ -0,0 +1,96 @@
+import json
+import unittest
+from app import create_app, db, product_cache, metrics
+from app.models import Product
+from app.productcache import ProductCache, ProductInfo, MISSING
+from app.querybudget import QueryCounter
+
+
+class ProductCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        metrics.reset()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_product(self, serial):
+        p = Product('0000000001', serial, '02', '18', 1, 0)
+        db.session.add(p)
+        db.session.commit()
+        return p.id
+
+    def post_status(self, product_id):
+        return self.client.post('/api/status', data=json.dumps({
+            'status': 1, 'station_id': 11, 'product_id': product_id, 'date_time': u'2018-01-10 10:00:00'}),
+            content_type='application/json')
+
+    def test_filled_on_insert(self):
+        product_id = self.add_product(1)
+        with QueryCounter() as counter:
+            info = product_cache.get(product_id)
+        self.assertTrue(info == ProductInfo(product_id, '0000000001', 1))
+        self.assertTrue(counter.count == 0)
+
+    def test_not_filled_before_commit(self):
+        p = Product('0000000001', 1, '02', '18', 1, 0)
+        db.session.add(p)
+        db.session.flush()
+        self.assertTrue(product_cache.cached(p.id) is MISSING)
+        db.session.rollback()
+        self.assertTrue(product_cache.cached(p.id) is MISSING)
+        self.assertFalse(product_cache.exists(p.id))
+        db.session.add(Product('0000000001', 1, '02', '18', 1, 0))
+        db.session.commit()
+        self.assertTrue(product_cache.cached(p.id) == ProductInfo(p.id, '0000000001', 1))
+
+    def test_lookup_and_invalidation(self):
+        product_id = self.add_product(1)
+        product_cache.clear()
+        self.assertTrue(product_cache.exists(product_id))
+        with QueryCounter() as counter:
+            self.assertTrue(product_cache.exists(product_id))
+        self.assertTrue(counter.count == 0)
+        db.session.delete(Product.query.get(product_id))
+        db.session.commit()
+        self.assertFalse(product_cache.exists(product_id))
+
+    def test_negative_ttl(self):
+        product_id = Product.calculate_product_id('0000000001', 2, '02', '18')
+        self.assertFalse(product_cache.exists(product_id))
+        # inserted by other process - ORM events are not fired here
+        db.engine.execute(Product.__table__.insert(), {'id': product_id, 'type': '0000000001', 'serial': '000002', 'week': '02', 'year': '18', 'variant_id': 1, 'prodasync': 0})
+        self.assertFalse(product_cache.exists(product_id))
+        product_cache.negative_ttl = 0
+        try:
+            other_id = Product.calculate_product_id('0000000001', 3, '02', '18')
+            self.assertFalse(product_cache.exists(other_id))
+            db.engine.execute(Product.__table__.insert(), {'id': other_id, 'type': '0000000001', 'serial': '000003', 'week': '02', 'year': '18', 'variant_id': 1, 'prodasync': 0})
+            self.assertTrue(product_cache.exists(other_id))
+        finally:
+            product_cache.negative_ttl = self.app.config['PRODUCT_CACHE_NEGATIVE_TTL']
+
+    def test_lru_bound(self):
+        cache = ProductCache()
+        cache.size = 2
+        for i in range(3):
+            cache.put(str(i), ProductInfo(str(i), 't', 1))
+        cache.cached('0')  # evicted already
+        self.assertTrue(list(cache.entries) == ['1', '2'])
+        cache.cached('1')
+        cache.put('3', ProductInfo('3', 't', 1))
+        self.assertTrue(list(cache.entries) == ['1', '3'])
+
+    def test_ingest_skips_lookup(self):
+        product_id = self.add_product(1)
+        for i in range(3):
+            self.assertTrue(self.post_status(product_id).status_code == 201)
+        data = metrics.render()
+        self.assertTrue('product_cache_requests_total{result="hit"} 3.0' in data)
+        self.assertTrue('product_cache_requests_total{result="miss"}' not in data)
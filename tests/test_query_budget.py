@@ -0,0 +1,125 @@
+import unittest
+from datetime import datetime, timedelta
+from app import create_app, db
+from app.models import User, Product, Variant, Station, Status, Operation, Operation_Type, Operation_Status, Unit, Comment
+from app.querybudget import QueryCounter, QueryBudgetExceeded, query_budget, statement_shape
+
+STATIONS = [11, 12, 21, 22, 23, 31, 32, 33, 41, 42, 43, 44, 51, 52, 53, 54, 55]
+
+
+class QueryBudgetTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self):
+        u = User(login='john', is_admin=True)
+        db.session.add(u)
+        db.session.commit()
+        with self.client.session_transaction() as session:
+            session['user_id'] = str(u.id)
+            session['_fresh'] = True
+        return u
+
+    def add_references(self):
+        db.session.add(Variant(1))
+        db.session.add(Unit(1))
+        for i in range(1, 4):
+            db.session.add(Operation_Type(i))
+        for i in range(1, 3):
+            db.session.add(Operation_Status(i, unit_id=1))
+        for station_id in STATIONS:
+            db.session.add(Station(station_id))
+        db.session.commit()
+
+    def add_product(self, serial, operations_per_status=3, comments=2, user=None):
+        """
+        Add product which passed all stations with statuses, operations and comments.
+        """
+        product = Product('0000000001', serial, '02', '18', 1, 0)
+        db.session.add(product)
+        date_time = datetime(2018, 1, 10, 10, 0, 0) + timedelta(hours=serial)
+        for station_id in STATIONS:
+            date_time += timedelta(seconds=30)
+            db.session.add(Status(1 + serial % 2, product.id, station_id, user=user, date_time=str(date_time)))
+            for i in range(operations_per_status):
+                db.session.add(Operation(product.id, station_id, 1 + i % 2, 1 + i % 3, str(date_time), r1=1.5, r1_max=2.0, r1_min=1.0, r1_stat=1, r2=2.5, r2_max=3.0, r2_min=2.0, r2_stat=1, r3=0.5, r3_max=1.0, r3_min=0.0, r3_stat=1))
+        for i in range(comments):
+            db.session.add(Comment(body=u'comment {0}'.format(i), product_id=product.id, author_id=user))
+        db.session.commit()
+        return product.id
+
+    def count_queries(self, url):
+        db.session.remove()  # start with empty identity map like real request does
+        with QueryCounter() as counter:
+            res = self.client.get(url)
+        self.assertTrue(res.status_code == 200)
+        return counter.count
+
+    def test_statement_shape(self):
+        self.assertTrue(statement_shape("SELECT * FROM status WHERE id = 12 AND name = 'x'") == "SELECT * FROM status WHERE id = ? AND name = ?")
+        self.assertTrue(statement_shape("SELECT * FROM status\n WHERE id IN (?, ?, ?)") == statement_shape("SELECT * FROM status WHERE id IN (?, ?)"))
+
+    def test_counter_repeated(self):
+        self.add_references()
+        with QueryCounter() as counter:
+            for station_id in STATIONS[:3]:
+                Station.query.filter_by(id=station_id).first()
+        self.assertTrue(counter.count == 3)
+        self.assertTrue(counter.repeated()[0][1] == 3)
+
+    def test_budget_exceeded(self):
+        self.add_references()
+        self.add_product(1)
+        self.add_product(2)
+
+        @query_budget(1)
+        def view():
+            return [p.statuses.count() for p in Product.query.all()]
+
+        with self.app.test_request_context('/'):
+            self.assertRaises(QueryBudgetExceeded, view)
+            self.app.config['QUERY_BUDGET_MODE'] = 'warn'
+            self.assertTrue(view() == [len(STATIONS), len(STATIONS)])
+            self.app.config['QUERY_BUDGET_MODE'] = None
+            self.assertTrue(view() == [len(STATIONS), len(STATIONS)])
+
+    def test_products_index(self):
+        self.add_references()
+        for serial in range(2):
+            self.add_product(serial)
+        small = self.count_queries('/app/')
+        for serial in range(2, 20):
+            self.add_product(serial, operations_per_status=1, comments=1)
+        self.assertTrue(self.count_queries('/app/') == small)
+
+    def test_product(self):
+        user = self.login()
+        self.add_references()
+        small = self.add_product(1, operations_per_status=1, comments=1, user=user.id)
+        large = self.add_product(2, operations_per_status=10, comments=5, user=user.id)
+        self.assertTrue(self.count_queries('/app/product/{0}'.format(large)) == self.count_queries('/app/product/{0}'.format(small)))
+
+    def test_stations_index(self):
+        self.login()
+        self.add_references()
+        self.add_product(1)
+        small = self.count_queries('/app/stations/')
+        self.add_product(2)
+        self.assertTrue(self.count_queries('/app/stations/') == small)
+
+    def test_operation_types_index(self):
+        self.login()
+        self.add_references()
+        self.add_product(1)
+        small = self.count_queries('/app/operation_types/')
+        self.add_product(2)
+        self.assertTrue(self.count_queries('/app/operation_types/') == small)
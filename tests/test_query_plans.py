@@ -0,0 +1,129 @@
+import re
+import unittest
+from flask import request
+from sqlalchemy.engine.url import make_url
+from config import config
+from app import create_app, db
+from app.models import Product, Status, Operation, Fail_Step
+from app.seed import HistoryGenerator
+from app.api.routes import CURRENT_REFERENCE_QUERY
+from app.products.routes import filter_products, product_page
+
+SQLITE_PLAN = re.compile(r'^(SCAN|SEARCH) (?:TABLE )?(\w+)(?: AS (\w+))?(?: USING (AUTOMATIC )?(?:COVERING )?(?:INDEX (\w+)|(INTEGER PRIMARY KEY)))?')
+
+
+class QueryPlansTestCase(unittest.TestCase):
+    """
+    Plans of queries run on every station cycle or page view must use indexes - dropped or renamed index fails
+    here instead of turning the query into table scan in production. Runs EXPLAIN QUERY PLAN on SQLite and
+    EXPLAIN on MySQL (TEST_DATABASE_URL=mysql+pymysql://...).
+    """
+
+    def setUp(self):
+        self.dialect = make_url(config['testing'].SQLALCHEMY_DATABASE_URI).get_backend_name()
+        if self.dialect not in ('sqlite', 'mysql'):
+            self.skipTest('no EXPLAIN support for {0}'.format(self.dialect))
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Fail_Step._ids.clear()
+        HistoryGenerator(products=200, operations_min=2, operations_max=4, nok_rate=0.1).run()
+        db.session.execute('ANALYZE' if self.dialect == 'sqlite' else 'ANALYZE TABLE product, status, operation')
+        self.product_id = db.session.query(Product.id).order_by(Product.id).first()[0]
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def plan(self, query):
+        """
+        Return list of (table, index, sorted) for query - index is None for table scan,
+        sorted is True when rows are ordered in temporary b-tree / filesort.
+        """
+        if isinstance(query, str):
+            statement = query.rstrip(';')
+        else:
+            statement = getattr(query, 'statement', query).compile(db.engine, compile_kwargs={'literal_binds': True})
+        if self.dialect == 'sqlite':
+            steps = []
+            for row in db.session.execute('EXPLAIN QUERY PLAN {0}'.format(statement)):
+                detail = row[-1]
+                match = SQLITE_PLAN.match(detail)
+                if match is not None:
+                    automatic, index, rowid = match.group(4), match.group(5), match.group(6)
+                    steps.append((match.group(2).lower(), None if automatic else (index or rowid), False))
+                elif 'TEMP B-TREE' in detail:
+                    steps.append((None, None, True))
+            return steps
+        steps = []
+        for row in db.session.execute('EXPLAIN {0}'.format(statement)):
+            row = dict(zip([key.lower() for key in row.keys()], row))
+            if row['table'] is None or row['table'].startswith('<'):
+                continue  # derived table or no table used
+            index = None if row['type'] == 'ALL' else row['key']
+            steps.append((row['table'].lower(), index, 'filesort' in (row['extra'] or '').lower()))
+        return steps
+
+    def assertIndexes(self, query, expected, ordered=False):
+        """
+        Assert every table of expected (table -> acceptable index names) is read using one of its indexes
+        and, with ordered=True, that rows are not sorted after reading.
+        """
+        steps = self.plan(query)
+        for table, indexes in expected.items():
+            used = [index for name, index, _ in steps if name == table]
+            self.assertTrue(used, '{0} not in plan {1}'.format(table, steps))
+            for index in used:
+                self.assertTrue(index is not None and set(index.split(',')) & set(indexes), '{0} read without index {1}: {2}'.format(table, indexes, steps))
+        if ordered:
+            self.assertFalse(any(sort for _, _, sort in steps), 'rows sorted after reading: {0}'.format(steps))
+
+    def test_status_station_product(self):
+        query = Status.query.filter_by(station_id=21).filter_by(product_id=self.product_id).order_by('id')
+        # station index alone walks the whole station history
+        self.assertIndexes(query, {'status': ['ix_status_product_id']})
+
+    def test_current_reference(self):
+        # Product primary key is a string - looked up by its index, station 11 statuses walked in id order
+        self.assertIndexes(CURRENT_REFERENCE_QUERY, {
+            'product': ['ix_product_id', 'PRIMARY', 'sqlite_autoindex_product_1'],
+            'status': ['ix_status_station_id'],
+        }, ordered=True)
+
+    def test_electronic_stamp(self):
+        product = Product.query.get(self.product_id)
+        query = product.statuses.filter(Status.station_id == 55).order_by(Status.id.desc()).limit(1)
+        self.assertIndexes(query, {'status': ['ix_status_product_id']})
+        self.assertTrue(product.electronic_stamp is not None)
+
+    def test_products_index(self):
+        # newest products first, optionally filtered by date range, status, operation and variant
+        def listing(args):
+            with self.app.test_request_context('/', query_string=args):
+                return product_page(filter_products(request.args), 1, 100)
+
+        self.assertIndexes(listing({}), {'product': ['ix_product_date_added']}, ordered=True)
+        query = listing({'start_date': '2018-01-01', 'end_date': '2018-01-02'})
+        self.assertIndexes(query, {'product': ['ix_product_date_added']}, ordered=True)
+        query = listing({'status': '2'})
+        self.assertIndexes(query, {'product': ['ix_product_date_added'], 'status': ['ix_status_product_id']}, ordered=True)
+        query = listing({'operation': '2'})
+        self.assertIndexes(query, {'product': ['ix_product_date_added'], 'operation': ['ix_operation_product_id']}, ordered=True)
+        with self.app.test_request_context('/', query_string={'variant_id': '1'}):
+            count = filter_products(request.args).with_entities(db.func.count())
+        self.assertIndexes(count, {'product': ['ix_product_variant_id']})
+        self.assertIndexes(listing({'variant_id': '1'}), {'product': ['ix_product_date_added', 'ix_product_variant_id']})
+
+    def test_dropped_index_fails(self):
+        if self.dialect != 'sqlite':
+            self.skipTest('MySQL keeps index of foreign key')
+        query = Status.query.filter_by(station_id=21).filter_by(product_id=self.product_id).order_by('id')
+        db.session.execute('DROP INDEX ix_status_product_id')
+        self.assertTrue(('status', 'ix_status_station_id', False) in self.plan(query))
+        self.assertRaises(AssertionError, self.assertIndexes, query, {'status': ['ix_status_product_id']})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import unittest
+from datetime import datetime, timedelta
+from flask import g
+from config import config, basedir
+from app import create_app, db, replica
+from app.models import Product, Status, Comment
+
+
+class ReplicaTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(basedir, 'data-test-replica.sqlite')
+        config['testing'].REPLICA_DATABASE_URI = 'sqlite:///' + self.path
+        try:
+            self.app = create_app('testing')
+        finally:
+            config['testing'].REPLICA_DATABASE_URI = None
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.metadata.create_all(replica.engine)
+        self.client = self.app.test_client()
+        # product present in both databases, replica has one more product (not in primary)
+        self.product = Product('0000000001', 1, '02', '18', 1, 0)
+        db.session.add(self.product)
+        db.session.add(Status(1, self.product.id, 11, date_time=str(datetime.now())))
+        db.session.commit()
+        self.replicate(Product.__table__)
+        self.replicate(Status.__table__)
+        self.replica_only = Product('0000000001', 2, '02', '18', 1, 0).id
+        replica.engine.execute(Product.__table__.insert().values(id=self.replica_only, type='0000000001', serial=2, week='02', year='18', variant_id=1))
+        replica.checked = 0
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.get_engine(self.app, bind='replica').dispose()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.app_context.pop()
+
+    def replicate(self, table):
+        rows = [dict(row) for row in db.engine.execute(table.select())]
+        replica.engine.execute(table.delete())
+        replica.engine.execute(table.insert(), rows)
+
+    def test_routing(self):
+        self.assertTrue(replica.available())
+        res = self.client.get('/app/')
+        self.assertTrue(self.replica_only in res.get_data(as_text=True))
+        self.assertTrue(self.client.get('/app/product/{0}'.format(self.replica_only)).status_code == 200)
+        # views without @use_replica read from primary
+        self.assertTrue(self.client.get('/api/product/{0}'.format(self.replica_only)).status_code == 404)
+        # product not replicated yet is read from primary
+        p = Product('0000000001', 3, '02', '18', 1, 0)
+        db.session.add(p)
+        db.session.commit()
+        self.assertTrue(self.client.get('/app/product/{0}'.format(p.id)).status_code == 200)
+
+    def test_writes_go_to_primary(self):
+        with self.app.test_request_context('/app/'):
+            g.db_replica = True
+            self.assertTrue(Product.query.count() == 2)
+            db.session.add(Comment(body='comment', product_id=self.product.id))
+            db.session.commit()
+            g.db_replica = False
+        self.assertTrue(Comment.query.count() == 1)
+        self.assertTrue(replica.engine.execute('SELECT count(*) FROM comments').scalar() == 0)
+
+    def test_lag(self):
+        self.assertTrue(replica.lag() == 0.0)
+        db.session.add(Status(1, self.product.id, 21, date_time=str(datetime.now() - timedelta(seconds=120))))
+        db.session.add(Status(1, self.product.id, 31, date_time=str(datetime.now())))
+        db.session.commit()
+        self.assertTrue(110 < replica.lag() < 130)
+        # lagging replica is not used
+        self.assertFalse(replica.available())
+        self.assertFalse(self.replica_only in self.client.get('/app/').get_data(as_text=True))
+        # lag is not checked again within REPLICA_LAG_CHECK_INTERVAL
+        self.replicate(Status.__table__)
+        self.assertFalse(replica.available())
+        replica.checked = 0
+        self.assertTrue(replica.available())
+        self.assertTrue(self.replica_only in self.client.get('/app/').get_data(as_text=True))
+
+    def test_replica_down(self):
+        replica.engine.execute('DROP TABLE status')
+        self.assertTrue(replica.lag() is None)
+        self.assertFalse(replica.available())
+        self.assertTrue(self.client.get('/app/').status_code == 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
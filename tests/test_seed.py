@@ -0,0 +1,57 @@
+import unittest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+from app import create_app, db
+from app.models import Product, Status, Operation, Station, Fail_Step
+from app.seed import HistoryGenerator, clear_history, STATIONS
+
+
+class SeedTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Fail_Step._ids.clear()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_deterministic(self):
+        a = HistoryGenerator(products=5, seed=7, nok_rate=0.2)
+        b = HistoryGenerator(products=5, seed=7, nok_rate=0.2)
+        c = HistoryGenerator(products=5, seed=8, nok_rate=0.2)
+        for generator in (a, b, c):
+            generator.add_references(db.engine)
+        history_a = [a.product_history(index) for index in range(5)]
+        history_b = [b.product_history(index) for index in range(5)]
+        history_c = [c.product_history(index) for index in range(5)]
+        self.assertTrue(history_a == history_b)
+        self.assertTrue(history_a != history_c)
+
+    def test_pooled_connection_keeps_synchronous(self):
+        # single connection shared by all checkouts - like pooled connection reused by requests
+        engine = create_engine('sqlite://', poolclass=StaticPool)
+        db.metadata.create_all(engine)
+        engine.execute('PRAGMA synchronous = NORMAL')
+        HistoryGenerator(products=3, chunk_size=10).run(engine)
+        self.assertTrue(engine.execute('PRAGMA synchronous').scalar() == 1)
+        self.assertTrue(engine.execute('SELECT COUNT(*) FROM product').scalar() == 3)
+
+    def test_run(self):
+        counts = HistoryGenerator(products=20, operations_min=2, operations_max=3, nok_rate=0.05, chunk_size=100).run()
+        self.assertTrue(counts['product'] == Product.query.count() == 20)
+        self.assertTrue(counts['status'] == Status.query.count())
+        self.assertTrue(counts['operation'] == Operation.query.count())
+        self.assertTrue(Station.query.count() == len(STATIONS))
+        # every status has its operations
+        self.assertTrue(2 * counts['status'] <= counts['operation'] <= 3 * counts['status'])
+        # failed statuses are interned
+        self.assertTrue(Status.query.filter(Status.status == 2, Status.fail_step_id.is_(None)).count() == 0)
+        # product processing time is computed from stations 11 and 55
+        product = Product.query.filter(Product.statuses.any(Status.station_id == 55)).first()
+        self.assertTrue(product.processing_time.total_seconds() > 0)
+        clear_history()
+        self.assertTrue(Product.query.count() == 0)
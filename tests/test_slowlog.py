@@ -0,0 +1,73 @@
+import unittest
+from sqlalchemy.exc import OperationalError
+from app import create_app, db, slowlog
+from app.models import User, Slow_Query
+
+
+class SlowQueryLogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        slowlog.clear()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        slowlog.threshold = self.app.config['SLOW_QUERY_THRESHOLD']
+        slowlog.persist = self.app.config['SLOW_QUERY_LOG_TABLE']
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self, login, is_admin):
+        u = User(login=login, is_admin=is_admin)
+        db.session.add(u)
+        db.session.commit()
+        with self.client.session_transaction() as session:
+            session['user_id'] = str(u.id)
+            session['_fresh'] = True
+
+    def test_call_site(self):
+        slowlog.threshold = 0
+        self.client.get('/app/statistics/')
+        entries = slowlog.get_entries()
+        self.assertTrue(len(entries) > 0)
+        self.assertTrue(entries[0].endpoint == 'statistics.index')
+        # count queries are issued from template
+        self.assertTrue(any(line.startswith('templates/statistics/index.html:') for line in entries[0].stack))
+
+    def test_admin_only(self):
+        self.login('john', False)
+        res = self.client.get('/app/statistics/slow_queries')
+        self.assertTrue(res.status_code == 403)
+
+    def test_stored_entries(self):
+        self.login('susan', True)
+        slowlog.threshold = 0
+        slowlog.persist = True
+        self.app.config['SLOW_QUERY_LOG_TABLE'] = True
+        self.client.get('/app/statistics/')
+        self.assertTrue(Slow_Query.query.filter_by(endpoint='statistics.index').count() > 0)
+        res = self.client.get('/app/statistics/slow_queries')
+        self.assertTrue(res.status_code == 200)
+        self.assertTrue(b'templates/statistics/index.html' in res.data)
+
+    def test_failed_statement(self):
+        with db.engine.connect() as connection:
+            self.assertRaises(OperationalError, connection.execute, 'SELECT * FROM missing_table')
+            self.assertTrue(connection.info['slow_query_start_time'] == [])
+
+    def test_pending_outside_request(self):
+        slowlog.threshold = 0
+        slowlog.persist = True
+        slowlog.entries = slowlog.entries.__class__(maxlen=3)
+        try:
+            for i in range(5):
+                db.session.query(User).count()
+            self.assertTrue(len(slowlog.local.pending) == 3)
+            slowlog.persist = False
+            slowlog.flush()
+        finally:
+            slowlog.entries = slowlog.entries.__class__(maxlen=self.app.config['SLOW_QUERY_LOG_SIZE'])
+        self.assertTrue(Slow_Query.query.count() == 3)
@@ -0,0 +1,133 @@
+import os
+import gzip
+import json
+import shutil
+import unittest
+from sqlalchemy.exc import OperationalError
+from config import config
+from app import create_app, db, snapshots
+from app.models import User, Product, Status, Operation, Comment
+from app.snapshot import snapshot_info
+
+
+class SnapshotTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        self.admin = User(login='john', password='cat', is_admin=True)
+        self.operator = User(login='susan', password='cat')
+        db.session.add_all([self.admin, self.operator])
+        for serial in range(1, 4):
+            self.add_product(serial)
+        db.session.commit()
+
+    def tearDown(self):
+        snapshots.dispose()
+        shutil.rmtree(self.app.config['SNAPSHOT_DIRECTORY'], ignore_errors=True)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_product(self, serial):
+        p = Product('0000000001', serial, '02', '18', 1, 0)
+        db.session.add(p)
+        for station_id in (11, 21):
+            db.session.add(Status(1, p.id, station_id, date_time=u'2018-01-10 10:00:00'))
+            db.session.add(Operation(p.id, station_id, 1, 1, u'2018-01-10 10:00:00'))
+        db.session.add(Comment(body='comment', product_id=p.id))
+        return p
+
+    def request(self, method, url, user, data=None):
+        data = dict(data or {}, token=user.get_api_token())
+        return self.client.open(url, method=method, data=json.dumps(data), content_type='application/json')
+
+    def test_take(self):
+        snapshots.chunk_size = 4
+        try:
+            info = snapshots.take()
+        finally:
+            snapshots.chunk_size = self.app.config['SNAPSHOT_CHUNK_SIZE']
+        self.assertTrue(info['base'] is None and info['rows']['status'] == 6 and info['rows']['operation'] == 6 and info['rows']['product'] == 3)
+        self.assertTrue(snapshots.names() == [info['name']])
+        path = snapshots.path(info['name'])
+        self.assertTrue(os.path.getsize(path) == info['size'])
+        self.assertTrue(gzip.open(path).read(16) == 'SQLite format 3\x00')
+        session = snapshots.session(info['name'])
+        self.assertTrue([session.query(model).count() for model in (Product, Status, Operation, Comment, User)] == [3, 6, 6, 3, 2])
+        # users are copied without credentials
+        self.assertTrue(all(u.password_hash is None for u in session.query(User).all()))
+        marks = dict((row.table_name, row.high_water) for row in session.execute(snapshot_info.select()))
+        self.assertTrue(marks['status'] == Status.query.order_by(Status.id.desc()).first().id and marks['product'] is None)
+        session.close()
+        self.assertRaises(ValueError, snapshots.path, '../data-test.sqlite')
+
+    def test_incremental(self):
+        snapshots.overlap = 1
+        try:
+            first = snapshots.take()
+            self.add_product(4)
+            Comment.query.first().body = 'edited'
+            db.session.commit()
+            # rows deleted after previous snapshot stay in append-only tables of incremental snapshot
+            Status.query.filter(Status.id == 1).delete()
+            db.session.commit()
+            second = snapshots.take(incremental=True)
+            # rows past high-water mark and last overlapping row, other tables whole
+            self.assertTrue(second['base'] == first['name'] and second['rows']['status'] == 3 and second['rows']['product'] == 4)
+            session = snapshots.session(second['name'])
+            self.assertTrue([session.query(model).count() for model in (Product, Status, Operation, Comment)] == [4, 8, 8, 4])
+            self.assertTrue(session.query(Comment).order_by(Comment.id).first().body == 'edited')
+            session.close()
+            third = snapshots.take(incremental=True)
+            self.assertTrue(third['base'] == second['name'] and third['rows']['status'] == 1)
+            session = snapshots.session(third['name'])
+            self.assertTrue(session.query(Status).count() == 8)
+            session.close()
+        finally:
+            snapshots.overlap = self.app.config['SNAPSHOT_OVERLAP']
+
+    def test_read_only(self):
+        info = snapshots.take()
+        engine = snapshots.mount(info['name'])
+        self.assertTrue(engine.execute('SELECT count(*) FROM status').scalar() == 6)
+        self.assertRaises(OperationalError, engine.execute, 'DELETE FROM status')
+
+    def test_mount_application(self):
+        info = snapshots.take()
+        config['testing'].SNAPSHOT_MOUNT = info['name']
+        try:
+            app = create_app('testing')
+        finally:
+            config['testing'].SNAPSHOT_MOUNT = None
+        self.assertTrue(app.config['SQLALCHEMY_DATABASE_URI'].endswith(os.path.join('mounted', info['name'][:-len('.gz')])))
+        db.session.remove()  # scoped session is shared by both applications
+        with app.app_context():
+            self.assertTrue(db.session.get_bind().url.database.endswith(info['name'][:-len('.gz')]))
+            self.assertTrue(Product.query.count() == 3)
+            db.session.add(Comment(body='comment', product_id=Product.query.first().id))
+            self.assertRaises(OperationalError, db.session.commit)
+            db.session.rollback()
+            db.session.remove()
+            db.get_engine(app).dispose()
+        snapshots.init_app(self.app)
+
+    def test_webapi(self):
+        self.assertTrue(self.request('POST', '/webapi/1.0/snapshots', self.operator).status_code == 403)
+        self.assertTrue(self.request('GET', '/webapi/1.0/snapshots', self.operator).status_code == 403)
+        self.assertTrue(self.request('POST', '/webapi/1.0/snapshots', self.admin, {'incremental': 'yes'}).status_code == 400)
+        res = self.request('POST', '/webapi/1.0/snapshots', self.admin, {'incremental': True})
+        self.assertTrue(res.status_code == 201)
+        name = json.loads(res.get_data(as_text=True))['name']
+        res = self.request('GET', '/webapi/1.0/snapshots', self.admin)
+        self.assertTrue(json.loads(res.get_data(as_text=True))['snapshots'] == [name])
+        res = self.request('GET', '/webapi/1.0/snapshots/' + name, self.admin)
+        self.assertTrue(res.status_code == 200 and res.get_data()[:2] == '\x1f\x8b')
+        res.close()
+        self.assertTrue(self.request('GET', '/webapi/1.0/snapshots/missing.sqlite.gz', self.admin).status_code == 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
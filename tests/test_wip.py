@@ -0,0 +1,118 @@
+import json
+import unittest
+from app import create_app, db, wip_tracker, ingest
+from app.models import Product, Status, Wip
+from app.querybudget import QueryCounter
+
+
+class WipTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        self.product_ids = []
+        for serial in range(1, 4):
+            p = Product('0000000001', serial, '02', '18', 1, 0)
+            db.session.add(p)
+            self.product_ids.append(p.id)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def post_status(self, product_id, station_id, date_time):
+        res = self.client.post('/api/status', data=json.dumps({
+            'status': 1, 'station_id': station_id, 'product_id': product_id, 'date_time': date_time}),
+            content_type='application/json')
+        self.assertTrue(res.status_code == 201)
+
+    def wip(self):
+        return dict((w.product_id, w.started) for w in Wip.query.all())
+
+    def test_ingest(self):
+        first, second, third = self.product_ids
+        self.post_status(first, 11, u'2018-01-10 10:00:00')
+        self.post_status(first, 11, u'2018-01-10 10:01:00')  # repeated test does not restart
+        self.post_status(first, 21, u'2018-01-10 10:02:00')
+        self.post_status(second, 11, u'2018-01-10 10:03:00')
+        self.post_status(third, 21, u'2018-01-10 10:04:00')  # not started at first station
+        self.assertTrue(self.wip() == {first: u'2018-01-10 10:00:00', second: u'2018-01-10 10:03:00'})
+        self.post_status(first, 55, u'2018-01-10 10:05:00')
+        self.post_status(first, 11, u'2018-01-10 10:06:00')  # already stamped
+        self.assertTrue(list(self.wip()) == [second])
+
+    def test_unknown_product(self):
+        # tracked at ingest the same way as by rebuild - WIP lists known products only
+        unknown = Product.calculate_product_id('0000000001', 9, '02', '18')
+        self.post_status(unknown, 11, u'2018-01-10 10:00:00')
+        self.post_status(self.product_ids[0], 11, u'2018-01-10 10:01:00')
+        self.assertTrue(list(self.wip()) == [self.product_ids[0]])
+        self.assertTrue(wip_tracker.rebuild() == 1)
+        self.assertTrue(list(self.wip()) == [self.product_ids[0]])
+
+    def test_start_is_single_statement(self):
+        status = Status(1, self.product_ids[0], 11, date_time=u'2018-01-10 10:00:00')
+        db.session.add(status)
+        db.session.flush()
+        with QueryCounter() as counter:
+            wip_tracker.start(db.session.connection(), status)
+            wip_tracker.start(db.session.connection(), status)  # already in WIP - no error
+        db.session.commit()
+        self.assertTrue(counter.statements == [s for s in counter.statements if s.startswith('INSERT')])
+        self.assertTrue(self.wip() == {self.product_ids[0]: u'2018-01-10 10:00:00'})
+
+    def test_ingest_queue(self):
+        first, second, third = self.product_ids
+        self.app.config['INGEST_QUEUE'] = True
+        ingest.init_app(self.app)
+        try:
+            self.post_status(first, 11, u'2018-01-10 10:00:00')
+            self.post_status(second, 11, u'2018-01-10 10:01:00')
+            self.post_status(second, 55, u'2018-01-10 10:02:00')
+        finally:
+            ingest.stop()
+            self.app.config['INGEST_QUEUE'] = False
+            ingest.init_app(self.app)
+        self.assertTrue(Status.query.count() == 3)
+        self.assertTrue(self.wip() == {first: u'2018-01-10 10:00:00'})
+
+    def test_rebuild(self):
+        first, second, third = self.product_ids
+        statuses = Status.__table__
+        db.session.execute(statuses.insert(), [
+            {'status': 1, 'product_id': first, 'station_id': 11, 'date_time': u'2018-01-10 10:00:00'},
+            {'status': 1, 'product_id': first, 'station_id': 11, 'date_time': u'2018-01-10 10:01:00'},
+            {'status': 1, 'product_id': second, 'station_id': 11, 'date_time': u'2018-01-10 10:02:00'},
+            {'status': 1, 'product_id': second, 'station_id': 55, 'date_time': u'2018-01-10 10:03:00'},
+            {'status': 1, 'product_id': third, 'station_id': 21, 'date_time': u'2018-01-10 10:04:00'},
+        ])
+        db.session.commit()
+        self.assertTrue(self.wip() == {})
+        self.assertTrue(wip_tracker.rebuild() == 1)
+        self.assertTrue(self.wip() == {first: u'2018-01-10 10:00:00'})
+
+    def test_product_delete(self):
+        self.post_status(self.product_ids[0], 11, u'2018-01-10 10:00:00')
+        self.assertTrue(self.client.delete('/api/product/{0}'.format(self.product_ids[0])).status_code == 200)
+        self.assertTrue(self.wip() == {})
+
+    def test_api_and_page(self):
+        for i, product_id in enumerate(self.product_ids):
+            self.post_status(product_id, 11, u'2018-01-10 10:0{0}:00'.format(3 - i))
+        self.post_status(self.product_ids[0], 21, u'2018-01-10 10:05:00')
+        data = json.loads(self.client.get('/api/wip?limit=2').data.decode('utf-8'))
+        self.assertTrue(data['total'] == 3)
+        self.assertTrue([w['product_id'] for w in data['json_list']] == self.product_ids[:0:-1])
+        self.assertTrue(data['json_list'][0]['wip_seconds'] > 0)
+        self.assertTrue(self.client.get('/api/wip?limit=0').status_code == 400)
+
+        db.session.remove()
+        with QueryCounter() as counter:
+            res = self.client.get('/app/wip')
+        self.assertTrue(res.status_code == 200)
+        self.assertTrue(counter.count == 3)
+        self.assertTrue('href="/app/stations/21"' in res.data.decode('utf-8'))